@@ -0,0 +1,196 @@
+"""
+Set-based deletion of accounts and preferences.
+
+Removing a user or a preference touches every table that refers to it. The
+functions here do it with one statement per table, however many rows are
+involved, in an order that keeps foreign keys satisfied at every step:
+
+    delete_preferences(ids)   the preferences' requests (committed ones are
+                              archived, so both parties keep the swap in
+                              their history), then the preferences
+    delete_accounts(ids)      the users' requests (committed ones are
+                              archived, and archived swaps keep the other
+                              party's side), references from other users'
+                              preferences, the users' preferences, inbox
+                              summaries and feed entries, then the users
+
+The other party of each removed request gets the usual counter update and a
+feed entry (see inbox.py), or a bulk recount when purging, and the caches
+and room index are told. Nothing is committed here, so a view can delete
+and commit in one transaction.
+
+Whole cohorts are purged in batches, each its own transaction:
+
+    python accounts.py purge --college-id-prefix SB21 --dry-run
+    python accounts.py purge --college-id-prefix SB21
+"""
+
+from sqlalchemy import and_, delete, or_, select, update
+
+import archive
+from directory import prefix_range
+from inbox import rebuild, record_transitions
+from models import db, User, RoomPreference, SwapRequest, SwapRequestArchive, InboxSummary, SwapRequestChange
+from render_cache import mark_stale
+from room_index import mark_removed
+from user_cache import mark_changed
+
+PURGE_BATCH_SIZE = 1000
+
+# swap_request_archive.requester_id is NOT NULL, so a deleted requester becomes this id, which no user has
+DELETED_USER_ID = 0
+
+
+def _record_removed(requests, skip=(), keep_committed=False):
+    """Counter updates and feed entries for (owner_id, requester_id, request_id, status) rows going away."""
+    by_status = {}
+    for owner_id, requester_id, req_id, status in requests:
+        by_status.setdefault(status, []).append((owner_id, requester_id, req_id))
+    for status, rows in by_status.items():
+        # Archived swaps still count; they only leave the lists
+        new_status = status if keep_committed and status == 'committed' else None
+        record_transitions(rows, status, new_status, skip=skip)
+
+
+def delete_preferences(pref_ids):
+    """Delete preferences and their requests; returns the number of requests removed."""
+    pref_ids = list(pref_ids)
+    if not pref_ids:
+        return 0
+    requests = db.session.execute(
+        select(RoomPreference.user_id, SwapRequest.requester_id, SwapRequest.id, SwapRequest.status)
+        .join(RoomPreference, SwapRequest.preference_id == RoomPreference.id)
+        .where(SwapRequest.preference_id.in_(pref_ids))
+    ).all()
+    _record_removed(requests, keep_committed=True)
+    committed = [row.id for row in requests if row.status == 'committed']
+    if committed:
+        archive.move(committed)
+    db.session.execute(delete(SwapRequest).where(SwapRequest.preference_id.in_(pref_ids)))
+    owners = db.session.scalars(select(RoomPreference.user_id).where(RoomPreference.id.in_(pref_ids)).distinct())
+    mark_stale(db.session, owners, profiles=True, directory=True)
+    db.session.execute(delete(RoomPreference).where(RoomPreference.id.in_(pref_ids)))
+    mark_removed(db.session, pref_ids)
+    return len(requests)
+
+
+def delete_accounts(user_ids, notify=True):
+    """
+    Delete users and everything that refers to them; returns {table: rows deleted}.
+
+    Committed swaps are archived rather than deleted, and archived swaps whose
+    other party remains keep their row with the deleted user's side cleared, so
+    that party's history and committed_swaps count stay as they were.
+
+    With notify=False the other parties' inbox summaries are recounted in bulk
+    afterwards instead of logging each removed request to their feeds, which
+    costs a statement per user; their open pages catch up on the next reload.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    owned = select(RoomPreference.id).where(RoomPreference.user_id.in_(user_ids))
+    involved = or_(SwapRequest.requester_id.in_(user_ids), SwapRequest.preference_id.in_(owned))
+    requests = db.session.execute(
+        select(RoomPreference.user_id, SwapRequest.requester_id, SwapRequest.id, SwapRequest.status)
+        .join(RoomPreference, SwapRequest.preference_id == RoomPreference.id).where(involved)
+    ).all()
+    # Their own summaries and feeds are about to go
+    skip = set(user_ids)
+    if notify:
+        _record_removed(requests, skip=skip, keep_committed=True)
+    pref_ids = db.session.scalars(owned).all()
+
+    committed = [row.id for row in requests if row.status == 'committed']
+    if committed:
+        archive.move(committed)
+    deleted = {'swap_requests': db.session.execute(
+        delete(SwapRequest).where(involved).execution_options(synchronize_session=False)
+    ).rowcount}
+    # Archived swaps stay for whoever is left, with this side cleared; swap_request_archive has no foreign keys
+    archived = SwapRequestArchive
+    owner_gone = or_(archived.owner_id.in_(user_ids), archived.owner_id.is_(None))
+    requester_gone = or_(archived.requester_id.in_(user_ids), archived.requester_id == DELETED_USER_ID)
+    deleted['swap_request_archive'] = db.session.execute(
+        delete(archived).where(
+            or_(archived.owner_id.in_(user_ids), archived.requester_id.in_(user_ids)),
+            # Nobody left on the other side, rotation moves included, or nothing for a history
+            or_(archived.status != 'committed', and_(owner_gone, requester_gone)),
+        ).execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.execute(
+        update(archived).where(archived.owner_id.in_(user_ids))
+        .values(owner_id=None).execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        update(archived).where(archived.requester_id.in_(user_ids))
+        .values(requester_id=DELETED_USER_ID).execution_options(synchronize_session=False)
+    )
+    # Preferences of other users these accepted stay, without the reference
+    db.session.execute(
+        update(RoomPreference).where(RoomPreference.accepted_by_id.in_(user_ids))
+        .values(accepted_by_id=None).execution_options(synchronize_session=False)
+    )
+    for model, where in (
+        (RoomPreference, RoomPreference.user_id.in_(user_ids)),
+        (InboxSummary, InboxSummary.user_id.in_(user_ids)),
+        (SwapRequestChange, SwapRequestChange.user_id.in_(user_ids)),
+        (User, User.id.in_(user_ids)),
+    ):
+        deleted[model.__tablename__] = db.session.execute(
+            delete(model).where(where).execution_options(synchronize_session=False)
+        ).rowcount
+    if not notify:
+        parties = {user_id for row in requests for user_id in row[:2]}
+        rebuild(parties - skip, commit=False)
+    mark_removed(db.session, pref_ids)
+    mark_changed(db.session, user_ids)
+    return deleted
+
+
+def purge(college_id_prefix, batch_size=PURGE_BATCH_SIZE, dry_run=False):
+    """
+    Delete every account whose college_id starts with the prefix, a batch per
+    transaction; returns {table: rows deleted}. A dry run rolls everything back.
+    """
+    matching = select(User.id).where(prefix_range(User.college_id, college_id_prefix)).order_by(User.id)
+    totals = {}
+    while True:
+        user_ids = db.session.scalars(matching.limit(batch_size)).all()
+        if not user_ids:
+            break
+        for table, count in delete_accounts(user_ids, notify=False).items():
+            totals[table] = totals.get(table, 0) + count
+        # A dry run keeps going in one transaction, so each row is counted once
+        if not dry_run:
+            db.session.commit()
+    db.session.rollback()
+    return totals
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    from factory import create_app
+    from validation import normalize_college_id
+
+    parser = argparse.ArgumentParser(description='Delete accounts in bulk.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    purge_parser = commands.add_parser('purge', help='delete every account with a college id prefix')
+    purge_parser.add_argument('--college-id-prefix', required=True)
+    purge_parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE)
+    purge_parser.add_argument('--dry-run', action='store_true', help='count what would go and roll back')
+    args = parser.parse_args()
+
+    prefix = normalize_college_id(args.college_id_prefix)
+    if not prefix:
+        parser.error('--college-id-prefix must not be empty')
+
+    app = create_app(web=False)
+    with app.app_context():
+        started = time.perf_counter()
+        totals = purge(prefix, args.batch_size, args.dry_run)
+        summary = ', '.join(f'{count} {table}' for table, count in totals.items()) or 'nothing'
+        verb = 'Would delete' if args.dry_run else 'Deleted'
+        print(f"{verb} {summary} in {time.perf_counter() - started:.1f}s")
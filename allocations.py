@@ -0,0 +1,452 @@
+"""
+Bulk import and export of students and room allocations.
+
+Import reads CSV (with a header row) or JSON Lines, validates each row with
+the same college_id/room_number rules as /register, and writes it in batches:
+one SELECT per batch to find existing students, then one multi-row INSERT
+for new ones and one bulk UPDATE for the rest. Rows are keyed on college_id;
+blank or missing fields leave the stored value alone, so a file with only
+college_id,room_number reassigns rooms. Only one batch is held in memory.
+
+    python allocations.py import students.csv
+    python allocations.py import rooms.jsonl --dry-run --errors rejected.txt
+
+Passwords in the file are hashed on import; students imported without one
+cannot log in until they use "Forgot password" to set their own. Pending
+swap requests of anyone whose room changed are superseded, exactly as after
+a committed swap.
+
+Rooms are imported the same way, keyed on number, from a file with any of
+number,block,floor,capacity,attributes (attributes a JSON object). Until a
+room's capacity is known, it never has free places to move into (see rooms.py):
+
+    python allocations.py import-rooms rooms.csv
+
+Export streams a table in id order (passwords are never exported):
+
+    python allocations.py export users -o users.csv
+    python allocations.py export preferences -o preferences.jsonl
+    python allocations.py export swaps > committed_swaps.csv
+    python allocations.py export rooms > rooms.csv       # with occupants
+"""
+
+import csv
+import json
+import sys
+
+from flask import current_app
+from sqlalchemy import insert, select, union_all, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+
+from credentials import unusable_password
+from models import db, Room, User, RoomPreference, SwapRequest, SwapRequestArchive
+from rooms import occupants, room_ids
+from swaps import supersede_pending
+from user_cache import mark_changed
+from validation import college_id_error, floor_of, normalize_college_id, room_number_error
+
+BATCH_SIZE = 1000
+
+IMPORT_FIELDS = ('college_id', 'name', 'email', 'room_number', 'password')
+ROOM_FIELDS = ('number', 'block', 'floor', 'capacity', 'attributes')
+REQUIRED_FOR_NEW = ('name', 'email', 'room_number')
+MAX_LENGTHS = {
+    'name': User.name.type.length,
+    'email': User.email.type.length,
+}
+
+
+def _format_for(path, default='csv'):
+    if path and path.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    return default
+
+
+# ---------------------------------------------------------------------------
+# Import
+# ---------------------------------------------------------------------------
+
+class ImportReport:
+    def __init__(self, errors=sys.stderr):
+        self.errors = errors
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.superseded = 0
+
+    def error(self, line, college_id, message):
+        self.failed += 1
+        print(f"line {line}: {college_id or '-'}: {message}", file=self.errors)
+
+    def summary(self):
+        return (f"{self.inserted} inserted, {self.updated} updated, {self.unchanged} unchanged, "
+                f"{self.failed} rejected, {self.superseded} pending requests superseded")
+
+
+def read_rows(stream, fmt, key='college_id'):
+    """Yield (line_number, row_dict_or_None, parse_error) without reading ahead."""
+    if fmt == 'jsonl':
+        for line, text in enumerate(stream, 1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError as e:
+                yield line, None, f'invalid JSON: {e}'
+                continue
+            if not isinstance(row, dict):
+                yield line, None, 'expected a JSON object'
+                continue
+            yield line, row, None
+    else:
+        reader = csv.DictReader(stream)
+        missing = key not in (reader.fieldnames or ())
+        for row in reader:
+            if missing:
+                yield reader.line_num, None, f'CSV header has no {key} column'
+                return
+            yield reader.line_num, row, None
+
+
+def clean_row(row):
+    """Normalized, validated fields present in row; returns (values, error)."""
+    values = {}
+    for field in IMPORT_FIELDS:
+        value = row.get(field)
+        if value is None:
+            continue
+        value = str(value) if field == 'password' else str(value).strip()
+        if value:
+            values[field] = value
+    college_id = values['college_id'] = normalize_college_id(values.get('college_id'))
+    error = college_id_error(college_id)
+    if error is None and 'room_number' in values:
+        error = room_number_error(values['room_number'])
+    if error is None:
+        for field, limit in MAX_LENGTHS.items():
+            if len(values.get(field, '')) > limit:
+                error = f'{field} is longer than {limit} characters'
+                break
+    return values, error
+
+
+class Importer:
+    def __init__(self, report, dry_run=False, batch_size=BATCH_SIZE):
+        self.report = report
+        self.dry_run = dry_run
+        self.batch_size = batch_size
+
+    def run(self, rows):
+        batch = []
+        for line, row, error in rows:
+            if error:
+                self.report.error(line, None, error)
+                continue
+            values, error = clean_row(row)
+            if error:
+                self.report.error(line, values.get('college_id'), error)
+                continue
+            batch.append((line, values))
+            if len(batch) >= self.batch_size:
+                self._apply(batch)
+                batch = []
+        if batch:
+            self._apply(batch)
+        return self.report
+
+    def _owners(self, column, values):
+        if not values:
+            return {}
+        return dict(db.session.execute(select(column, User.college_id).where(column.in_(values))).all())
+
+    def _apply(self, batch):
+        report = self.report
+        existing = {row.college_id: row for row in db.session.execute(
+            select(User.id, User.college_id, User.name, User.email, User.room_number)
+            .where(User.college_id.in_({values['college_id'] for _, values in batch}))
+        )}
+        # Unique columns other than the key; a value may only move within the same student
+        owners = {
+            'name': self._owners(User.name, {v['name'] for _, v in batch if 'name' in v}),
+            'email': self._owners(User.email, {v['email'] for _, v in batch if 'email' in v}),
+        }
+
+        seen = {}
+        inserts, updates, moved, plaintext = [], [], [], []
+        for line, values in batch:
+            college_id = values['college_id']
+            if college_id in seen:
+                report.error(line, college_id, f'duplicate of line {seen[college_id]}')
+                continue
+            conflict = next((field for field in owners
+                             if owners[field].get(values.get(field), college_id) != college_id), None)
+            if conflict:
+                report.error(line, college_id, f'{conflict} already belongs to {owners[conflict][values[conflict]]}')
+                continue
+
+            current = existing.get(college_id)
+            if current is None:
+                missing = [field for field in REQUIRED_FOR_NEW if field not in values]
+                if missing:
+                    report.error(line, college_id, f'new student needs {", ".join(missing)}')
+                    continue
+                if 'password' in values:
+                    plaintext.append(values)
+                else:
+                    values['password'] = unusable_password()
+                inserts.append((line, values))
+            else:
+                changes = {field: value for field, value in values.items()
+                           if field != 'college_id' and (field == 'password' or getattr(current, field) != value)}
+                if not changes:
+                    report.unchanged += 1
+                    seen[college_id] = line
+                    continue
+                if 'room_number' in changes:
+                    moved.append((line, current.id))
+                changes['id'] = current.id
+                if 'password' in changes:
+                    plaintext.append(changes)
+                updates.append((line, changes))
+            seen[college_id] = line
+            for field in owners:
+                if field in values:
+                    owners[field][values[field]] = college_id
+
+        # Bulk statements skip rooms.link_rooms(), so the room ids are set here
+        ids = room_ids(db.session, {values['room_number'] for _, values in inserts + updates
+                                    if 'room_number' in values})
+        for _, values in inserts + updates:
+            if 'room_number' in values:
+                values['room_id'] = ids[values['room_number']]
+
+        if plaintext and not self.dry_run:
+            hashes = current_app.extensions['password_hasher'].hash_many([v['password'] for v in plaintext])
+            for values, hashed in zip(plaintext, hashes):
+                values['password'] = hashed
+
+        rejected = self._write(inserts, updates)
+        moved = [user_id for line, user_id in moved if line not in rejected]
+        if moved:
+            report.superseded += supersede_pending(moved)
+        mark_changed(db.session, [changes['id'] for line, changes in updates if line not in rejected])
+        if self.dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+
+    def _write(self, inserts, updates):
+        """Insert and update the batch; returns the lines the database rejected."""
+        try:
+            with db.session.begin_nested():
+                if inserts:
+                    db.session.execute(insert(User), [values for _, values in inserts])
+                if updates:
+                    db.session.execute(update(User), [changes for _, changes in updates])
+        except IntegrityError:
+            pass
+        else:
+            self.report.inserted += len(inserts)
+            self.report.updated += len(updates)
+            return set()
+
+        # Someone registered one of these keys since the batch was checked; find the rows
+        rejected = set()
+        for statement, rows, counter in ((insert(User), inserts, 'inserted'), (update(User), updates, 'updated')):
+            for line, values in rows:
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(statement, [values])
+                except IntegrityError as e:
+                    rejected.add(line)
+                    self.report.error(line, values.get('college_id'), f'rejected by database: {e.orig}')
+                else:
+                    setattr(self.report, counter, getattr(self.report, counter) + 1)
+        return rejected
+
+
+def import_file(path, fmt=None, dry_run=False, errors=sys.stderr, batch_size=BATCH_SIZE):
+    fmt = fmt or _format_for(path)
+    report = ImportReport(errors)
+    with (open(path, newline='', encoding='utf-8-sig') if path != '-' else sys.stdin) as stream:
+        Importer(report, dry_run, batch_size).run(read_rows(stream, fmt))
+    return report
+
+
+def clean_room(row):
+    """Normalized, validated fields present in a rooms file row; returns (values, error)."""
+    values = {}
+    for field in ROOM_FIELDS:
+        value = row.get(field)
+        if isinstance(value, str):
+            value = value.strip()
+        if value is not None and value != '':
+            values[field] = value
+    number = values['number'] = str(values.get('number', ''))
+    error = room_number_error(number)
+    try:
+        for field in ('floor', 'capacity'):
+            if field in values:
+                values[field] = int(values[field])
+                if values[field] < 0:
+                    raise ValueError(f'{field} must not be negative')
+        if isinstance(values.get('attributes'), str):
+            values['attributes'] = json.loads(values['attributes'])
+        if not isinstance(values.get('attributes', {}), dict):
+            raise ValueError('attributes must be a JSON object')
+    except ValueError as e:
+        error = error or str(e)
+    if error is None and len(str(values.get('block', ''))) > Room.block.type.length:
+        error = f'block is longer than {Room.block.type.length} characters'
+    return values, error
+
+
+def import_rooms(path, fmt=None, dry_run=False, errors=sys.stderr):
+    """Insert or update rooms keyed on number; a rooms file is small, so it is read whole."""
+    fmt = fmt or _format_for(path)
+    report = ImportReport(errors)
+    rooms = {}
+    with (open(path, newline='', encoding='utf-8-sig') if path != '-' else sys.stdin) as stream:
+        for line, row, error in read_rows(stream, fmt, key='number'):
+            values, error = (None, error) if error else clean_room(row)
+            if error:
+                report.error(line, (row or {}).get('number'), error)
+                continue
+            rooms[values['number']] = values
+    existing = dict(db.session.execute(select(Room.number, Room.id).where(Room.number.in_(rooms))).all())
+    inserts = [{'floor': floor_of(number), **values} for number, values in rooms.items() if number not in existing]
+    updates = [{**values, 'id': existing[number]} for number, values in rooms.items() if number in existing]
+    if inserts:
+        db.session.execute(insert(Room), inserts)
+    if updates:
+        db.session.execute(update(Room), updates)
+    report.inserted, report.updated = len(inserts), len(updates)
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+    return report
+
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+
+def export_query(table):
+    """(column names, SELECT) for one exportable table."""
+    if table == 'users':
+        columns = (User.id, User.college_id, User.name, User.email, User.room_number, User.is_looking_to_swap)
+        return [c.key for c in columns], select(*columns).order_by(User.id)
+
+    if table == 'preferences':
+        owner, accepted = aliased(User), aliased(User)
+        query = select(
+            RoomPreference.id, owner.college_id.label('college_id'), RoomPreference.available,
+            RoomPreference.needed, RoomPreference.selected,
+            accepted.college_id.label('accepted_by_college_id'), RoomPreference.created_at,
+        ).join(owner, RoomPreference.user_id == owner.id) \
+            .outerjoin(accepted, RoomPreference.accepted_by_id == accepted.id) \
+            .order_by(RoomPreference.id)
+        return list(query.selected_columns.keys()), query
+
+    if table == 'swaps':
+        owner, requester = aliased(User), aliased(User)
+        current = select(
+            SwapRequest.id.label('id'), requester.college_id.label('requester_college_id'),
+            owner.college_id.label('owner_college_id'), SwapRequest.from_room_number,
+            SwapRequest.to_room_number, SwapRequest.preference_id,
+        ).join(RoomPreference, SwapRequest.preference_id == RoomPreference.id) \
+            .join(owner, RoomPreference.user_id == owner.id) \
+            .join(requester, SwapRequest.requester_id == requester.id) \
+            .where(SwapRequest.status == 'committed')
+        # Swaps archive.py has moved out keep their ids, so one ordering covers both
+        archived = select(
+            SwapRequestArchive.id.label('id'), requester.college_id, owner.college_id, SwapRequestArchive.from_room_number,
+            SwapRequestArchive.to_room_number, SwapRequestArchive.preference_id,
+        ).join(owner, SwapRequestArchive.owner_id == owner.id) \
+            .join(requester, SwapRequestArchive.requester_id == requester.id) \
+            .where(SwapRequestArchive.status == 'committed')
+        query = union_all(current, archived).order_by('id')
+        return list(query.selected_columns.keys()), query
+
+    if table == 'rooms':
+        query = select(Room.id, Room.number, Room.block, Room.floor, Room.capacity,
+                       occupants().label('occupants'), Room.attributes).order_by(Room.id)
+        return list(query.selected_columns.keys()), query
+
+    raise ValueError(f'unknown table {table!r}')
+
+
+def export_table(table, stream, fmt='csv', batch_size=BATCH_SIZE):
+    """Write every row of table to stream; returns the number of rows."""
+    names, query = export_query(table)
+    result = db.session.execute(query.execution_options(yield_per=batch_size))
+    count = 0
+    if fmt == 'jsonl':
+        for row in result:
+            stream.write(json.dumps(dict(zip(names, row)), default=str) + '\n')
+            count += 1
+    else:
+        writer = csv.writer(stream)
+        writer.writerow(names)
+        for row in result:
+            # Room attributes are the only structured column
+            writer.writerow([json.dumps(value) if isinstance(value, dict) else value for value in row])
+            count += 1
+    return count
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from factory import create_app
+
+    parser = argparse.ArgumentParser(description='Bulk import and export of students and rooms.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = commands.add_parser('import', help='load students from CSV or JSON Lines')
+    import_parser.add_argument('path', help="file to read, or - for stdin")
+    import_parser.add_argument('--format', choices=('csv', 'jsonl'))
+    import_parser.add_argument('--dry-run', action='store_true', help='validate and roll back')
+    import_parser.add_argument('--errors', help='write rejected rows here instead of stderr')
+    import_parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    rooms_parser = commands.add_parser('import-rooms', help='load room details from CSV or JSON Lines')
+    rooms_parser.add_argument('path', help="file to read, or - for stdin")
+    rooms_parser.add_argument('--format', choices=('csv', 'jsonl'))
+    rooms_parser.add_argument('--dry-run', action='store_true', help='validate and roll back')
+
+    export_parser = commands.add_parser('export', help='stream a table as CSV or JSON Lines')
+    export_parser.add_argument('table', choices=('users', 'preferences', 'swaps', 'rooms'))
+    export_parser.add_argument('-o', '--output', help='file to write (default stdout)')
+    export_parser.add_argument('--format', choices=('csv', 'jsonl'))
+    export_parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    app = create_app(web=False)
+    with app.app_context():
+        if args.command == 'import':
+            errors = open(args.errors, 'w') if args.errors else sys.stderr
+            try:
+                report = import_file(args.path, args.format, args.dry_run, errors, args.batch_size)
+            finally:
+                if args.errors:
+                    errors.close()
+            print(("Dry run: " if args.dry_run else "") + report.summary())
+            sys.exit(1 if report.failed else 0)
+        elif args.command == 'import-rooms':
+            report = import_rooms(args.path, args.format, args.dry_run)
+            print(("Dry run: " if args.dry_run else "")
+                  + f"{report.inserted} rooms inserted, {report.updated} updated, {report.failed} rejected")
+            sys.exit(1 if report.failed else 0)
+        else:
+            fmt = args.format or _format_for(args.output)
+            stream = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+            try:
+                count = export_table(args.table, stream, fmt, args.batch_size)
+            finally:
+                if args.output:
+                    stream.close()
+            print(f"Exported {count} {args.table}", file=sys.stderr)
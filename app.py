@@ -1,56 +1,61 @@
-from flask import Flask, render_template, redirect, request, url_for, flash
-from flask_login import LoginManager, login_user, login_required, logout_user, current_user
-from flask_socketio import SocketIO, emit, join_room
-from sqlalchemy.orm import joinedload
-from flask_mail import Mail, Message
+from flask import render_template, redirect, request, url_for, flash, jsonify, abort
+from flask_login import login_user, login_required, logout_user, current_user
+from flask_socketio import emit, join_room
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
 from itsdangerous import URLSafeTimedSerializer
-import re
 import os
 
-from config import Config
+from factory import create_app
 from models import db, User, RoomPreference, SwapRequest  # type: ignore
+from directory import PAGE_SIZE, keyset_page, search_users
+from matching import match_user
+from notifications import floor_room, notify_floor, notify_user, timestamp, user_room
+from mail_queue import enqueue_mail
+from db_engine import async_reads, read_replica
+from metrics import _authorized as metrics_authorized
+from throttle import coalesce, rate_limit
+from render_cache import render_cached
+from inbox import get_summary, record_transition
+from feed import changes_since
+from archive import history_page
+from accounts import delete_accounts, delete_preferences
+from validation import NEED_ERROR, WILDCARD_ROOM, college_id_error, normalize_college_id, parse_need, room_number_error
+import rooms
+import swaps
+
+app = create_app()
+socketio = app.extensions['socketio']
+login_manager = app.login_manager
+user_cache = app.extensions['user_cache']
+serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'])
 
-app = Flask(__name__)
-app.config.from_object(Config)
-
-# Debug environment
-print("=" * 60)
-print("ENVIRONMENT DEBUG INFO:")
-print(f"PORT: {os.getenv('PORT')}")
-print(f"RAILWAY_ENVIRONMENT_NAME: {os.getenv('RAILWAY_ENVIRONMENT_NAME')}")
-print("=" * 60)
 
-# Init
-db.init_app(app)
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
+@app.context_processor
+def inject_socket_transports():
+    # Keep the browser on the same transports the server accepts
+    return {'socket_transports': app.config['SOCKETIO_TRANSPORTS'] or ['websocket', 'polling']}
 
-# SocketIO
-async_mode = 'threading'  # Default to threading if not set by environment
-is_railway = (os.getenv('PORT') or os.getenv('RAILWAY_ENVIRONMENT_NAME') or os.getenv('RAILWAY_PROJECT_NAME'))
 
-if is_railway:
-    print("PRODUCTION ENVIRONMENT DETECTED")
-    try:
-        import eventlet
-        async_mode = 'eventlet'
-        print("USING eventlet")
-    except ImportError:
-        async_mode = 'threading'
-        print("FALLBACK threading")
-else:
-    print("LOCAL DEVELOPMENT")
-
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode=async_mode)
-mail = Mail(app)
-serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'])
+@app.context_processor
+def inject_inbox_summary():
+    # One primary-key lookup per page for the navigation badges
+    if current_user.is_authenticated:
+        return {'inbox': get_summary(current_user.id)}
+    return {}
 
-with app.app_context():
-    db.create_all()
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(user_id)
+    return user_cache.load(user_id)
+
+
+def action_done(endpoint, message, category):
+    """Flash and redirect to endpoint; fetch() callers get JSON and update their lists from the feed."""
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(message=message, category=category)
+    flash(message, category)
+    return redirect(url_for(endpoint))
 
 
 @app.route('/')
@@ -66,18 +71,17 @@ def register():
     values = {}
     if request.method == 'POST':
         name = request.form.get('name', '').strip()
-        college_id = request.form.get('college_id', '').strip().upper()
+        college_id = normalize_college_id(request.form.get('college_id'))
         email = request.form.get('email', '').strip()
         room_number = request.form.get('room_number', '').strip()
         password = request.form.get('password', '')
 
         values = {'name': name, 'college_id': college_id, 'email': email, 'room_number': room_number}
 
-        import re
-        if not re.match(r'^[A-Z]{2}[0-9]{6}$', college_id):
-            errors['college_id'] = 'Invalid college ID. Enter in format: 2 capital letters followed by 6 digits (e.g., RO200000).'
-        if not re.match(r'^\d{3}$', room_number):
-            errors['room_number'] = 'Invalid room number. Room number should have exactly 3 digits.'
+        if college_id_error(college_id):
+            errors['college_id'] = college_id_error(college_id)
+        if room_number_error(room_number):
+            errors['room_number'] = room_number_error(room_number)
 
         existing_college_id = User.query.filter_by(college_id=college_id).first()
         existing_email = User.query.filter_by(email=email).first()
@@ -92,14 +96,15 @@ def register():
         if errors:
             flash('Please correct the errors below and try again.', 'danger')
             return render_template('register.html', errors=errors, values=values)
+        user = User(
+            name=name,
+            college_id=college_id,
+            email=email,
+            room_number=room_number
+        )
+        # Outside the try: a busy hasher is a 503 with Retry-After (see credentials.py), not a failed signup
+        user.set_password(password)
         try:
-            user = User(
-                name=name,
-                college_id=college_id,
-                password=password,
-                email=email,
-                room_number=room_number
-            )
             db.session.add(user)
             db.session.commit()
             flash('Account created. Please login.', 'success')
@@ -121,7 +126,9 @@ def login():
         
         if user:
             # User exists, check password
-            if user.password == password:
+            if user.check_password(password):
+                # Saves the upgraded hash when the stored one was plaintext or outdated
+                db.session.commit()
                 login_user(user)
                 return redirect(url_for('dashboard'))
             else:
@@ -135,6 +142,8 @@ def login():
 
 
 @app.route('/forgot-password', methods=['GET', 'POST'])
+@rate_limit('password_reset')
+@coalesce()
 def forgot_password():
     if request.method == 'POST':
         email = request.form['email']
@@ -142,9 +151,7 @@ def forgot_password():
         if user:
             token = serializer.dumps(email, salt='reset-password')
             reset_link = url_for('reset_password', token=token, _external=True)
-            msg = Message('Reset Your Password', recipients=[email], sender=app.config['MAIL_USERNAME'])
-            msg.body = f'Click the link to reset your password: {reset_link}'
-            mail.send(msg)
+            enqueue_mail(email, 'Reset Your Password', f'Click the link to reset your password: {reset_link}')
             flash('Password reset link sent! Check your email.', 'success')
         else:
             flash('Email not found', 'danger')
@@ -163,7 +170,7 @@ def reset_password(token):
         user = User.query.filter_by(email=email).first()
         new_password = request.form['password']
         if user:
-            user.password = new_password
+            user.set_password(new_password)
             db.session.commit()
             flash('Password updated! You can now login.', 'success')
             return redirect(url_for('login'))
@@ -171,30 +178,47 @@ def reset_password(token):
     return render_template('reset_password.html')
 
 
+COMPATIBLE_LIMIT = 50
+
+
 @app.route('/dashboard', methods=['GET', 'POST'])
 @login_required
+@async_reads
+@rate_limit('writes')
+@coalesce()
 def dashboard():
     if request.method == 'POST':
         available = request.form['available'].strip().upper()
-        needed = request.form['needed'].strip().upper()
-
-        existing = RoomPreference.query.filter_by(
-            user_id=current_user.id,
-            available=available,
-            needed=needed
-        ).first()
-
-        if existing:
+        # A room number, 'FLOOR 2' or 'ANY' (see rooms.py)
+        need = parse_need(request.form['needed'])
+
+        if room_number_error(available):
+            flash(room_number_error(available), 'danger')
+        elif need is None:
+            flash(NEED_ERROR, 'danger')
+        elif RoomPreference.query.filter_by(user_id=current_user.id, available=available, needed=need.label).first():
             flash('You already posted this preference.', 'warning')
         else:
             pref = RoomPreference(  # type: ignore
                 user_id=current_user.id,
                 available=available,
-                needed=needed
+                needed=need.label
             )
             db.session.add(pref)
             db.session.commit()
             flash('Preference posted!', 'success')
+            cycle = match_user(current_user.id)
+            if cycle:
+                flash(f'Match found! You are now in room {current_user.room_number}.', 'success')
+            else:
+                # Only the floor that holds the wanted room can act on a new preference
+                notify_floor(socketio, need, 'preference_update', {
+                    'message': f"New room preference posted: {pref.available} -> {pref.needed}",
+                    'user': current_user.name,
+                    'available': pref.available,
+                    'needed': pref.needed,
+                    'timestamp': timestamp()
+                })
 
     # Get search parameters
     search_needed = request.args.get('search_needed', '').strip().upper()
@@ -203,36 +227,17 @@ def dashboard():
     # Get user's preferences
     my_prefs = RoomPreference.query.filter_by(user_id=current_user.id).order_by(RoomPreference.id.desc()).all()
     
-    # Get all users for the main table
-    all_users_query = User.query.filter(User.id != current_user.id)
-    if search_room:
-        all_users_query = all_users_query.filter(User.room_number.ilike(f'%{search_room}%'))
-    all_users = all_users_query.order_by(User.name).all()
-    
-    # Get requests sent by current user
-    my_requests = SwapRequest.query.filter_by(requester_id=current_user.id).order_by(SwapRequest.id.desc()).all()
-    
-    # Get requests received by current user
-    my_invitations = []
-    for pref in my_prefs:
-        for req in pref.requests:
-            if req.status == 'pending':
-                my_invitations.append(req)
-    
-    # Get other users' preferences (for compatibility)
-    other_prefs_query = RoomPreference.query.options(joinedload(RoomPreference.user)).filter(RoomPreference.user_id != current_user.id)
-    if search_needed:
-        other_prefs_query = other_prefs_query.filter(RoomPreference.available.ilike(f'%{search_needed}%'))
-    other_prefs = other_prefs_query.order_by(RoomPreference.id.desc()).limit(50).all()
+    # Other users' preferences that swap with ours, best first (see room_index.py)
+    other_prefs = app.extensions['room_index'].compatible(current_user, search_needed, COMPATIBLE_LIMIT)
+    # Rooms with a free place that one of our needs would take without a swap (see rooms.py)
+    free_places = rooms.free_rooms(current_user)
 
     return render_template(
         'dashboard.html',
         my_prefs=my_prefs,
         other_prefs=other_prefs,
+        free_places=free_places,
         search_needed=search_needed,
-        all_users=all_users,
-        my_requests=my_requests,
-        my_invitations=my_invitations,
         search_room=search_room,
         active_tab='dashboard'
     )
@@ -240,28 +245,28 @@ def dashboard():
 
 @app.route('/all_users')
 @login_required
+@render_cached('directory')
+@read_replica
+@async_reads
 def all_users():
     search_room = request.args.get('search_room', '').strip()
+    cursor = request.args.get('after')
     query = User.query.filter(User.is_looking_to_swap == True)  # Only show users who want to swap
-    if search_room:
-        query = query.filter(User.room_number.ilike(f'%{search_room}%'))
+    query = search_users(query, search_room)
     query = query.filter(User.id != current_user.id)
-    users = query.all()
-
-    # Get preferences for all users
-    user_preferences = {}
-    for user in users:
-        prefs = RoomPreference.query.filter_by(user_id=user.id).all()
-        user_preferences[user.id] = prefs
-
-    # Find all pending requests sent by current user
-    sent_requests = SwapRequest.query.join(RoomPreference).filter(
+    # Eager-load preferences in one extra IN query instead of one query per user
+    users, next_cursor = keyset_page(query.options(selectinload(User.room_preferences)), cursor)
+    user_preferences = {user.id: user.room_preferences for user in users}
+
+    # Find all pending requests sent by current user, keyed by the preference owner
+    sent_requests = db.session.query(SwapRequest.id, RoomPreference.user_id).join(
+        RoomPreference, SwapRequest.preference_id == RoomPreference.id
+    ).filter(
         SwapRequest.requester_id == current_user.id,
-        RoomPreference.user_id == User.id,
         SwapRequest.status == 'pending'
     ).all()
-    sent_user_ids = [req.preference.user_id for req in sent_requests]
-    sent_request_ids = {req.preference.user_id: req.id for req in sent_requests}
+    sent_request_ids = {owner_id: req_id for req_id, owner_id in sent_requests}
+    sent_user_ids = list(sent_request_ids)
 
     return render_template('all_users.html', 
                          users=users, 
@@ -269,27 +274,62 @@ def all_users():
                          sent_user_ids=sent_user_ids, 
                          sent_request_ids=sent_request_ids, 
                          user_preferences=user_preferences,
+                         next_cursor=next_cursor,
                          active_tab='all_users')
 
+
+@app.route('/api/users')
+@login_required
+def api_users():
+    query = User.query.filter(User.is_looking_to_swap == True, User.id != current_user.id)
+    query = search_users(query, request.args.get('q', ''))
+    per_page = min(request.args.get('limit', PAGE_SIZE, type=int), PAGE_SIZE)
+    users, next_cursor = keyset_page(query, request.args.get('after'), max(per_page, 1))
+    return jsonify({
+        'users': [{'id': u.id, 'name': u.name, 'room_number': u.room_number} for u in users],
+        'next_cursor': next_cursor,
+    })
+
+@app.route('/stats/user_cache')
+def user_cache_stats():
+    # Operational data, gated like /metrics
+    if not metrics_authorized(app):
+        abort(403)
+    return jsonify(user_cache.stats())
+
+@app.route('/api/swap_requests/changes')
+@login_required
+def swap_request_changes():
+    # Changes to the user's invitations and sent requests after ?since=<feed seq>; see feed.py
+    return jsonify(changes_since(current_user.id, request.args.get('since', 0, type=int)))
+
 @app.route('/available_rooms')
 def available_rooms():
     return render_template('available_rooms.html')
 
 @app.route('/my_requests')
 @login_required
+@render_cached('profiles')
 def my_requests():
-    my_requests = SwapRequest.query.filter_by(requester_id=current_user.id).order_by(SwapRequest.id.desc()).all()
+    # Rotations (see matching.py) are requests on the user's own preference; they show in swap history
+    my_requests = SwapRequest.query.join(RoomPreference).filter(
+        SwapRequest.requester_id == current_user.id, RoomPreference.user_id != current_user.id
+    ).order_by(SwapRequest.id.desc()).all()
     return render_template('my_requests.html', my_requests=my_requests, active_tab='my_requests')
 
 @app.route('/invitations')
 @login_required
+@render_cached('profiles')
+@async_reads
 def invitations():
-    my_invitations = SwapRequest.query.join(RoomPreference).filter(RoomPreference.user_id == current_user.id).order_by(SwapRequest.id.desc()).all()
+    my_invitations = SwapRequest.query.join(RoomPreference).filter(RoomPreference.user_id == current_user.id, SwapRequest.requester_id != current_user.id).order_by(SwapRequest.id.desc()).all()
     return render_template('invitations.html', my_invitations=my_invitations, active_tab='invitations')
 
 
 @app.route('/accept/<int:pref_id>')
 @login_required
+@rate_limit('writes', methods=('GET',))
+@coalesce(methods=('GET',))
 def accept(pref_id):
     pref = RoomPreference.query.get_or_404(pref_id)
     # Check if already requested by this user
@@ -303,14 +343,22 @@ def accept(pref_id):
             to_room_number=pref.user.room_number
         )
         db.session.add(swap_request)
-        db.session.commit()
-        socketio.emit('swap_request_notification', {
+        try:
+            db.session.flush()
+            record_transition(pref.user_id, current_user.id, None, 'pending', swap_request.id)
+            db.session.commit()
+        except IntegrityError:
+            # uq_swap_requests_pending: a concurrent click already sent this request
+            db.session.rollback()
+            flash('You have already sent a request for this preference.', 'info')
+            return redirect(url_for('dashboard'))
+        notify_user(socketio, pref.user_id, 'swap_request_notification', {
             'message': f"{current_user.name} wants to swap rooms with you!",
             'requester': current_user.name,
             'available': pref.needed,
             'needed': pref.available,
             'original_poster': pref.user.name,
-            'timestamp': str(db.func.current_timestamp())
+            'timestamp': timestamp()
         })
         flash('Swap request sent!', 'success')
     else:
@@ -321,22 +369,34 @@ def accept(pref_id):
 @app.route('/commit_request/<int:req_id>', methods=['POST'])
 @login_required
 def commit_request(req_id):
-    req = SwapRequest.query.get_or_404(req_id)
-    pref = req.preference
-    if pref.user_id == current_user.id and req.status == 'pending':
-        # Swap room numbers between the requester and the preference owner
-        requester = req.requester
-        owner = pref.user
-        requester_room = requester.room_number
-        owner_room = owner.room_number
-        requester.room_number = owner_room
-        owner.room_number = requester_room
-        req.status = 'committed'
-        db.session.commit()
-        flash('Swap committed. Room numbers updated.', 'success')
-    else:
-        flash('Invalid commit action.', 'danger')
-    return redirect(url_for('invitations'))
+    result = swaps.commit_swap(req_id, current_user.id)
+    if result == swaps.COMMITTED:
+        return action_done('invitations', 'Swap committed. Room numbers updated.', 'success')
+    elif result == swaps.NOT_FOUND:
+        abort(404)
+    elif result == swaps.STALE:
+        return action_done('invitations', 'One of you has changed rooms since this request was sent, '
+                                          'so it can no longer be accepted.', 'warning')
+    elif result == swaps.CONFLICT:
+        return action_done('invitations', 'Another swap involving this room is being processed. Please try again.',
+                           'warning')
+    return action_done('invitations', 'Invalid commit action.', 'danger')
+
+
+@app.route('/move_in/<int:room_id>', methods=['POST'])
+@login_required
+@rate_limit('writes')
+def move_in(room_id):
+    result = rooms.move_in(current_user.id, room_id)
+    if result == rooms.MOVED:
+        return action_done('dashboard', 'Moved in. Your room number is updated.', 'success')
+    elif result == rooms.NOT_FOUND:
+        abort(404)
+    elif result == rooms.SAME_ROOM:
+        return action_done('dashboard', 'You are already in this room.', 'info')
+    elif result == rooms.FULL:
+        return action_done('dashboard', 'That room has no free place any more.', 'warning')
+    return action_done('dashboard', 'Your room changed while moving in. Please try again.', 'warning')
 
 
 @app.route('/reject_request/<int:req_id>', methods=['POST'])
@@ -346,15 +406,17 @@ def reject_request(req_id):
     pref = req.preference
     if pref.user_id == current_user.id and req.status == 'pending':
         req.status = 'rejected'
+        req.resolved_at = db.func.current_timestamp()
+        record_transition(pref.user_id, req.requester_id, 'pending', 'rejected', req.id)
         db.session.commit()
-        flash('Request marked as not interested.', 'info')
-    else:
-        flash('Invalid reject action.', 'danger')
-    return redirect(url_for('invitations'))
+        return action_done('invitations', 'Request marked as not interested.', 'info')
+    return action_done('invitations', 'Invalid reject action.', 'danger')
 
 
 @app.route('/send_direct_request/<int:user_id>', methods=['POST'])
 @login_required
+@rate_limit('writes')
+@coalesce()
 def send_direct_request(user_id):
     target_user = User.query.get_or_404(user_id)
     
@@ -374,7 +436,7 @@ def send_direct_request(user_id):
             target_pref = RoomPreference(
                 user_id=user_id,
                 available=target_user.room_number,
-                needed='Any'
+                needed=WILDCARD_ROOM
             )
             db.session.add(target_pref)
             db.session.flush()  # Get the ID
@@ -388,7 +450,21 @@ def send_direct_request(user_id):
             to_room_number=target_user.room_number
         )
         db.session.add(swap_request)
-        db.session.commit()
+        try:
+            db.session.flush()
+            record_transition(user_id, current_user.id, None, 'pending', swap_request.id)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash('You have already sent a request to this user.', 'warning')
+            return redirect(url_for('all_users'))
+        notify_user(socketio, target_user.id, 'swap_request_notification', {
+            'message': f"{current_user.name} wants to swap rooms with you!",
+            'requester': current_user.name,
+            'available': current_user.room_number,
+            'needed': target_user.room_number,
+            'timestamp': timestamp()
+        })
         
         flash(f'Swap request sent to {target_user.name}!', 'success')
     
@@ -400,12 +476,12 @@ def send_direct_request(user_id):
 def cancel(req_id):
     req = SwapRequest.query.get_or_404(req_id)
     if req.requester_id == current_user.id and req.status == 'pending':
+        owner_id = req.preference.user_id
         db.session.delete(req)
+        record_transition(owner_id, current_user.id, 'pending', None, req_id)
         db.session.commit()
-        flash('Request cancelled successfully.', 'info')
-    else:
-        flash('You can only cancel your own pending requests.', 'warning')
-    return redirect(url_for('dashboard'))
+        return action_done('dashboard', 'Request cancelled successfully.', 'info')
+    return action_done('dashboard', 'You can only cancel your own pending requests.', 'warning')
 
 
 # Removed the /edit/<int:pref_id> route and related code for editing user preferences
@@ -415,7 +491,11 @@ def cancel(req_id):
 @login_required 
 def delete(pref_id):
     pref = RoomPreference.query.get_or_404(pref_id)
-    db.session.delete(pref)
+    if pref.user_id != current_user.id:
+        flash('You can only delete your own preferences.', 'warning')
+        return redirect(url_for('dashboard'))
+    # Its requests go too; swaps already made from it stay in history (see accounts.py)
+    delete_preferences([pref.id])
     db.session.commit()
     flash('Preference deleted.')
     return redirect(url_for('dashboard'))
@@ -425,31 +505,17 @@ def delete(pref_id):
 @login_required
 def delete_account():
     try:
-        user = current_user
-
-        # Delete all swap requests where user is requester
-        SwapRequest.query.filter_by(requester_id=user.id).delete()
-
-        # Delete all swap requests where user owns the preference
-        user_prefs = RoomPreference.query.filter_by(user_id=user.id).all()
-        for pref in user_prefs:
-            SwapRequest.query.filter_by(preference_id=pref.id).delete()
-
-        # Delete all room preferences for the user
-        RoomPreference.query.filter_by(user_id=user.id).delete()
-
-        # Now delete the user
-        db.session.delete(user)
+        # One statement per table for everything that refers to the user (see accounts.py)
+        delete_accounts([current_user.id])
         db.session.commit()
 
-        from flask_login import logout_user
         logout_user()
         flash('Your account has been deleted successfully.', 'success')
         return redirect(url_for('home'))
 
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print("Delete account error:", e)  # This will help you debug
+        app.logger.exception('Delete account failed for user %s', current_user.id)
         flash('Error deleting account. Please try again.', 'danger')
         return redirect(url_for('profile'))
 
@@ -462,46 +528,38 @@ def logout():
 
 
 @socketio.on('connect')
-def handle_connect():
+def handle_connect(auth=None):
+    # Reject anonymous sockets; everyone else only hears about their own swaps
+    if not current_user.is_authenticated:
+        return False
+    join_room(user_room(current_user.id))
     emit('connected', {'data': 'Connected to server!', 'status': 'success'})
 
 
-@socketio.on('disconnect')
-def handle_disconnect():
-    print('Client disconnected')
-
-
-@socketio.on('new_preference')
-def handle_new_preference(data):
-    emit('preference_update', {
-        'message': f"New room preference posted: {data.get('available')} -> {data.get('needed')}",
-        'user': data.get('user', 'Someone'),
-        'available': data.get('available', ''),
-        'needed': data.get('needed', ''),
-        'timestamp': str(db.func.current_timestamp())
-    }, broadcast=True)
+@socketio.on('subscribe_floor')
+def handle_subscribe_floor(data=None):
+    if not current_user.is_authenticated:
+        return
+    room = floor_room(current_user.room_number)
+    if room:
+        join_room(room)
 
 
-@socketio.on('request_sent')
-def handle_request_sent(data):
-    emit('swap_request_notification', {
-        'message': f"{data.get('requester', 'Someone')} wants to swap rooms with you!",
-        'requester': data.get('requester', ''),
-        'available': data.get('available', ''),
-        'needed': data.get('needed', ''),
-        'timestamp': str(db.func.current_timestamp())
-    }, broadcast=True)
+@socketio.on('disconnect')
+def handle_disconnect():
+    app.logger.debug('Client disconnected: %s', request.sid)
 
 
 @app.route('/swap_history')
 @login_required
+@render_cached('profiles')
+@read_replica
+@async_reads
 def swap_history():
-    # Get all committed swaps where the user was involved
-    committed_swaps = SwapRequest.query.filter(
-        (SwapRequest.status == 'committed') &
-        ((SwapRequest.requester_id == current_user.id) | (SwapRequest.preference.has(user_id=current_user.id)))
-    ).order_by(SwapRequest.id.desc()).all()
-    return render_template('swap_history.html', swap_history=committed_swaps, active_tab='swap_history')
+    # Committed swaps where the user was involved, including archived ones (see archive.py)
+    history, next_before = history_page(current_user.id, request.args.get('before', type=int))
+    return render_template('swap_history.html', swap_history=history, next_before=next_before,
+                           active_tab='swap_history')
 
 
 @app.route('/profile')
@@ -517,7 +575,9 @@ def edit_profile():
         name = request.form.get('name', '').strip()
         room_number = request.form.get('room_number', '').strip()
         email = request.form.get('email', '').strip()
-        # Optionally, add validation here
+        if room_number_error(room_number):
+            flash(room_number_error(room_number), 'danger')
+            return render_template('edit_profile.html', active_tab='profile')
         current_user.name = name
         current_user.room_number = room_number
         current_user.email = email
@@ -0,0 +1,149 @@
+"""
+Archival of resolved swap requests.
+
+swap_requests only has to hold the requests that can still change: pending
+ones, plus recently resolved ones the request lists still show. archive()
+moves requests resolved (committed, rejected or superseded) more than
+ARCHIVE_AFTER_DAYS days ago into swap_request_archive under their original
+ids. Each batch of ARCHIVE_BATCH_SIZE is copied and deleted in its own short
+transaction, so no lock is held for longer than one batch and the app keeps
+serving while a large backlog drains. Run it from cron:
+
+    python archive.py                        # ARCHIVE_AFTER_DAYS (default 180)
+    python archive.py --days 30 --pause 0.1  # sleep between batches
+
+Archived requests drop out of /invitations and /my_requests, and their feed
+entries describe them as gone. Readers of the whole history see both tables:
+history_page() behind /swap_history, inbox.rebuild() when it counts committed
+swaps, and the allocations export.
+"""
+
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, insert, or_, select
+
+from models import db, User, RoomPreference, SwapRequest, SwapRequestArchive
+
+HISTORY_PAGE_SIZE = 50
+
+ARCHIVED_COLUMNS = ('id', 'preference_id', 'owner_id', 'requester_id', 'status',
+                    'from_room_number', 'to_room_number', 'resolved_at', 'archived_at')
+
+# One committed swap from a user's side: who with, and the user's rooms before and after
+HistoryEntry = namedtuple('HistoryEntry', 'id name from_room to_room')
+
+
+def move(ids):
+    """Copy swap requests to the archive and delete them, in the caller's transaction."""
+    db.session.execute(insert(SwapRequestArchive).from_select(ARCHIVED_COLUMNS, select(
+        SwapRequest.id, SwapRequest.preference_id, RoomPreference.user_id, SwapRequest.requester_id,
+        SwapRequest.status, SwapRequest.from_room_number, SwapRequest.to_room_number,
+        SwapRequest.resolved_at, func.current_timestamp(),
+    ).outerjoin(RoomPreference, SwapRequest.preference_id == RoomPreference.id).where(SwapRequest.id.in_(ids))))
+    db.session.execute(delete(SwapRequest).where(SwapRequest.id.in_(ids)))
+
+
+def archive_batch(cutoff, batch_size):
+    """Move up to batch_size requests resolved before cutoff; returns how many, committed."""
+    ids = db.session.scalars(
+        select(SwapRequest.id)
+        .where(SwapRequest.resolved_at < cutoff, SwapRequest.status != 'pending')
+        # Oldest first, straight off ix_swap_requests_resolved
+        .order_by(SwapRequest.resolved_at).limit(batch_size)
+        # Two archivers running at once take different rows
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not ids:
+        db.session.rollback()
+        return 0
+    move(ids)
+    db.session.commit()
+    return len(ids)
+
+
+def archive(days, batch_size=1000, pause=0.0):
+    """Archive requests resolved more than `days` days ago, batch by batch; returns how many."""
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=days)
+    moved = 0
+    while True:
+        count = archive_batch(cutoff, batch_size)
+        moved += count
+        if count < batch_size:
+            return moved
+        if pause:
+            time.sleep(pause)
+
+
+def history_page(user_id, before=None, per_page=HISTORY_PAGE_SIZE):
+    """
+    One page of user_id's committed swaps, newest first, from both tables.
+
+    Returns (entries, next_before); pass next_before back as `before` for the
+    next page, which is None on the last one.
+    """
+    owned = select(RoomPreference.id).where(RoomPreference.user_id == user_id).scalar_subquery()
+    # Both sides of each OR use their own (..., status) index
+    hot = select(SwapRequest.id, SwapRequest.preference_id, SwapRequest.requester_id,
+                 RoomPreference.user_id.label('owner_id'), SwapRequest.from_room_number, SwapRequest.to_room_number) \
+        .join(RoomPreference, SwapRequest.preference_id == RoomPreference.id) \
+        .where(SwapRequest.status == 'committed',
+               or_(SwapRequest.requester_id == user_id, SwapRequest.preference_id.in_(owned)))
+    archived = select(SwapRequestArchive.id, SwapRequestArchive.preference_id, SwapRequestArchive.requester_id,
+                      SwapRequestArchive.owner_id, SwapRequestArchive.from_room_number,
+                      SwapRequestArchive.to_room_number) \
+        .where(SwapRequestArchive.status == 'committed',
+               or_(SwapRequestArchive.requester_id == user_id, SwapRequestArchive.owner_id == user_id))
+    if before is not None:
+        hot = hot.where(SwapRequest.id < before)
+        archived = archived.where(SwapRequestArchive.id < before)
+
+    # Ids are unique across both tables, so each side's newest page merges into the page
+    rows = db.session.execute(hot.order_by(SwapRequest.id.desc()).limit(per_page + 1)).all()
+    rows += db.session.execute(archived.order_by(SwapRequestArchive.id.desc()).limit(per_page + 1)).all()
+    rows.sort(key=lambda row: row.id, reverse=True)
+    page = rows[:per_page]
+
+    # A rotation's move is on the mover's own preference; the other side is whoever's room they got
+    rotations = {row.preference_id for row in page if row.requester_id == row.owner_id}
+    received = dict(db.session.execute(
+        select(RoomPreference.id, RoomPreference.accepted_by_id).where(RoomPreference.id.in_(rotations))
+    ).all()) if rotations else {}
+
+    def other(row):
+        if row.requester_id == row.owner_id:
+            return received.get(row.preference_id)
+        return row.owner_id if row.requester_id == user_id else row.requester_id
+
+    others = {other(row) for row in page} - {None}
+    names = dict(db.session.execute(select(User.id, User.name).where(User.id.in_(others))).all()) if others else {}
+    entries = []
+    for row in page:
+        if row.requester_id == user_id:
+            entries.append(HistoryEntry(row.id, names.get(other(row)), row.from_room_number, row.to_room_number))
+        else:
+            entries.append(HistoryEntry(row.id, names.get(other(row)), row.to_room_number, row.from_room_number))
+    return entries, page[-1].id if len(rows) > per_page else None
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from factory import create_app
+
+    parser = argparse.ArgumentParser(description='Move old resolved swap requests to the archive table.')
+    parser.add_argument('--days', type=int, help='archive requests resolved longer ago than this '
+                                                 '(default ARCHIVE_AFTER_DAYS)')
+    parser.add_argument('--batch-size', type=int, help='requests per transaction (default ARCHIVE_BATCH_SIZE)')
+    parser.add_argument('--pause', type=float, default=0.0, help='seconds to sleep between batches')
+    args = parser.parse_args()
+
+    app = create_app(web=False)
+    with app.app_context():
+        days = args.days if args.days is not None else app.config['ARCHIVE_AFTER_DAYS']
+        batch_size = args.batch_size or app.config['ARCHIVE_BATCH_SIZE']
+        started = time.perf_counter()
+        moved = archive(days, batch_size, args.pause)
+        print(f"Archived {moved} swap requests resolved more than {days} days ago "
+              f"in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,14 @@
+"""
+ASGI entry point: the app served from an asyncio event loop (see asgi_server.py).
+
+    uvicorn asgi:application --host 0.0.0.0 --port $PORT
+"""
+
+import os
+
+os.environ.setdefault('SOCKETIO_ASYNC_MODE', 'asgi')
+
+from app import app  # noqa: E402
+from asgi_server import asgi_app  # noqa: E402
+
+application = asgi_app(app)
@@ -0,0 +1,265 @@
+"""
+Native asyncio serving: the app behind an ASGI server, one event loop per worker.
+
+    uvicorn asgi:application --host 0.0.0.0 --port $PORT
+
+asgi.py builds the usual app with SOCKETIO_ASYNC_MODE=asgi; this module
+serves it from the loop in three parts:
+
+    Socket.IO         python-socketio's AsyncServer holds the sockets. The
+                      handlers in app.py stay Flask-SocketIO handlers:
+                      AsyncServerBridge stands in for the threaded server
+                      underneath and runs each event in a greenlet on the loop
+    hot read views    GETs of views marked @async_reads (dashboard, all_users,
+                      invitations, swap_history) run in greenlets on the loop too
+    everything else   the Flask app on a pool of ASGI_THREADS threads, as under
+                      the threading server: writes, logins (password hashing)
+                      and anything else that blocks
+
+Code in those greenlets queries through the asyncio drivers (asyncpg,
+aiosqlite; see db_engine.init_async_engines): a query suspends its greenlet
+and the loop serves other sockets and requests meanwhile, so a worker holds
+thousands of sockets without a thread or green thread apiece, and a page's
+queries no longer wait for a free thread. Anything else a greenlet does runs
+on the loop itself, so the hot views keep to the database, the in-memory
+caches and templates; with the Redis cache backends each cache round trip
+blocks the loop. The room index is built before serving starts, since a
+first build inside a greenlet would hold its lock across queries.
+
+Without an async driver for the database, or with ASGI_ASYNC_VIEWS=0, all
+views and socket handlers run on the threads and only the sockets themselves
+are on the loop. Emits from the threads are handed to the loop. Requests and
+responses are buffered whole; nothing here streams.
+"""
+
+import asyncio
+import functools
+import io
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import socketio as python_socketio
+from sqlalchemy.util.concurrency import await_only, greenlet_spawn, in_greenlet
+from werkzeug.exceptions import HTTPException
+
+from db_engine import init_async_engines
+from socket_queue import async_client_manager
+
+logger = logging.getLogger(__name__)
+
+ON_LOOP_METHODS = ('GET', 'HEAD')
+
+
+async def run_sync(fn, *args, executor=None):
+    """Run fn(*args) in a greenlet on the loop, or on the executor's threads when one is given."""
+    if executor is None:
+        return await greenlet_spawn(fn, *args)
+    return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(fn, *args))
+
+
+class AsyncServerBridge:
+    """
+    The part of socketio.Server that Flask-SocketIO uses, over an AsyncServer.
+
+    With this as socketio.server, app.py's handlers, emit(), join_room() and
+    the notify_* helpers work unchanged. Handlers run through run_sync();
+    calls from them, or from views on the threads, wait for the loop.
+    """
+
+    def __init__(self, app, server, executor=None):
+        self.app = app
+        self.server = server
+        self.executor = executor    # None: handlers run in greenlets on the loop
+        self.loop = None            # set when serving starts
+
+    def on(self, event, handler, namespace=None):
+        async def run(sid, *args):
+            return await run_sync(handler, sid, *args, executor=self.executor)
+        self.server.on(event, run, namespace=namespace)
+
+    def get_environ(self, sid, namespace=None):
+        environ = self.server.get_environ(sid, namespace=namespace)
+        if environ is not None:
+            # Flask-SocketIO's WSGI middleware sets this under the other modes
+            environ.setdefault('flask.app', self.app)
+        return environ
+
+    def _on_loop_thread(self):
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def _wait(self, coro):
+        if in_greenlet():
+            return await_only(coro)
+        if self._on_loop_thread():
+            # A plain callback on the loop can't wait for it
+            self.loop.create_task(coro)
+            return None
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def emit(self, event, *args, **kwargs):
+        return self._wait(self.server.emit(event, *args, **kwargs))
+
+    def enter_room(self, sid, room, namespace=None):
+        return self._wait(self.server.enter_room(sid, room, namespace=namespace))
+
+    def leave_room(self, sid, room, namespace=None):
+        return self._wait(self.server.leave_room(sid, room, namespace=namespace))
+
+    def close_room(self, room, namespace=None):
+        return self._wait(self.server.close_room(room, namespace=namespace))
+
+    def disconnect(self, sid, namespace=None):
+        return self._wait(self.server.disconnect(sid, namespace=namespace))
+
+    def start_background_task(self, target, *args, **kwargs):
+        # Background work (the mail workers) blocks, so it gets a thread as under threading
+        thread = threading.Thread(target=target, args=args, kwargs=kwargs, daemon=True)
+        thread.start()
+        return thread
+
+    def sleep(self, seconds=0):
+        time.sleep(seconds)
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope and its whole body."""
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    server = scope.get('server') or ('localhost', 80)
+    environ['SERVER_NAME'], environ['SERVER_PORT'] = server[0], str(server[1] or 80)
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        elif name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        if key in environ:
+            value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+        environ[key] = value
+    return environ
+
+
+def call_wsgi(app, environ):
+    """Run a WSGI app to the end of its response; returns (status, headers, body) for ASGI."""
+    chunks, started = [], []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [int(status.split(' ', 1)[0]), headers]
+        return chunks.append
+
+    result = app(environ, start_response)
+    try:
+        chunks.extend(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    status, headers = started
+    return status, [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers], \
+        b''.join(chunks)
+
+
+class FlaskASGI:
+    """ASGI app running a Flask app's views in greenlets on the loop (@async_reads GETs) or on threads."""
+
+    def __init__(self, app, executor, on_loop):
+        self.app = app
+        self.executor = executor
+        self.on_loop = on_loop
+        self.ready = False          # set once startup has built the room index
+        self._urls = None
+
+    def runs_on_loop(self, environ):
+        if not (self.on_loop and self.ready) or environ['REQUEST_METHOD'] not in ON_LOOP_METHODS:
+            return False
+        if self._urls is None:
+            self._urls = self.app.url_map.bind('localhost')
+        try:
+            endpoint, _ = self._urls.match(environ['PATH_INFO'], 'GET')
+        except HTTPException:
+            return False
+        return getattr(self.app.view_functions.get(endpoint), 'async_reads', False)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'websocket':
+            # Only Socket.IO takes websockets, and it never passes them on
+            await send({'type': 'websocket.close'})
+            return
+        body = bytearray()
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        environ = build_environ(scope, bytes(body))
+        executor = None if self.runs_on_loop(environ) else self.executor
+        status, headers, content = await run_sync(call_wsgi, self.app, environ, executor=executor)
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': content})
+
+
+def init_asgi(app, socketio):
+    """Put an AsyncServerBridge under Flask-SocketIO's socketio; asgi_app() then serves the app."""
+    config = app.config
+    options = {'async_mode': 'asgi', 'cors_allowed_origins': '*'}
+    if config.get('SOCKETIO_TRANSPORTS'):
+        options['transports'] = config['SOCKETIO_TRANSPORTS']
+    manager = async_client_manager(config)
+    if manager is not None:
+        options['client_manager'] = manager
+
+    executor = ThreadPoolExecutor(config.get('ASGI_THREADS', 32), thread_name_prefix='asgi')
+    on_loop = bool(config.get('ASGI_ASYNC_VIEWS', True) and init_async_engines(app))
+    if not on_loop:
+        logger.warning('asgi mode without async engines: views and socket handlers run on threads')
+    socketio.server = AsyncServerBridge(app, python_socketio.AsyncServer(**options),
+                                        executor=None if on_loop else executor)
+    app.extensions['asgi'] = FlaskASGI(app, executor, on_loop)
+
+
+def _warm(app):
+    with app.app_context():
+        app.extensions['room_index'].ready()
+
+
+def asgi_app(app):
+    """The ASGI application serving app: Socket.IO at /socket.io, everything else through FlaskASGI."""
+    bridge = app.extensions['socketio'].server
+    flask_asgi = app.extensions.get('asgi')
+    if flask_asgi is None:
+        raise RuntimeError('asgi_app() needs the app built with SOCKETIO_ASYNC_MODE=asgi')
+
+    async def startup():
+        bridge.loop = asyncio.get_running_loop()
+        if flask_asgi.on_loop:
+            await bridge.loop.run_in_executor(flask_asgi.executor, _warm, app)
+        flask_asgi.ready = True
+
+    async def shutdown():
+        for engine in app.extensions.get('async_engines', {}).values():
+            await engine.dispose()
+        flask_asgi.executor.shutdown(wait=False)
+
+    return python_socketio.ASGIApp(bridge.server, other_asgi_app=flask_asgi, socketio_path='socket.io',
+                                   on_startup=startup, on_shutdown=shutdown)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Archival of resolved swap requests: batch cost and its effect on the hot queries.
+
+Seeds a synthetic hostel whose resolved requests were resolved over the past
+year (the database is wiped first), times the per-user request queries,
+archives everything resolved more than --days ago, and times them again.
+It reports the longest batch transaction (how long archive() holds its
+locks) and checks that swap history and the inbox counters are unchanged.
+
+    DATABASE_URL=sqlite:////tmp/archive.db python benchmarks/archive.py --users 20000 --requests-per-user 10
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, select  # noqa: E402
+
+from factory import create_app  # noqa: E402
+from models import db, RoomPreference, SwapRequest, SwapRequestArchive, InboxSummary  # noqa: E402
+from benchmarks.seed import seed_hostel  # noqa: E402
+import archive  # noqa: E402
+import inbox  # noqa: E402
+
+
+def per_user_queries(user_id):
+    """The reads behind /my_requests, /invitations, /swap_history and the pending-request check."""
+    return {
+        'my_requests': lambda: SwapRequest.query.filter_by(requester_id=user_id)
+        .order_by(SwapRequest.id.desc()).all(),
+        'invitations': lambda: SwapRequest.query.join(RoomPreference).filter(RoomPreference.user_id == user_id)
+        .order_by(SwapRequest.id.desc()).all(),
+        'swap_history': lambda: archive.history_page(user_id),
+        'pending_sent': lambda: db.session.scalar(select(func.count()).where(
+            SwapRequest.requester_id == user_id, SwapRequest.status == 'pending')),
+    }
+
+
+def time_queries(user_ids):
+    timings = {}
+    for user_id in user_ids:
+        for name, query in per_user_queries(user_id).items():
+            started = time.perf_counter()
+            query()
+            timings.setdefault(name, []).append(time.perf_counter() - started)
+            db.session.rollback()
+    return {name: statistics.median(values) for name, values in timings.items()}
+
+
+def full_history(user_id):
+    entries, before = archive.history_page(user_id)
+    while before is not None:
+        page, before = archive.history_page(user_id, before)
+        entries += page
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure archiving resolved swap requests.')
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--requests-per-user', type=int, default=10)
+    parser.add_argument('--days', type=int, default=90, help='archive requests resolved longer ago than this')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--samples', type=int, default=200, help='users whose queries are timed')
+    args = parser.parse_args()
+
+    os.environ.setdefault('SECRET_KEY', 'archive-benchmark')
+    app = create_app(web=False)
+    with app.app_context():
+        seed_hostel(args.users, requests_per_user=args.requests_per_user)
+        user_ids = random.Random(1).sample(range(1, args.users + 1), min(args.samples, args.users))
+        history = {user_id: full_history(user_id) for user_id in user_ids}
+        counters = {row.user_id: (row.pending_invites, row.pending_sent, row.committed_swaps)
+                    for row in InboxSummary.query}
+        rows_before = db.session.scalar(select(func.count()).select_from(SwapRequest))
+        before = time_queries(user_ids)
+
+        cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=args.days)
+        batches = []
+        while True:
+            started = time.perf_counter()
+            moved = archive.archive_batch(cutoff, args.batch_size)
+            batches.append(time.perf_counter() - started)
+            if moved < args.batch_size:
+                break
+        archived = db.session.scalar(select(func.count()).select_from(SwapRequestArchive))
+        after = time_queries(user_ids)
+
+        print(f"swap_requests {rows_before} rows -> {rows_before - archived} "
+              f"({archived} archived in {len(batches)} batches, {sum(batches):.2f}s; "
+              f"longest batch {max(batches) * 1000:.1f}ms)")
+        for name in before:
+            print(f"{name:<14} p50 {before[name] * 1000:7.2f}ms -> {after[name] * 1000:7.2f}ms")
+
+        inbox.rebuild()
+        same_counters = counters == {row.user_id: (row.pending_invites, row.pending_sent, row.committed_swaps)
+                                     for row in InboxSummary.query}
+        same_history = all(full_history(user_id) == entries for user_id, entries in history.items())
+        print(f"history unchanged: {same_history}  inbox counters unchanged after rebuild: {same_counters}")
+        if not (same_history and same_counters):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
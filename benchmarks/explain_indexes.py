@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Check that every hot query is answered from the index meant for it.
+
+Seeds a synthetic hostel into DATABASE_URL (the database is wiped first),
+runs ANALYZE, then EXPLAINs each query below and fails if the planner scans
+a table it should search, or picks a different index than expected. On
+PostgreSQL sequential scans are disabled for the check, so it verifies that
+an index *can* serve the query even where the tables are small enough for
+the planner to prefer a scan.
+
+    DATABASE_URL=sqlite:////tmp/explain.db python benchmarks/explain_indexes.py
+    DATABASE_URL=postgresql://localhost/swap_explain python benchmarks/explain_indexes.py
+
+The statements mirror the ones in app.py, matching.py, swaps.py, inbox.py,
+rooms.py and mail_queue.py; keep them in step when a query changes shape.
+tests/test_indexes.py runs the same checks on SQLite.
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, func, or_, select, text  # noqa: E402
+
+from app import app  # noqa: E402
+from directory import room_filter, search_users  # noqa: E402
+from matching import _open_preferences_query  # noqa: E402
+from models import (db, Room, User, RoomPreference, SwapRequest, SwapRequestArchive, InboxSummary,  # noqa: E402
+                    OutboxMessage)
+from rooms import occupants  # noqa: E402
+from seed import seed_hostel  # noqa: E402
+
+
+def hot_queries(user_id, pref_id, rooms, room_ids):
+    """(name, [(table, expected index or None)], statement) for each hot lookup."""
+    owned = select(RoomPreference.id).where(RoomPreference.user_id == user_id).scalar_subquery()
+    pending = SwapRequest.status == 'pending'
+    return [
+        ('login / register: user by college_id', [('users', None)],
+         select(User).where(User.college_id == 'SB000001')),
+        ('forgot / reset password: user by email', [('users', None)],
+         select(User).where(User.email == 'student1@example.com')),
+        ('dashboard POST: duplicate preference', [('room_preferences', 'ix_room_preferences_user_rooms')],
+         select(RoomPreference).where(RoomPreference.user_id == user_id, RoomPreference.available == '101',
+                                      RoomPreference.needed == '202').limit(1)),
+        ('dashboard: own preferences', [('room_preferences', 'ix_room_preferences_user_rooms')],
+         select(RoomPreference).where(RoomPreference.user_id == user_id).order_by(RoomPreference.id.desc())),
+        ('dashboard: search by available room', [('room_preferences', 'ix_room_preferences_available')],
+         select(RoomPreference).where(RoomPreference.user_id != user_id,
+                                      room_filter(RoomPreference.available, '10'))
+         .order_by(RoomPreference.id.desc()).limit(50)),
+        ('all_users: first page', [('users', 'ix_users_looking_name')],
+         select(User).where(User.is_looking_to_swap == True, User.id != user_id)  # noqa: E712
+         .order_by(User.name, User.id).limit(51)),
+        ('all_users: search', [('users', None)],
+         search_users(User.query.filter(User.is_looking_to_swap == True), '10').statement),  # noqa: E712
+        ('all_users: pending requests sent', [('swap_requests', 'ix_swap_requests_requester_status')],
+         select(SwapRequest.id, RoomPreference.user_id)
+         .join(RoomPreference, SwapRequest.preference_id == RoomPreference.id)
+         .where(SwapRequest.requester_id == user_id, pending)),
+        ('my_requests', [('swap_requests', 'ix_swap_requests_requester_status')],
+         select(SwapRequest).join(RoomPreference)
+         .where(SwapRequest.requester_id == user_id, RoomPreference.user_id != user_id)
+         .order_by(SwapRequest.id.desc())),
+        ('invitations', [('room_preferences', 'ix_room_preferences_user_rooms'),
+                         ('swap_requests', 'ix_swap_requests_preference_status')],
+         select(SwapRequest).join(RoomPreference)
+         .where(RoomPreference.user_id == user_id, SwapRequest.requester_id != user_id)
+         .order_by(SwapRequest.id.desc())),
+        ('accept: existing pending request', [('swap_requests', 'uq_swap_requests_pending')],
+         select(SwapRequest).where(SwapRequest.preference_id == pref_id, SwapRequest.requester_id == user_id,
+                                   pending).limit(1)),
+        ('send_direct_request: existing pending request', [('swap_requests', None)],
+         select(SwapRequest).join(RoomPreference)
+         .where(SwapRequest.requester_id == user_id, RoomPreference.user_id == user_id + 1, pending).limit(1)),
+        ('swap_history', [('swap_requests', None)],
+         select(SwapRequest).where(SwapRequest.status == 'committed',
+                                   or_(SwapRequest.requester_id == user_id, SwapRequest.preference_id.in_(owned)))
+         .order_by(SwapRequest.id.desc())),
+        ('swap_history: archived swaps', [('swap_request_archive', None)],
+         select(SwapRequestArchive.id).where(SwapRequestArchive.status == 'committed',
+                                             or_(SwapRequestArchive.requester_id == user_id,
+                                                 SwapRequestArchive.owner_id == user_id))
+         .order_by(SwapRequestArchive.id.desc()).limit(51)),
+        ('archive: resolved batch', [('swap_requests', 'ix_swap_requests_resolved')],
+         select(SwapRequest.id).where(SwapRequest.resolved_at < datetime(2000, 1, 1), SwapRequest.status != 'pending')
+         .order_by(SwapRequest.resolved_at).limit(1000)),
+        ('inbox summary', [('inbox_summaries', None)],
+         select(InboxSummary).where(InboxSummary.user_id == user_id)),
+        ('swaps.supersede_pending', [('swap_requests', None)],
+         select(SwapRequest.id, RoomPreference.user_id, SwapRequest.requester_id)
+         .join(RoomPreference, SwapRequest.preference_id == RoomPreference.id)
+         .where(pending, or_(SwapRequest.requester_id.in_([user_id, user_id + 1]), SwapRequest.preference_id.in_(
+             select(RoomPreference.id).where(RoomPreference.user_id.in_([user_id, user_id + 1])).scalar_subquery()
+         )))),
+        ('matching: preferences offering wanted rooms', [('room_preferences', 'ix_room_preferences_available_room')],
+         _open_preferences_query().where(RoomPreference.available_room_id.in_(room_ids))),
+        ('matching: preferences of one user', [('room_preferences', 'ix_room_preferences_user_rooms')],
+         _open_preferences_query().where(RoomPreference.user_id == user_id)),
+        ('inbox rebuild: invites per owner', [('room_preferences', 'ix_room_preferences_user_rooms'),
+                                              ('swap_requests', 'ix_swap_requests_preference_status')],
+         select(RoomPreference.user_id, func.count())
+         .join(SwapRequest, SwapRequest.preference_id == RoomPreference.id)
+         .where(pending, RoomPreference.user_id.in_([user_id, user_id + 1])).group_by(RoomPreference.user_id)),
+        ('inbox rebuild: sent per requester', [('swap_requests', 'ix_swap_requests_requester_status')],
+         select(SwapRequest.requester_id, func.count())
+         .where(pending, SwapRequest.requester_id.in_([user_id, user_id + 1])).group_by(SwapRequest.requester_id)),
+        ('rooms: rooms by number', [('rooms', None)],
+         select(Room.number, Room.id).where(Room.number.in_(rooms))),
+        ('dashboard: free places on a floor', [('rooms', 'ix_rooms_floor'), ('users', 'ix_users_room_id')],
+         select(Room, occupants()).where(or_(Room.id.in_(room_ids), Room.floor.in_([2])), Room.capacity.isnot(None),
+                                         occupants() < Room.capacity).order_by(Room.number).limit(20)),
+        ('move_in: occupants of a room', [('users', 'ix_users_room_id')],
+         select(func.count()).where(User.room_id == room_ids[0])),
+        ('mail queue: due messages', [('mail_outbox', 'ix_mail_outbox_status_due')],
+         select(OutboxMessage.id).where(OutboxMessage.status.in_(('pending', 'sending')),
+                                        OutboxMessage.next_attempt_at <= datetime(2030, 1, 1))
+         .order_by(OutboxMessage.next_attempt_at).limit(20)),
+        ('mail queue: claimed batch', [('mail_outbox', 'ix_mail_outbox_claim')],
+         select(OutboxMessage).where(OutboxMessage.claim_token == 'abc', OutboxMessage.status == 'sending')),
+    ]
+
+
+def _explain(conn, statement):
+    """Run statement once to capture the SQL the driver sees, then EXPLAIN exactly that."""
+    captured = []
+
+    def capture(connection, cursor, sql, parameters, context, executemany):
+        captured.append((sql, parameters))
+
+    event.listen(conn, 'before_cursor_execute', capture)
+    try:
+        conn.execute(statement).all()
+    finally:
+        event.remove(conn, 'before_cursor_execute', capture)
+    sql, parameters = captured[-1]
+    prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN (FORMAT JSON) '
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(prefix + sql, parameters)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def sqlite_access(rows):
+    """{table: [plan details]} from EXPLAIN QUERY PLAN rows."""
+    access = {}
+    for _, _, _, detail in rows:
+        words = detail.split()
+        if len(words) >= 2 and words[0] in ('SCAN', 'SEARCH'):
+            access.setdefault(words[1], []).append(detail)
+    return access
+
+
+def check_sqlite(rows, table, index):
+    details = sqlite_access(rows).get(table)
+    if not details:
+        return f'{table} not in plan'
+    for detail in details:
+        if 'USING' not in detail:
+            return f'full scan: {detail}'
+    if index and not any(f'INDEX {index} ' in detail + ' ' for detail in details):
+        return f'expected {index}: {"; ".join(details)}'
+    return None
+
+
+def _pg_nodes(node):
+    yield node
+    for child in node.get('Plans', ()):
+        yield from _pg_nodes(child)
+
+
+def check_postgres(rows, table, index):
+    plan = rows[0][0]
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    scans = [node for node in _pg_nodes(plan[0]['Plan']) if node.get('Relation Name') == table]
+    if not scans:
+        return f'{table} not in plan'
+    used = set()
+    for node in scans:
+        if node['Node Type'] == 'Seq Scan':
+            return f'sequential scan on {table}'
+        used.update(child['Index Name'] for child in _pg_nodes(node) if 'Index Name' in child)
+    if index and index not in used:
+        return f'expected {index}, used {", ".join(sorted(used)) or "no index"}'
+    return None
+
+
+def check_hot_queries(conn):
+    """Yield (name, problems, plan rows) for each hot query; conn is left with seq scans off on PostgreSQL."""
+    dialect = conn.dialect.name
+    check = check_sqlite if dialect == 'sqlite' else check_postgres
+    conn.execute(text('ANALYZE'))
+    if dialect == 'postgresql':
+        conn.execute(text('SET LOCAL enable_seqscan = off'))
+    pref_id = conn.scalar(select(func.min(RoomPreference.id)))
+    rooms = ['101', '205', '333']
+    room_ids = conn.scalars(select(Room.id).where(Room.number.in_(rooms))).all()
+    for name, expectations, statement in hot_queries(2, pref_id, rooms, room_ids):
+        rows = _explain(conn, statement)
+        yield name, [problem for table, index in expectations if (problem := check(rows, table, index))], rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Assert that hot queries use their indexes.')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('-v', '--verbose', action='store_true', help='print every plan')
+    args = parser.parse_args()
+
+    app.config['MAIL_QUEUE_WORKERS'] = 0
+    failures = total = 0
+    with app.app_context():
+        seed_hostel(args.users)
+        engine = db.engine
+        dialect = engine.dialect.name
+        with engine.connect() as conn:
+            for name, problems, rows in check_hot_queries(conn):
+                failures += bool(problems)
+                total += 1
+                print(f"{'FAIL' if problems else 'ok  '} {name}" + ''.join(f'\n     {p}' for p in problems))
+                if args.verbose or problems:
+                    for row in rows:
+                        print(f'       {row[-1] if dialect == "sqlite" else json.dumps(row[0])[:2000]}')
+            conn.rollback()
+    print(f"\n{dialect}: {failures} of {total} queries failed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
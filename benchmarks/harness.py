@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Benchmark every route and Socket.IO event in app.py.
+
+Seeds a synthetic hostel into DATABASE_URL (the database is wiped first),
+then drives each endpoint and reports p50/p95/p99 latency, throughput and
+SQL queries per request. Results are written as JSON so two runs can be
+diffed:
+
+    DATABASE_URL=sqlite:////tmp/bench.db python benchmarks/harness.py --users 5000 -o before.json
+    ... change code ...
+    DATABASE_URL=sqlite:////tmp/bench.db python benchmarks/harness.py --users 5000 -o after.json --compare before.json
+
+By default requests go through the Flask test client in-process, one at a
+time, so query counts are exact. To measure a real server, seed with
+--seed-only, start the server against the same database, e.g.
+
+    gunicorn --worker-class eventlet -w 1 --bind 127.0.0.1:5000 app:app
+
+and pass --server http://127.0.0.1:5000 --concurrency 32. Server mode drives
+the HTTP routes over real sockets; start the server with
+METRICS_DEBUG_HEADER=1 METRICS_SAMPLE_RATE=1 to get query counts from its
+X-Query-Count header (and RATE_LIMIT_BACKEND=none, since the write routes
+are rate limited).
+"""
+
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, func  # noqa: E402
+
+from app import app, socketio, serializer  # noqa: E402
+from models import db, User, RoomPreference, SwapRequest  # noqa: E402
+from seed import SEED_PASSWORD, college_id, room_for, seed_hostel  # noqa: E402
+
+ACTORS = 20
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, errors, elapsed, queries=None):
+    result = {
+        'count': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+    }
+    if queries:
+        result['queries_mean'] = round(statistics.fmean(queries), 2)
+        result['queries_max'] = max(queries)
+    return result
+
+
+# ---------------------------------------------------------------------------
+# In-process mode
+# ---------------------------------------------------------------------------
+
+class Context:
+    """Seeded ids the scenarios draw from, plus factories for logged-in clients."""
+
+    def __init__(self, users):
+        self.users = users
+        self.rng = random.Random(3)
+        self.pref_ids = [pref_id for (pref_id,) in db.session.query(RoomPreference.id)]
+        self.next_user = users
+        # Same hash as the seeded rows, so logging in never has to upgrade it
+        self.password_hash = db.session.query(User.password).limit(1).scalar()
+
+    def client(self, user_id=None):
+        client = app.test_client()
+        if user_id is not None:
+            with client.session_transaction() as session:
+                session['_user_id'] = str(user_id)
+                session['_fresh'] = True
+        return client
+
+    def actor(self, i):
+        return self.client(i % ACTORS + 1)
+
+    def new_user(self):
+        """Insert a fresh user outside the timed section; returns its id."""
+        index = self.next_user
+        self.next_user += 1
+        user = User(name=f'Student {index:06d}', college_id=college_id(index), password=self.password_hash,
+                    email=f'student{index}@example.com', room_number=room_for(index))
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+    def pending_request(self, owner_id, requester_id):
+        owner_room, requester_room = (db.session.get(User, owner_id).room_number,
+                                      db.session.get(User, requester_id).room_number)
+        pref = RoomPreference(user_id=owner_id, available=owner_room, needed=requester_room)
+        db.session.add(pref)
+        db.session.flush()
+        req = SwapRequest(preference_id=pref.id, requester_id=requester_id, status='pending',
+                          from_room_number=requester_room, to_room_number=owner_room)
+        db.session.add(req)
+        db.session.commit()
+        return req.id
+
+
+def http_scenarios(ctx):
+    """(name, prepare(i) -> arg, call(arg) -> response) for every HTTP route."""
+    rng = ctx.rng
+    anon = ctx.client()
+
+    def get(path, client_for=ctx.actor):
+        return lambda i: (client_for(i), path), lambda arg: arg[0].get(arg[1])
+
+    def actor_post(path_for, data_for=lambda i: None):
+        return (lambda i: (ctx.actor(i), path_for(i), data_for(i)),
+                lambda arg: arg[0].post(arg[1], data=arg[2]))
+
+    def owner_action(action):
+        def prepare(i):
+            owner = ctx.actor(i)
+            owner_id = i % ACTORS + 1
+            return owner, f'/{action}/{ctx.pending_request(owner_id, ctx.new_user())}'
+        return prepare, lambda arg: arg[0].post(arg[1])
+
+    def commit_pair(i):
+        owner_id, requester_id = ctx.new_user(), ctx.new_user()
+        return ctx.client(owner_id), f'/commit_request/{ctx.pending_request(owner_id, requester_id)}'
+
+    def cancel_prepare(i):
+        requester_id = i % ACTORS + 1
+        return ctx.actor(i), f'/cancel/{ctx.pending_request(ctx.new_user(), requester_id)}'
+
+    def delete_pref_prepare(i):
+        user_id = i % ACTORS + 1
+        pref = RoomPreference(user_id=user_id, available=room_for(user_id - 1), needed='999')
+        db.session.add(pref)
+        db.session.commit()
+        return ctx.actor(i), f'/delete/{pref.id}'
+
+    def register_data(i):
+        index = 900000 + i
+        return {'name': f'Registrant {index}', 'college_id': f'RB{index:06d}',
+                'email': f'registrant{index}@example.com', 'room_number': '101', 'password': 'pw'}
+
+    def reset_token(i):
+        return anon, f"/reset-password/{serializer.dumps(f'student{i}@example.com', salt='reset-password')}"
+
+    return [
+        ('GET /', *get('/', lambda i: anon)),
+        ('GET /login', *get('/login', lambda i: anon)),
+        ('POST /login', lambda i: (ctx.client(), {'college_id': college_id(i % ctx.users), 'password': SEED_PASSWORD}),
+         lambda arg: arg[0].post('/login', data=arg[1])),
+        ('GET /register', *get('/register', lambda i: anon)),
+        ('POST /register', lambda i: (ctx.client(), register_data(i)),
+         lambda arg: arg[0].post('/register', data=arg[1])),
+        ('GET /forgot-password', *get('/forgot-password', lambda i: anon)),
+        ('POST /forgot-password', lambda i: (anon, {'email': f'student{i % ctx.users}@example.com'}),
+         lambda arg: arg[0].post('/forgot-password', data=arg[1])),
+        ('GET /reset-password/<token>', reset_token, lambda arg: arg[0].get(arg[1])),
+        ('GET /dashboard', *get('/dashboard')),
+        ('GET /dashboard?search_needed', *get('/dashboard?search_needed=1')),
+        ('POST /dashboard', *actor_post(lambda i: '/dashboard', lambda i: {
+            'available': room_for(i % ACTORS), 'needed': room_for(rng.randrange(ctx.users))})),
+        ('GET /all_users', *get('/all_users')),
+        ('GET /all_users?search_room', *get('/all_users?search_room=1')),
+        ('GET /api/users', *get('/api/users')),
+        ('GET /stats/user_cache', *get('/stats/user_cache')),
+        ('GET /available_rooms', *get('/available_rooms')),
+        ('GET /my_requests', *get('/my_requests')),
+        ('GET /invitations', *get('/invitations')),
+        ('GET /api/swap_requests/changes', *get('/api/swap_requests/changes?since=0')),
+        ('GET /accept/<pref_id>', lambda i: (ctx.actor(i), f'/accept/{rng.choice(ctx.pref_ids)}'),
+         lambda arg: arg[0].get(arg[1])),
+        ('POST /commit_request/<req_id>', commit_pair, lambda arg: arg[0].post(arg[1])),
+        ('POST /reject_request/<req_id>', *owner_action('reject_request')),
+        ('POST /send_direct_request/<user_id>', *actor_post(
+            lambda i: f'/send_direct_request/{rng.randrange(ACTORS + 1, ctx.users)}')),
+        ('POST /cancel/<req_id>', cancel_prepare, lambda arg: arg[0].post(arg[1])),
+        ('GET /delete/<pref_id>', delete_pref_prepare, lambda arg: arg[0].get(arg[1])),
+        ('POST /delete_account', lambda i: ctx.client(ctx.new_user()), lambda c: c.post('/delete_account')),
+        ('GET /logout', lambda i: ctx.client(ctx.new_user()), lambda c: c.get('/logout')),
+        ('GET /swap_history', *get('/swap_history')),
+        ('GET /profile', *get('/profile')),
+        ('GET /edit_profile', *get('/edit_profile')),
+        ('POST /edit_profile', lambda i: (ctx.actor(i), i % ACTORS), lambda arg: arg[0].post('/edit_profile', data={
+            'name': f'Student {arg[1]:06d}', 'room_number': room_for(arg[1]),
+            'email': f'student{arg[1]}@example.com'})),
+        ('POST /toggle_swap_availability', *actor_post(lambda i: '/toggle_swap_availability')),
+    ]
+
+
+def socket_scenarios(ctx):
+    def connected(i):
+        return socketio.test_client(app, flask_test_client=ctx.actor(i))
+
+    def emit(event_name, payload):
+        return connected, lambda client: client.emit(event_name, payload)
+
+    return [
+        ('SOCKET connect', lambda i: ctx.actor(i),
+         lambda http: socketio.test_client(app, flask_test_client=http).disconnect()),
+        ('SOCKET subscribe_floor', *emit('subscribe_floor', {})),
+    ]
+
+
+def run_in_process(iterations, warmup, only):
+    counter = QueryCounter()
+    results = {}
+    with app.app_context():
+        engine = db.engine
+        ctx = Context(db.session.scalar(func.count(User.id).select()))
+    event.listen(engine, 'before_cursor_execute', counter)
+    for name, prepare, call in http_scenarios(ctx) + socket_scenarios(ctx):
+        if only and not any(part in name for part in only):
+            continue
+        latencies, queries, errors = [], [], 0
+        for i in range(warmup + iterations):
+            # Setup runs in its own app context; the timed call gets a fresh one per request
+            with app.app_context():
+                arg = prepare(i)
+            counter.count = 0
+            started = time.perf_counter()
+            response = call(arg)
+            elapsed = time.perf_counter() - started
+            if getattr(response, 'status_code', 200) >= 500:
+                errors += 1
+            if i >= warmup:
+                latencies.append(elapsed)
+                queries.append(counter.count)
+        results[name] = summarize(latencies, errors, sum(latencies), queries)
+        print_row(name, results[name])
+    event.remove(engine, 'before_cursor_execute', counter)
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Real-server mode
+# ---------------------------------------------------------------------------
+
+SERVER_ROUTES = ['/', '/login', '/register', '/dashboard', '/all_users', '/all_users?search_room=1',
+                 '/api/users', '/my_requests', '/invitations', '/swap_history', '/profile', '/edit_profile']
+
+
+def _opener(base, user_index):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    data = urllib.parse.urlencode({'college_id': college_id(user_index), 'password': SEED_PASSWORD}).encode()
+    opener.open(base + '/login', data=data, timeout=30).read()
+    return opener
+
+
+def run_against_server(base, iterations, concurrency, users, only):
+    openers = [_opener(base, i % users) for i in range(concurrency)]
+    results = {}
+    for path in SERVER_ROUTES:
+        name = f'GET {path}'
+        if only and not any(part in name for part in only):
+            continue
+        latencies, queries, errors, lock = [], [], [0], threading.Lock()
+        remaining = [iterations]
+
+        def worker(opener):
+            while True:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                started = time.perf_counter()
+                try:
+                    with opener.open(base + path, timeout=30) as response:
+                        response.read()
+                        count = response.headers.get('X-Query-Count')
+                except (urllib.error.URLError, OSError):
+                    with lock:
+                        errors[0] += 1
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - started)
+                    if count is not None:
+                        queries.append(int(count))
+
+        threads = [threading.Thread(target=worker, args=(opener,)) for opener in openers]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        results[name] = summarize(latencies or [0.0], errors[0], time.perf_counter() - started, queries)
+        print_row(name, results[name])
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Reporting
+# ---------------------------------------------------------------------------
+
+def print_row(name, row):
+    queries = row.get('queries_mean')
+    print(f"{name:<40} p50 {row['p50_ms']:>8.2f}ms  p95 {row['p95_ms']:>8.2f}ms  p99 {row['p99_ms']:>8.2f}ms  "
+          f"{row['throughput_rps'] or 0:>8.1f} rps  queries {'-' if queries is None else queries:>6}"
+          f"{'  errors ' + str(row['errors']) if row['errors'] else ''}")
+
+
+def compare(old, new):
+    print(f"\n{'endpoint':<40} {'p95 before':>11} {'p95 after':>10} {'change':>8} {'queries':>16}")
+    for name, row in new['endpoints'].items():
+        before = old['endpoints'].get(name)
+        if not before:
+            continue
+        change = (row['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0.0
+        queries = f"{before.get('queries_mean', '-')} -> {row.get('queries_mean', '-')}"
+        print(f"{name:<40} {before['p95_ms']:>9.2f}ms {row['p95_ms']:>8.2f}ms {change:>+7.1f}% {queries:>16}")
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every route and Socket.IO event.')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--prefs-per-user', type=int, default=1)
+    parser.add_argument('--requests-per-user', type=int, default=2)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--only', nargs='*', help='run endpoints whose name contains any of these strings')
+    parser.add_argument('--server', help='base URL of a running server to benchmark instead of the test client')
+    parser.add_argument('--concurrency', type=int, default=16, help='client threads in --server mode')
+    parser.add_argument('--no-seed', action='store_true', help='reuse the data already in the database')
+    parser.add_argument('--seed-only', action='store_true')
+    parser.add_argument('-o', '--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='JSON file from an earlier run to diff against')
+    args = parser.parse_args()
+
+    # Mail goes to the outbox only; nothing should talk to SMTP during a benchmark
+    app.config['MAIL_QUEUE_WORKERS'] = 0
+    # A handful of actors repeat each write far past any per-user limit
+    app.extensions['rate_limiter'].backend = None
+    app.extensions['mail_queue'].workers = 0
+    app.logger.disabled = True
+
+    with app.app_context():
+        if not args.no_seed:
+            counts = seed_hostel(args.users, args.prefs_per_user, args.requests_per_user)
+            print(f"Seeded {counts}")
+        dialect = db.engine.dialect.name
+    if args.seed_only:
+        return
+
+    if args.server:
+        endpoints = run_against_server(args.server.rstrip('/'), args.iterations, args.concurrency,
+                                       args.users, args.only)
+    else:
+        endpoints = run_in_process(args.iterations, args.warmup, args.only)
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'mode': 'server' if args.server else 'test_client',
+            'dialect': dialect,
+            'users': args.users,
+            'prefs_per_user': args.prefs_per_user,
+            'requests_per_user': args.requests_per_user,
+            'iterations': args.iterations,
+            'concurrency': args.concurrency if args.server else 1,
+        },
+        'endpoints': endpoints,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"\nWrote {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Login throughput, and latency of other routes, during a burst of logins.
+
+Starts the app on a local threaded server, seeds a small hostel into
+DATABASE_URL (wiped first), then for each PASSWORD_HASH_WORKERS setting
+fires a burst of concurrent POST /login while probe clients keep requesting
+GET /dashboard. Probe latency is also measured with no burst as a baseline:
+
+    DATABASE_URL=sqlite:////tmp/login.db python benchmarks/login_burst.py --workers 1 2 64
+
+A pool as large as the burst behaves like hashing on every request thread,
+which is what happens without a bound. scrypt at the default cost needs
+32 MB per hash in flight, so the bound caps memory as well as CPU.
+"""
+
+import argparse
+import http.cookiejar
+import logging
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import make_server  # noqa: E402
+
+from app import app  # noqa: E402
+from credentials import PasswordHasher  # noqa: E402
+from harness import print_row, summarize  # noqa: E402
+from seed import SEED_PASSWORD, college_id, seed_hostel  # noqa: E402
+
+PROBE_PATH = '/dashboard'
+
+
+def _opener():
+    return urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+
+def _login(opener, base, index):
+    data = urllib.parse.urlencode({'college_id': college_id(index), 'password': SEED_PASSWORD}).encode()
+    with opener.open(base + '/login', data=data, timeout=60) as response:
+        response.read()
+
+
+def probe(base, openers, stop):
+    """Request PROBE_PATH from each opener in a loop until stop is set; returns latencies."""
+    latencies, lock = [], threading.Lock()
+
+    def worker(opener):
+        while not stop.is_set():
+            started = time.perf_counter()
+            with opener.open(base + PROBE_PATH, timeout=60) as response:
+                response.read()
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=worker, args=(opener,)) for opener in openers]
+    for thread in threads:
+        thread.start()
+    return threads, latencies
+
+
+def burst(base, logins, concurrency, users):
+    """Run `logins` POST /login over `concurrency` clients; returns (latencies, rejected, elapsed)."""
+    latencies, rejected, lock = [], [0], threading.Lock()
+    remaining = [logins]
+
+    def worker():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+                index = remaining[0] % users
+            started = time.perf_counter()
+            try:
+                _login(_opener(), base, index)
+            except urllib.error.HTTPError as e:
+                if e.code != 503:
+                    raise
+                with lock:
+                    rejected[0] += 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, rejected[0], time.perf_counter() - started
+
+
+def measure_probes(base, openers, seconds):
+    stop = threading.Event()
+    threads, latencies = probe(base, openers, stop)
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure a burst of concurrent logins.')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--probes', type=int, default=4, help='clients requesting other routes meanwhile')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 64],
+                        help='PASSWORD_HASH_WORKERS settings to compare')
+    args = parser.parse_args()
+
+    app.config['MAIL_QUEUE_WORKERS'] = 0
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    with app.app_context():
+        seed_hostel(args.users)
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}'
+    method = app.config['PASSWORD_HASH_METHOD']
+    queue = max(args.concurrency, app.config['PASSWORD_HASH_QUEUE'])
+
+    openers = [_opener() for _ in range(args.probes)]
+    for i, opener in enumerate(openers):
+        _login(opener, base, i)
+    started = time.perf_counter()
+    idle = measure_probes(base, openers, 3)
+    print_row(f'GET {PROBE_PATH} (no burst)', summarize(idle, 0, time.perf_counter() - started))
+
+    try:
+        for workers in args.workers:
+            app.extensions['password_hasher'] = PasswordHasher(method, workers=workers, max_waiting=queue)
+            stop = threading.Event()
+            threads, probes = probe(base, openers, stop)
+            latencies, rejected, elapsed = burst(base, args.logins, args.concurrency, args.users)
+            stop.set()
+            for thread in threads:
+                thread.join()
+            print(f'\nPASSWORD_HASH_WORKERS={workers}, {args.concurrency} concurrent logins')
+            print_row('POST /login', summarize(latencies or [0.0], rejected, elapsed))
+            print_row(f'GET {PROBE_PATH}', summarize(probes or [0.0], 0, elapsed))
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Memory footprint and lookup latency of the dashboard's room index.
+
+Builds a RoomIndex from synthetic preferences (no database needed) and
+reports:
+
+    build    time to add every preference, as a worker's first build pays it
+    memory   traced allocations of the index, next to the same rows held as
+             RoomPreference objects, which is what caching the query would cost
+    rank     latency of ranking every reciprocal match for random users
+
+    python benchmarks/room_index.py --prefs 100000 --rooms 5000
+
+A share of the preferences (--any) accept any room, like the ones
+send_direct_request() creates, and another (--floor) any room on one floor.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import RoomPreference  # noqa: E402
+from room_index import RoomIndex, WILDCARD_ROOM  # noqa: E402
+
+
+def synthetic_rows(prefs, rooms, any_share, floor_share, seed):
+    rng = random.Random(seed)
+    users = max(prefs * 4 // 5, 1)
+    room_numbers = [f'{100 + i:03d}' for i in range(rooms)]
+    rows = []
+    for pref_id in range(1, prefs + 1):
+        user_id = rng.randrange(1, users + 1)
+        # Each user holds one room; strings come from str() like database rows, not shared literals
+        available = str(room_numbers[user_id % rooms])
+        draw = rng.random()
+        if draw < any_share:
+            needed = WILDCARD_ROOM
+        elif draw < any_share + floor_share:
+            needed = f'FLOOR {rng.choice(room_numbers)[0]}'
+        else:
+            needed = str(rng.choice(room_numbers))
+        rows.append((pref_id, user_id, available, needed))
+    return rows, room_numbers
+
+
+def traced(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, size
+
+
+def build_index(rows):
+    index = RoomIndex()
+    for row in rows:
+        index.add(*row)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the room index at a given size.')
+    parser.add_argument('--prefs', type=int, default=100000)
+    parser.add_argument('--rooms', type=int, default=5000)
+    parser.add_argument('--any', type=float, default=0.1, help='share of preferences needing any room')
+    parser.add_argument('--floor', type=float, default=0.0, help='share of preferences needing any room on a floor')
+    parser.add_argument('--lookups', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rows, room_numbers = synthetic_rows(args.prefs, args.rooms, args.any, args.floor, args.seed)
+    # Built untraced first for the timing, since tracing slows allocation down
+    started = time.perf_counter()
+    index = build_index(rows)
+    build = time.perf_counter() - started
+    _, index_bytes = traced(lambda: build_index(rows))
+    orm_rows, orm_bytes = traced(lambda: [
+        RoomPreference(id=pref_id, user_id=user_id, available=available, needed=needed, selected=False)
+        for pref_id, user_id, available, needed in rows
+    ])
+    del orm_rows
+
+    rng = random.Random(args.seed)
+    owners = {user_id: available for _, user_id, available, _ in rows}
+    users = list(owners)
+    timings, matches = [], []
+    for _ in range(args.lookups):
+        user_id = rng.choice(users)
+        started = time.perf_counter()
+        ranked = index.rank(user_id, owners[user_id])
+        timings.append(time.perf_counter() - started)
+        matches.append(len(ranked))
+    timings.sort()
+
+    print(f"{len(index)} preferences, {len(room_numbers)} rooms, {len(users)} users")
+    print(f"build   {build * 1000:8.1f}ms")
+    print(f"memory  index {index_bytes / 2**20:6.1f}MiB ({index_bytes / len(index):.0f}B per preference, "
+          f"memory_bytes() {index.memory_bytes() / 2**20:.1f}MiB)  "
+          f"ORM objects {orm_bytes / 2**20:6.1f}MiB ({orm_bytes / len(rows):.0f}B per preference)")
+    print(f"rank    p50 {timings[len(timings) // 2] * 1e6:7.1f}us  p99 {timings[len(timings) * 99 // 100] * 1e6:7.1f}us"
+          f"  max {timings[-1] * 1e6:7.1f}us  matches per user {statistics.mean(matches):.1f} mean, {max(matches)} max")
+
+
+if __name__ == '__main__':
+    main()
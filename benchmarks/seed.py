@@ -0,0 +1,84 @@
+"""
+Seed a synthetic hostel for benchmarks.
+
+Rooms are three-digit numbers like the ones register() accepts; with more
+users than rooms, rooms are shared the way double rooms are in practice.
+Rows are bulk-inserted, so they carry their room ids (see rooms.py).
+Every seeded user's password is SEED_PASSWORD (hashed once and shared by
+all rows) and college ids run SB000000, SB000001, ...
+"""
+
+import random
+from datetime import datetime, timedelta, timezone
+
+from credentials import hash_password
+from models import db, User, RoomPreference, SwapRequest
+from rooms import room_ids
+import inbox
+import migrate
+
+SEED_PASSWORD = 'bench-password'
+BATCH_SIZE = 5000
+
+
+def college_id(index):
+    return f'SB{index:06d}'
+
+
+def room_for(index):
+    return f'{100 + index % 900:03d}'
+
+
+def _insert(table, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(table.insert(), rows[start:start + BATCH_SIZE])
+
+
+def seed_hostel(users=1000, prefs_per_user=1, requests_per_user=2, seed=1):
+    """Wipe the database and fill it with a synthetic hostel; returns the counts inserted."""
+    rng = random.Random(seed)
+    db.session.remove()
+    migrate.reset(db.engine, log=lambda message: None)
+
+    password = hash_password(SEED_PASSWORD)
+    rooms = room_ids(db.session, {room_for(i) for i in range(users)})
+    _insert(User.__table__, [
+        {'name': f'Student {i:06d}', 'college_id': college_id(i), 'password': password,
+         'email': f'student{i}@example.com', 'room_number': room_for(i), 'room_id': rooms[room_for(i)],
+         'is_looking_to_swap': rng.random() < 0.8}
+        for i in range(users)
+    ])
+
+    prefs = []
+    for i in range(users):
+        for _ in range(prefs_per_user):
+            needed = room_for(rng.randrange(users))
+            prefs.append({'user_id': i + 1, 'available': room_for(i), 'available_room_id': rooms[room_for(i)],
+                          'needed': needed, 'needed_room_id': rooms[needed], 'selected': False})
+    _insert(RoomPreference.__table__, prefs)
+
+    requests = []
+    pending = set()
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    if prefs:
+        for i in range(users):
+            for _ in range(requests_per_user):
+                pref_index = rng.randrange(len(prefs))
+                pref = prefs[pref_index]
+                if pref['user_id'] == i + 1:
+                    continue
+                status = rng.choice(('pending', 'pending', 'rejected', 'committed'))
+                if status == 'pending':
+                    # Only one pending request per (preference, requester) is allowed
+                    if (pref_index, i) in pending:
+                        continue
+                    pending.add((pref_index, i))
+                # Resolved over the past year, so archive.py has something to move
+                resolved_at = None if status == 'pending' else now - timedelta(days=rng.uniform(0, 365))
+                requests.append({'preference_id': pref_index + 1, 'requester_id': i + 1, 'status': status,
+                                 'from_room_number': room_for(i), 'to_room_number': pref['available'],
+                                 'resolved_at': resolved_at})
+    _insert(SwapRequest.__table__, requests)
+    db.session.commit()
+    inbox.rebuild()
+    return {'users': users, 'preferences': len(prefs), 'requests': len(requests)}
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+The eventlet worker side by side with the asyncio (ASGI) server, thousands of sockets open.
+
+Seeds a synthetic hostel into DATABASE_URL (the database is wiped first),
+then for each mode and socket count starts a server, connects that many
+Socket.IO clients over websocket, one user each, and with all of them
+connected measures:
+
+    push    one user POSTs /send_direct_request, until the target's socket
+            receives the notification (the server emits to a user room)
+    pages   GETs of /dashboard, /all_users, /invitations and /swap_history
+            from --concurrency clients at once
+
+It reports the time to connect every socket, push and page p50/p95/p99,
+page throughput and the server's resident memory:
+
+    DATABASE_URL=sqlite:////tmp/serving.db python benchmarks/serving_modes.py --sockets 1000 2000 4000
+
+eventlet runs as in Procfile.alternatives (gunicorn --worker-class eventlet
+-w 1), asgi as `uvicorn asgi:application`. The clients need aiohttp; raise
+`ulimit -n` above twice the largest socket count. Point DATABASE_URL at
+PostgreSQL for numbers that mean something in production: on SQLite the
+eventlet worker blocks on every query, while asgi reads through aiosqlite.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp  # noqa: E402
+import socketio  # noqa: E402
+
+from factory import create_app  # noqa: E402
+from seed import seed_hostel  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = ('/dashboard', '/all_users', '/invitations', '/swap_history')
+CONNECT_BATCH = 100
+
+
+def server_command(mode, port, sockets):
+    if mode == 'eventlet':
+        return ['gunicorn', '--worker-class', 'eventlet', '-w', '1', '--bind', f'127.0.0.1:{port}',
+                '--worker-connections', str(sockets * 2 + 100), '--log-level', 'warning', 'app:app']
+    return [sys.executable, '-m', 'uvicorn', 'asgi:application', '--host', '127.0.0.1', '--port', str(port),
+            '--log-level', 'warning', '--no-access-log']
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def rss_mb(pid):
+    """Resident memory of a process and its children (Linux), or None."""
+    total, pids = 0, [pid]
+    while pids:
+        pid = pids.pop()
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+            with open(f'/proc/{pid}/task/{pid}/children') as f:
+                pids.extend(int(child) for child in f.read().split())
+        except (OSError, StopIteration):
+            return None
+    return total / 1024
+
+
+def percentiles(values):
+    values = sorted(values) or [0.0]
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))] * 1000  # noqa: E731
+    return statistics.median(values) * 1000, pick(0.95), pick(0.99)
+
+
+async def wait_for(base, proc):
+    async with aiohttp.ClientSession() as http:
+        for _ in range(300):
+            if proc.poll() is not None:
+                raise RuntimeError(f'server exited with {proc.returncode}')
+            try:
+                async with http.get(base + '/'):
+                    return
+            except aiohttp.ClientError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError('server did not start')
+
+
+async def connect_all(base, cookies):
+    """One connected client per cookie, and {user_id: future of its next notification}."""
+    waiting = {}
+    clients = []
+
+    async def connect(user_id, cookie):
+        client = socketio.AsyncClient(reconnection=False)
+
+        @client.on('swap_request_notification')
+        async def notified(data):
+            future = waiting.pop(user_id, None)
+            if future is not None and not future.done():
+                future.set_result(time.perf_counter())
+
+        await client.connect(base, headers={'Cookie': cookie}, transports=['websocket'])
+        clients.append((user_id, client))
+
+    items = list(cookies.items())
+    for start in range(0, len(items), CONNECT_BATCH):
+        await asyncio.gather(*(connect(user_id, cookie) for user_id, cookie in items[start:start + CONNECT_BATCH]))
+    return clients, waiting
+
+
+async def pushes(base, cookies, clients, waiting, count, rng):
+    """Latencies of count pushes, up to 50 at a time between random pairs of sockets.
+
+    Each pair is used once, since the server only notifies on a new request.
+    """
+    latencies = []
+    sent = set()
+    loop = asyncio.get_running_loop()
+
+    async def push(http, sender_id, target_id):
+        future = waiting[target_id] = loop.create_future()
+        started = time.perf_counter()
+        async with http.post(f'{base}/send_direct_request/{target_id}', headers={'Cookie': cookies[sender_id]},
+                             allow_redirects=False) as response:
+            await response.read()
+        try:
+            latencies.append(await asyncio.wait_for(future, 10) - started)
+        except asyncio.TimeoutError:
+            waiting.pop(target_id, None)
+
+    async with aiohttp.ClientSession() as http:
+        for start in range(0, count, 50):
+            batch = rng.sample(clients, min(100, len(clients)))
+            pairs = [(sender_id, target_id) for (sender_id, _), (target_id, _) in zip(batch[0::2], batch[1::2])
+                     if (sender_id, target_id) not in sent][:count - start]
+            sent.update(pairs)
+            await asyncio.gather(*(push(http, sender_id, target_id) for sender_id, target_id in pairs))
+    return latencies
+
+
+async def pages(base, cookies, requests, concurrency, rng):
+    latencies, errors = [], 0
+    user_ids = list(cookies)
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait((rng.choice(PAGES), rng.choice(user_ids)))
+
+    async def worker(http):
+        nonlocal errors
+        while not queue.empty():
+            path, user_id = queue.get_nowait()
+            started = time.perf_counter()
+            async with http.get(base + path, headers={'Cookie': cookies[user_id]}, allow_redirects=False) as response:
+                await response.read()
+                if response.status != 200:
+                    errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as http:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(http) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+async def run(mode, sockets, cookies, args):
+    port = free_port()
+    base = f'http://127.0.0.1:{port}'
+    env = dict(os.environ, SOCKETIO_ASYNC_MODE=mode, RATE_LIMIT_BACKEND='none', MAIL_QUEUE_WORKERS='0',
+               ROOM_INDEX_MAX_AGE='0', SOCKETIO_TRANSPORTS='websocket')
+    proc = subprocess.Popen(server_command(mode, port, sockets), cwd=ROOT, env=env)
+    rng = random.Random(1)
+    try:
+        await wait_for(base, proc)
+        started = time.perf_counter()
+        clients, waiting = await connect_all(base, dict(list(cookies.items())[:sockets]))
+        connected = time.perf_counter() - started
+        push_latencies = await pushes(base, cookies, clients, waiting, args.pushes, rng)
+        page_latencies, errors, elapsed = await pages(base, cookies, args.requests, args.concurrency, rng)
+        memory = rss_mb(proc.pid)
+        await asyncio.gather(*(client.disconnect() for _, client in clients))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    push = percentiles(push_latencies)
+    page = percentiles(page_latencies)
+    lost = args.pushes - len(push_latencies)
+    print(f"{mode:<9} {sockets:>7} {connected:>9.2f}s  push {push[0]:7.2f} {push[1]:7.2f} {push[2]:7.2f}ms"
+          f"{f' (lost {lost})' if lost else ''}  pages {page[0]:7.2f} {page[1]:7.2f} {page[2]:7.2f}ms "
+          f"{len(page_latencies) / elapsed:7.1f} rps{f' ({errors} errors)' if errors else ''}  "
+          f"rss {f'{memory:.0f}MB' if memory else '-'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the eventlet and asgi serving modes under many sockets.')
+    parser.add_argument('--sockets', type=int, nargs='+', default=[1000, 2000, 4000])
+    parser.add_argument('--modes', nargs='+', choices=('eventlet', 'asgi'), default=['eventlet', 'asgi'])
+    parser.add_argument('--pushes', type=int, default=500)
+    parser.add_argument('--requests', type=int, default=1000, help='page GETs per run')
+    parser.add_argument('--concurrency', type=int, default=32, help='page GETs in flight')
+    args = parser.parse_args()
+
+    # The servers inherit the key, so they accept the sessions signed here
+    app = create_app(web=False, SECRET_KEY=os.environ.setdefault('SECRET_KEY', 'serving-benchmark'))
+    with app.app_context():
+        seed_hostel(max(args.sockets))
+    # Signed sessions stand in for logging in thousands of users
+    signer = app.session_interface.get_signing_serializer(app)
+    cookies = {user_id: 'session=' + signer.dumps({'_user_id': str(user_id), '_fresh': True})
+               for user_id in range(1, max(args.sockets) + 1)}
+
+    print(f"{'mode':<9} {'sockets':>7} {'connect':>10}  {'push p50/p95/p99':>30}  {'pages p50/p95/p99, rps':>36}")
+    for sockets in args.sockets:
+        for mode in args.modes:
+            asyncio.run(run(mode, sockets, cookies, args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Measure per-event Socket.IO delivery cost as the number of connected sockets grows.
+
+Targeted notifications (one per-user room) should stay flat; the old
+broadcast behaviour is measured alongside for comparison.
+
+    DATABASE_URL=sqlite:///:memory: python benchmarks/socket_fanout.py 500 1000 2000 4000
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, socketio  # noqa: E402
+from models import db, User  # noqa: E402
+from notifications import notify_user  # noqa: E402
+
+EVENTS = 200
+
+
+def connect_sockets(count):
+    with app.app_context():
+        existing = User.query.count()
+        for i in range(existing, count):
+            db.session.add(User(name=f'bench{i}', college_id=f'BN{i:06d}', password='x',
+                                email=f'bench{i}@example.com', room_number=f'{100 + i % 900}'))
+        db.session.commit()
+        user_ids = [user_id for (user_id,) in db.session.query(User.id).order_by(User.id).limit(count)]
+
+    clients = []
+    for user_id in user_ids:
+        http = app.test_client()
+        with http.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        clients.append(socketio.test_client(app, flask_test_client=http))
+    return user_ids, clients
+
+
+def time_per_event(emit):
+    started = time.perf_counter()
+    for i in range(EVENTS):
+        emit(i)
+    return (time.perf_counter() - started) / EVENTS * 1e6
+
+
+def main(sizes):
+    print(f"{'sockets':>8} {'targeted us/event':>18} {'broadcast us/event':>19}")
+    for size in sizes:
+        user_ids, clients = connect_sockets(size)
+        payload = {'message': 'bench'}
+        targeted = time_per_event(
+            lambda i: notify_user(socketio, user_ids[i % len(user_ids)], 'swap_request_notification', payload))
+        broadcast = time_per_event(lambda i: socketio.emit('swap_request_notification', payload))
+        print(f"{size:>8} {targeted:>18.1f} {broadcast:>19.1f}")
+        for client in clients:
+            client.disconnect()
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [250, 1000, 4000])
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Process startup cost of the web app and the CLI scripts.
+
+Each scenario runs in a fresh interpreter, --runs times, and reports:
+
+    import   importing the modules and building the app with create_app()
+    first    the first request (web) or first query (cli) after that
+    total    interpreter start to exit, as a worker or cron job pays it
+
+plus how many modules were loaded and which of the heavy optional ones.
+
+    DATABASE_URL=sqlite:////tmp/startup.db python benchmarks/startup.py --runs 10
+
+The database only has to be reachable; nothing is written. Run it on two
+checkouts to compare a change, or with -X importtime to find the cause of a
+regression:
+
+    python -X importtime -c 'import app' 2> import.log
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ('flask_socketio', 'engineio', 'flask_mail', 'flask_login', 'eventlet', 'gevent', 'redis')
+
+SCENARIOS = {
+    # What gunicorn does for app:app, then the first page a health check or user hits
+    'web': (
+        'import app',
+        'app.app.test_client().get("/login")',
+    ),
+    # What migrate.py, allocations.py, matching.py and friends do before their first query
+    'cli': (
+        'from factory import create_app\napp = create_app(web=False)',
+        'from sqlalchemy import text\nfrom models import db\n'
+        'with app.app_context():\n    db.session.execute(text("SELECT 1"))',
+    ),
+}
+
+CHILD = '''
+import json, sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+{setup}
+imported = time.perf_counter()
+{first}
+done = time.perf_counter()
+print(json.dumps({{'import': imported - started, 'first': done - imported, 'modules': len(sys.modules),
+                  'heavy': sorted(name for name in {heavy!r} if name in sys.modules)}}))
+'''
+
+
+def run_once(setup, first):
+    code = CHILD.format(root=ROOT, setup=setup, first=first, heavy=HEAVY)
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=ROOT)
+    total = time.perf_counter() - started
+    if result.returncode:
+        sys.exit(result.stderr)
+    row = json.loads(result.stdout.strip().splitlines()[-1])
+    row['total'] = total
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure import time and time to first request.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('scenarios', nargs='*', help=f"any of {', '.join(SCENARIOS)} (default all)")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario {', '.join(sorted(unknown))}")
+    args.scenarios = args.scenarios or sorted(SCENARIOS)
+
+    os.environ.setdefault('SECRET_KEY', 'startup-benchmark')
+    # Warm the bytecode cache so the first run isn't an outlier
+    run_once(*SCENARIOS[args.scenarios[0]])
+    for name in args.scenarios:
+        rows = [run_once(*SCENARIOS[name]) for _ in range(args.runs)]
+        timings = '  '.join(f"{key} {statistics.median(row[key] for row in rows) * 1000:>7.1f}ms"
+                            for key in ('import', 'first', 'total'))
+        print(f"{name:<4} {timings}  modules {rows[0]['modules']:>5}  loaded {', '.join(rows[0]['heavy']) or '-'}")
+
+
+if __name__ == '__main__':
+    main()
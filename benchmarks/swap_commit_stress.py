@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Concurrent swap-commit stress test.
+
+Seeds owners and requesters with heavily overlapping pending requests, then
+has many threads commit them at once through swaps.commit_swap(). Afterwards
+it checks that no room was duplicated or lost, nobody took part in more than
+one swap, and the inbox counters still match swap_requests.
+
+    DATABASE_URL=sqlite:////tmp/stress.db python benchmarks/swap_commit_stress.py --users 400 --threads 16
+    DATABASE_URL=postgresql://localhost/swap_stress python benchmarks/swap_commit_stress.py
+
+The target database is wiped first.
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+from models import db, Room, User, RoomPreference, SwapRequest, InboxSummary  # noqa: E402
+from rooms import room_ids  # noqa: E402
+import inbox  # noqa: E402
+import migrate  # noqa: E402
+import swaps  # noqa: E402
+
+
+def seed(users, requests_per_user):
+    db.session.remove()
+    migrate.reset(db.engine, log=lambda message: None)
+    rooms = room_ids(db.session, {f'{100 + i}' for i in range(users)})
+    db.session.execute(User.__table__.insert(), [
+        {'name': f'stress{i}', 'college_id': f'ST{i:06d}', 'password': 'x', 'email': f'stress{i}@example.com',
+         'room_number': f'{100 + i}', 'room_id': rooms[f'{100 + i}'], 'is_looking_to_swap': True}
+        for i in range(users)
+    ])
+    db.session.execute(RoomPreference.__table__.insert(), [
+        {'user_id': i + 1, 'available': f'{100 + i}', 'available_room_id': rooms[f'{100 + i}'],
+         'needed': 'ANY', 'selected': False}
+        for i in range(users)
+    ])
+    rng = random.Random(42)
+    rows = set()
+    for requester in range(users):
+        for owner in rng.sample(range(users), requests_per_user + 1):
+            if owner != requester:
+                rows.add((owner, requester))
+    rows = sorted(rows)[:users * requests_per_user]
+    db.session.execute(SwapRequest.__table__.insert(), [
+        {'preference_id': owner + 1, 'requester_id': requester + 1, 'status': 'pending',
+         'from_room_number': f'{100 + requester}', 'to_room_number': f'{100 + owner}'}
+        for owner, requester in rows
+    ])
+    db.session.commit()
+    inbox.rebuild()
+    return [(req_id, owner) for req_id, owner in
+            db.session.query(SwapRequest.id, RoomPreference.user_id).join(RoomPreference)]
+
+
+def worker(jobs, results, lock):
+    with app.app_context():
+        while True:
+            try:
+                req_id, owner_id = jobs.pop()
+            except IndexError:
+                return
+            result = swaps.commit_swap(req_id, owner_id)
+            with lock:
+                results[result] += 1
+            db.session.remove()
+
+
+def verify(users):
+    rooms = Counter(room for (room,) in db.session.query(User.room_number))
+    assert rooms == Counter(f'{100 + i}' for i in range(users)), 'rooms duplicated or lost'
+    numbers = dict(db.session.query(Room.id, Room.number))
+    assert all(numbers.get(room_id) == room for room, room_id in db.session.query(User.room_number, User.room_id)), \
+        'room ids out of step with room numbers'
+
+    committed = db.session.query(SwapRequest.requester_id, RoomPreference.user_id, SwapRequest.from_room_number,
+                                 SwapRequest.to_room_number).join(RoomPreference) \
+        .filter(SwapRequest.status == 'committed').all()
+    participants = Counter()
+    current = dict(db.session.query(User.id, User.room_number))
+    for requester_id, owner_id, from_room, to_room in committed:
+        participants.update((requester_id, owner_id))
+        assert current[requester_id] == to_room and current[owner_id] == from_room, 'swap not applied'
+    assert not [u for u, n in participants.items() if n > 1], 'user in more than one swap'
+
+    live = {s.user_id: (s.pending_invites, s.pending_sent, s.committed_swaps) for s in InboxSummary.query}
+    inbox.rebuild()
+    rebuilt = {s.user_id: (s.pending_invites, s.pending_sent, s.committed_swaps) for s in InboxSummary.query}
+    assert live == rebuilt, 'inbox counters drifted'
+    return len(committed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=400)
+    parser.add_argument('--requests-per-user', type=int, default=5)
+    parser.add_argument('--threads', type=int, default=16)
+    args = parser.parse_args()
+
+    with app.app_context():
+        jobs = seed(args.users, args.requests_per_user)
+    random.Random(7).shuffle(jobs)
+    attempts = len(jobs)
+    results, lock = Counter(), threading.Lock()
+    threads = [threading.Thread(target=worker, args=(jobs, results, lock)) for _ in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        committed = verify(args.users)
+        dialect = db.engine.dialect.name
+    print(f"{dialect}: {attempts} commit attempts by {args.threads} threads in {elapsed:.2f}s "
+          f"({attempts / elapsed:.0f}/s), {committed} swaps committed")
+    print('results:', dict(results))
+    print('invariants: OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -5,16 +5,86 @@ load_dotenv()  # Load variables from .env into environment
 
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY')
-    print(SECRET_KEY)
     # Database
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
-    print(SQLALCHEMY_DATABASE_URI)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Optional read-only replica for @read_replica views (see db_engine.py)
+    DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL')
+
+    # Connection pool: auto picks 'green' under gevent/eventlet workers, 'null' suits PgBouncer
+    DB_POOL_MODE = os.getenv('DB_POOL_MODE', 'auto')
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))  # seconds to wait for a free connection
+    DB_GREEN_POOL_TIMEOUT = float(os.getenv('DB_GREEN_POOL_TIMEOUT', 5))  # the same, in green pool mode
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))  # reopen connections older than this
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', '1') != '0'  # drop connections a restart killed
+    DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 15000))  # PostgreSQL; 0 disables
+    DB_LOCK_TIMEOUT_MS = int(os.getenv('DB_LOCK_TIMEOUT_MS', 5000))  # PostgreSQL; 0 disables
+    # Local SQLite: WAL lets readers run alongside a writer, busy_timeout waits out the write lock
+    SQLITE_WAL = os.getenv('SQLITE_WAL', '1') != '0'
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
 
     # Mail
     MAIL_SERVER = 'smtp.gmail.com'
     MAIL_PORT = 587
     MAIL_USE_TLS = True
     MAIL_USERNAME = os.getenv('MAIL_USERNAME')
-    print('MAIL_USERNAME',MAIL_USERNAME)
     MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
+
+    # Password hashing (see credentials.py); stronger cost settings apply as users next log in
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')  # werkzeug method string
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+    PASSWORD_HASH_QUEUE = int(os.getenv('PASSWORD_HASH_QUEUE', 32))  # waiting logins before 503s
+
+    # Rate limits on write endpoints (see throttle.py), as count/second|minute|hour|day token buckets
+    RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')  # memory, redis://..., none
+    RATE_LIMIT_WRITES_PER_USER = os.getenv('RATE_LIMIT_WRITES_PER_USER', '30/minute')
+    # Generous: a whole hostel can share one NAT address
+    RATE_LIMIT_WRITES_PER_IP = os.getenv('RATE_LIMIT_WRITES_PER_IP', '300/minute')
+    RATE_LIMIT_PASSWORD_RESET_PER_IP = os.getenv('RATE_LIMIT_PASSWORD_RESET_PER_IP', '10/hour')
+    RATE_LIMIT_PROXY_HOPS = int(os.getenv('RATE_LIMIT_PROXY_HOPS', 0))  # trusted proxies adding X-Forwarded-For
+
+    # Outbound mail queue (see mail_queue.py); 0 workers means run `python mail_queue.py` separately
+    MAIL_QUEUE_WORKERS = int(os.getenv('MAIL_QUEUE_WORKERS', 1))
+    MAIL_QUEUE_BATCH_SIZE = int(os.getenv('MAIL_QUEUE_BATCH_SIZE', 20))
+    MAIL_QUEUE_MAX_ATTEMPTS = int(os.getenv('MAIL_QUEUE_MAX_ATTEMPTS', 5))
+    MAIL_QUEUE_BACKOFF_SECONDS = int(os.getenv('MAIL_QUEUE_BACKOFF_SECONDS', 30))
+    MAIL_QUEUE_POLL_SECONDS = int(os.getenv('MAIL_QUEUE_POLL_SECONDS', 15))
+    MAIL_QUEUE_PER_RECIPIENT_HOURLY = int(os.getenv('MAIL_QUEUE_PER_RECIPIENT_HOURLY', 5))
+
+    # User loader cache (see user_cache.py); use a redis:// URL when running several workers
+    USER_CACHE_BACKEND = os.getenv('USER_CACHE_BACKEND', 'memory')
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 300))
+    USER_CACHE_MAX_ENTRIES = int(os.getenv('USER_CACHE_MAX_ENTRIES', 10000))
+
+    # Rendered-page cache and ETags (see render_cache.py); use a redis:// URL when running several workers
+    RENDER_CACHE_BACKEND = os.getenv('RENDER_CACHE_BACKEND', 'memory')
+    RENDER_CACHE_MAX_BYTES = int(os.getenv('RENDER_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    RENDER_CACHE_TTL = int(os.getenv('RENDER_CACHE_TTL', 60))  # memory backend only: pages and ETags
+
+    # Archival of resolved swap requests (see archive.py, run from cron)
+    ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 180))
+    ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', 1000))
+
+    # Dashboard compatibility index (see room_index.py): rebuilt this often to pick up other workers' writes
+    ROOM_INDEX_MAX_AGE = int(os.getenv('ROOM_INDEX_MAX_AGE', 60))  # 0: never, for a single worker
+
+    # Socket.IO server: threading, eventlet, gevent or asgi (set by asgi.py); unset picks eventlet on Railway
+    SOCKETIO_ASYNC_MODE = os.getenv('SOCKETIO_ASYNC_MODE')
+    # asgi mode (see asgi_server.py): threads for the views that don't run on the event loop
+    ASGI_THREADS = int(os.getenv('ASGI_THREADS', 32))
+    ASGI_ASYNC_VIEWS = os.getenv('ASGI_ASYNC_VIEWS', '1') != '0'  # 0: every view on the threads
+
+    # Socket.IO scaling: a shared queue lets several workers reach every socket
+    SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE')  # e.g. redis://localhost:6379/0
+    SOCKETIO_CHANNEL = os.getenv('SOCKETIO_CHANNEL', 'swap-my-room')
+    # 'websocket' alone avoids the need for sticky sessions behind a load balancer
+    SOCKETIO_TRANSPORTS = [t for t in os.getenv('SOCKETIO_TRANSPORTS', '').split(',') if t] or None
+
+    # Request instrumentation (see metrics.py)
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') != '0'
+    METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', 0.1))  # share of requests whose SQL is traced
+    METRICS_SLOW_QUERIES = int(os.getenv('METRICS_SLOW_QUERIES', 20))
+    METRICS_DEBUG_HEADER = os.getenv('METRICS_DEBUG_HEADER', '0') == '1'  # X-Query-Count / Server-Timing
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # bearer token required for /metrics when set
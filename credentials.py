@@ -0,0 +1,119 @@
+"""
+Password hashing off the request loop.
+
+Passwords are stored as werkzeug hashes ('scrypt:32768:8:1$salt$hash').
+PASSWORD_HASH_METHOD sets the algorithm and cost; raising it only affects
+new hashes, and older ones (including the plaintext passwords stored before
+hashing was introduced) are rehashed the next time their owner logs in.
+
+A hash costs tens of milliseconds of CPU. Under eventlet or gevent that
+would stall every greenlet and socket in the worker, so hashing runs on real
+OS threads: eventlet's tpool, gevent's hub threadpool, or a plain thread pool
+otherwise. hashlib releases the GIL while it works, so those threads run in
+parallel with request handling. PASSWORD_HASH_WORKERS bounds how many
+hashes run at once and PASSWORD_HASH_QUEUE how many may wait; past that,
+HasherBusy is raised and the request gets a 503 instead of piling up.
+"""
+
+import hmac
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from db_engine import green_runtime
+
+# Stored in place of a password nobody knows yet (bulk imports); never verifies
+UNUSABLE_PREFIX = '!'
+
+
+class HasherBusy(Exception):
+    """More password hashes are running and waiting than the pool allows."""
+
+
+def _runner(runtime, workers):
+    """Callable (fn, *args) -> result that runs fn on an OS thread."""
+    if runtime == 'eventlet':
+        from eventlet import tpool
+        return tpool.execute
+    if runtime == 'gevent':
+        from gevent import get_hub
+        return lambda fn, *args: get_hub().threadpool.apply(fn, args)
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+    return lambda fn, *args: executor.submit(fn, *args).result()
+
+
+def is_hashed(stored):
+    # werkzeug hashes are 'method$salt$hash'; anything else predates hashing
+    return stored.count('$') == 2 and stored.split('$', 1)[0].split(':', 1)[0] in ('scrypt', 'pbkdf2')
+
+
+class PasswordHasher:
+    def __init__(self, method='scrypt:32768:8:1', workers=2, max_waiting=32, runtime=None):
+        self.method = method
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(workers)
+        self._admitted = threading.BoundedSemaphore(workers + max_waiting)
+        self._run = _runner(runtime, workers)
+
+    def _offload(self, fn, *args):
+        if not self._admitted.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            with self._slots:
+                return self._run(fn, *args)
+        finally:
+            self._admitted.release()
+
+    def hash(self, password):
+        return self._offload(generate_password_hash, password, self.method)
+
+    def hash_many(self, passwords):
+        """Hash a batch in parallel; for offline jobs such as bulk imports, not request handlers."""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(lambda password: generate_password_hash(password, self.method), passwords))
+
+    def needs_rehash(self, stored):
+        return not is_hashed(stored) or not stored.startswith(self.method + '$')
+
+    def verify(self, stored, password):
+        """(matches, replacement hash or None) for a stored password."""
+        if not stored or stored.startswith(UNUSABLE_PREFIX):
+            return False, None
+        if is_hashed(stored):
+            matches = self._offload(check_password_hash, stored, password)
+        else:
+            matches = hmac.compare_digest(stored.encode(), password.encode())
+        if matches and self.needs_rehash(stored):
+            return True, self.hash(password)
+        return matches, None
+
+
+def unusable_password():
+    return UNUSABLE_PREFIX + secrets.token_urlsafe(16)
+
+
+def hash_password(password):
+    return current_app.extensions['password_hasher'].hash(password)
+
+
+def verify_password(stored, password):
+    return current_app.extensions['password_hasher'].verify(stored, password)
+
+
+def init_credentials(app):
+    hasher = PasswordHasher(
+        method=app.config.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1'),
+        workers=app.config.get('PASSWORD_HASH_WORKERS', 2),
+        max_waiting=app.config.get('PASSWORD_HASH_QUEUE', 32),
+        runtime=green_runtime(),
+    )
+    app.extensions['password_hasher'] = hasher
+
+    @app.errorhandler(HasherBusy)
+    def hasher_busy(error):
+        return 'Too many sign-ins at once, please retry shortly.', 503, {'Retry-After': '2'}
+
+    return hasher
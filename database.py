@@ -1,19 +1,11 @@
-from app import app
-from models import db, User, RoomPreference, SwapRequest
-from add_swap_availability import add_swap_availability_column
+from factory import create_app
+from models import db
+import migrate
 
 if __name__ == '__main__':
+    app = create_app(web=False)
     with app.app_context():
         print("Setting up database...")
-        db.reflect()
-        db.drop_all()
-        
-        # Create all tables
-        db.create_all()
-        print("✓ All tables created successfully!")
-        
-        # Add the swap availability column using the existing migration
-        add_swap_availability_column()
-        
-        print("✓ Database setup completed successfully!")
-        print("You can now run: python app.py")
\ No newline at end of file
+        applied = migrate.upgrade(db.engine)
+        print(f"✓ Applied {len(applied)} migrations" if applied else "✓ Database is already up to date")
+        print("You can now run: python app.py")
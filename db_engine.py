@@ -0,0 +1,311 @@
+"""
+Engine and connection pool configuration.
+
+Flask-SQLAlchemy's defaults (5 pooled connections, a 30 second checkout wait,
+no liveness check) suit a handful of OS threads. Under gevent or eventlet a
+single worker runs hundreds of greenlets, so requests queue for a connection
+until they time out, and connections killed by a Postgres restart are handed
+out until a query fails on them. Everything here is driven by DB_* settings
+in config.py:
+
+    DB_POOL_MODE=auto     queue pool; green pool when gevent/eventlet has patched threading
+    DB_POOL_MODE=queue    plain QueuePool sized by DB_POOL_SIZE + DB_MAX_OVERFLOW
+    DB_POOL_MODE=green    QueuePool handed out LIFO, psycopg2 made cooperative, short checkout wait
+    DB_POOL_MODE=null     no pooling in the app, for use behind PgBouncer
+
+Postgres connections get statement_timeout and lock_timeout; SQLite files get
+WAL journaling and a busy timeout so the web process and CLI scripts can write
+side by side.
+
+DATABASE_REPLICA_URL adds a read-only engine. Views decorated with
+@read_replica run their queries there; flushes, reads after the request's
+first flush and everything outside those views stay on the primary. Reads
+there may trail the primary by the replication lag, so only pages that
+tolerate slightly stale data use it.
+
+Served by asgi.py, code running on the event loop (in a greenlet_spawn()
+greenlet, see asgi_server.py) reaches the same databases through a second
+set of engines on the asyncio drivers, asyncpg or aiosqlite, so each query
+suspends only its own greenlet. RoutingSession picks them by itself; views
+opt in to running there with @async_reads.
+"""
+
+import logging
+from functools import wraps
+
+import sqlalchemy as sa
+from flask import current_app, g, has_app_context, jsonify, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy.engine import make_url
+from sqlalchemy.util.concurrency import in_greenlet
+
+logger = logging.getLogger(__name__)
+
+POOL_MODES = ('auto', 'queue', 'green', 'null')
+REPLICA_BIND = 'replica'
+ASYNC_DRIVERS = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite'}
+
+
+def green_runtime():
+    """'gevent' or 'eventlet' when that library has monkey-patched threading, else None."""
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched('threading'):
+            return 'gevent'
+    except ImportError:
+        pass
+    try:
+        from eventlet import patcher
+        if patcher.is_monkey_patched('thread'):
+            return 'eventlet'
+    except ImportError:
+        pass
+    return None
+
+
+def pool_mode(config):
+    mode = config.get('DB_POOL_MODE', 'auto')
+    if mode not in POOL_MODES:
+        raise ValueError(f'DB_POOL_MODE must be one of {", ".join(POOL_MODES)}, not {mode!r}')
+    if mode == 'auto':
+        return 'green' if green_runtime() else 'queue'
+    return mode
+
+
+def _is_sqlite_memory(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(config, url):
+    """Keyword arguments for create_engine() (SQLALCHEMY_ENGINE_OPTIONS) for this URL."""
+    url = make_url(url)
+    mode = pool_mode(config)
+    options = {}
+    if _is_sqlite_memory(url):
+        # Flask-SQLAlchemy pins in-memory databases to a single StaticPool connection
+        return options
+
+    if mode == 'null':
+        options['poolclass'] = sa.pool.NullPool
+    else:
+        options['pool_size'] = config['DB_POOL_SIZE']
+        options['max_overflow'] = config['DB_MAX_OVERFLOW']
+        options['pool_timeout'] = config['DB_POOL_TIMEOUT']
+        options['pool_recycle'] = config['DB_POOL_RECYCLE']
+        if mode == 'green':
+            # Reusing the most recent connection lets the idle ones age out via pool_recycle
+            options['pool_use_lifo'] = True
+            # Greenlets are cheap; waiting 30s for a connection just piles them up
+            options['pool_timeout'] = min(config['DB_POOL_TIMEOUT'], config['DB_GREEN_POOL_TIMEOUT'])
+
+    if url.get_backend_name() == 'postgresql':
+        options['pool_pre_ping'] = config['DB_POOL_PRE_PING']
+        settings = {}
+        if config.get('DB_STATEMENT_TIMEOUT_MS'):
+            settings['statement_timeout'] = str(config['DB_STATEMENT_TIMEOUT_MS'])
+        if config.get('DB_LOCK_TIMEOUT_MS'):
+            settings['lock_timeout'] = str(config['DB_LOCK_TIMEOUT_MS'])
+        if settings and url.get_driver_name() == 'asyncpg':
+            options['connect_args'] = {'server_settings': settings}
+        elif settings:
+            options['connect_args'] = {'options': ' '.join(f'-c {name}={value}' for name, value in settings.items())}
+    return options
+
+
+def async_url(url):
+    """The URL on its asyncio driver, or None when there is none to use."""
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None or _is_sqlite_memory(url):
+        # A second engine on :memory: would open a different, empty database
+        return None
+    if driver == 'asyncpg' and 'sslmode' in url.query:
+        # asyncpg takes libpq's sslmode values as ssl=
+        url = url.difference_update_query(['sslmode']).update_query_dict({'ssl': url.query['sslmode']})
+    return url.set(drivername=f'{url.get_backend_name()}+{driver}')
+
+
+def _sqlite_pragmas(config):
+    """Connect listener setting WAL and busy_timeout on every new SQLite connection."""
+    busy_timeout = int(config['SQLITE_BUSY_TIMEOUT_MS'])
+    wal = config['SQLITE_WAL']
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f'PRAGMA busy_timeout = {busy_timeout}')
+            if wal:
+                # Readers no longer block the writer; the journal mode is stored in the file
+                cursor.execute('PRAGMA journal_mode = WAL')
+                cursor.execute('PRAGMA synchronous = NORMAL')
+        finally:
+            cursor.close()
+
+    return set_pragmas
+
+
+_green_psycopg2 = None
+
+
+def _make_psycopg2_green(runtime):
+    """Have psycopg2 yield to the hub while waiting on the server instead of blocking the worker."""
+    global _green_psycopg2
+    if _green_psycopg2 == runtime:
+        return
+    try:
+        import psycopg2
+        from psycopg2 import extensions
+    except ImportError:
+        return
+
+    if runtime == 'gevent':
+        from gevent.socket import wait_read, wait_write
+    else:
+        from eventlet.hubs import trampoline
+
+        def wait_read(fileno):
+            trampoline(fileno, read=True)
+
+        def wait_write(fileno):
+            trampoline(fileno, write=True)
+
+    def wait_callback(conn, timeout=None):
+        while True:
+            state = conn.poll()
+            if state == extensions.POLL_OK:
+                return
+            if state == extensions.POLL_READ:
+                wait_read(conn.fileno())
+            elif state == extensions.POLL_WRITE:
+                wait_write(conn.fileno())
+            else:
+                raise psycopg2.OperationalError(f'Bad result from poll: {state!r}')
+
+    extensions.set_wait_callback(wait_callback)
+    _green_psycopg2 = runtime
+
+
+def init_engines(app, db):
+    """
+    Build the engines from the DB_* settings and register db on the app.
+
+    Replaces a bare db.init_app(app): engine options have to be in the config
+    before Flask-SQLAlchemy creates the engines.
+    """
+    config = app.config
+    mode = pool_mode(config)
+    options = engine_options(config, config['SQLALCHEMY_DATABASE_URI'])
+    # Explicit SQLALCHEMY_ENGINE_OPTIONS still win
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = {**options, **config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+
+    if mode == 'green':
+        runtime = green_runtime()
+        if runtime is None:
+            logger.warning('DB_POOL_MODE=green but neither gevent nor eventlet has patched threading; '
+                           'a wait for a connection will block the whole worker')
+        else:
+            _make_psycopg2_green(runtime)
+
+    replica_url = config.get('DATABASE_REPLICA_URL')
+    if replica_url:
+        binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+        binds[REPLICA_BIND] = {'url': replica_url, **engine_options(config, replica_url)}
+        config['SQLALCHEMY_BINDS'] = binds
+
+    db.init_app(app)
+
+    # Engines connect lazily, so no connection has been opened yet
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                sa.event.listen(engine, 'connect', _sqlite_pragmas(config))
+
+    app.extensions['db_pool'] = {'mode': mode, 'timeouts': 0}
+
+    @app.errorhandler(sa.exc.TimeoutError)
+    def pool_exhausted(error):
+        # Every connection stayed checked out for pool_timeout: shed load rather than queue more
+        app.extensions['db_pool']['timeouts'] += 1
+        logger.error('Database pool exhausted: %s', error)
+        message = 'The server is busy, please retry shortly.'
+        body = jsonify(error=message) if request.path.startswith('/api/') else message
+        return body, 503, {'Retry-After': '5'}
+
+    return mode
+
+
+def init_async_engines(app):
+    """
+    Engines on the asyncio drivers for the primary and the replica, as
+    {None or REPLICA_BIND: AsyncEngine} in app.extensions['async_engines'].
+
+    Empty when the database has no async driver or it isn't installed; code
+    on the event loop then has nothing to query with (see asgi_server.py).
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    config = app.config
+    engines = {}
+    for bind, url in ((None, config['SQLALCHEMY_DATABASE_URI']), (REPLICA_BIND, config.get('DATABASE_REPLICA_URL'))):
+        url = async_url(url) if url else None
+        if url is None:
+            continue
+        try:
+            engine = create_async_engine(url, **engine_options(config, url))
+        except ImportError as error:
+            logger.warning('No asyncio driver for %s (%s); the event loop will not query it',
+                           url.render_as_string(hide_password=True), error)
+            continue
+        if engine.dialect.name == 'sqlite':
+            sa.event.listen(engine.sync_engine, 'connect', _sqlite_pragmas(config))
+        engines[bind] = engine
+    if None not in engines:
+        engines = {}
+    app.extensions['async_engines'] = engines
+    return engines
+
+
+def async_reads(view):
+    """
+    Let GET requests to a read-only view run on the event loop when served by
+    asgi.py, querying through the async engines; elsewhere this changes nothing.
+    """
+    view.async_reads = True
+    return view
+
+
+def read_replica(view):
+    """Run a read-only view's queries on DATABASE_REPLICA_URL, when one is configured."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g._db_read_replica = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            g._db_read_replica = False
+    return wrapper
+
+
+class RoutingSession(Session):
+    """
+    Session that sends reads inside @read_replica views to the replica engine,
+    and everything on the event loop to the async engines.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            if self._flushing:
+                # The replica hasn't got this write, so the rest of the request reads the primary
+                g._db_wrote = True
+            use_replica = g.get('_db_read_replica') and not g.get('_db_wrote')
+            if in_greenlet():
+                # On the event loop: the same databases through their asyncio drivers
+                engines = current_app.extensions.get('async_engines') or {}
+                engine = use_replica and engines.get(REPLICA_BIND) or engines.get(None)
+                if engine is not None:
+                    return engine.sync_engine
+            if use_replica:
+                replica = self._db.engines.get(REPLICA_BIND)
+                if replica is not None:
+                    return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -0,0 +1,97 @@
+"""
+User directory helpers: index-friendly search and keyset pagination.
+
+Searches use a prefix range (``col >= term AND col < term + MAX``) which a
+plain b-tree index can satisfy on both SQLite and PostgreSQL, unlike
+``ilike('%term%')``. On PostgreSQL with pg_trgm installed, longer terms fall
+back to a substring match backed by the trigram indexes from
+migrations/0002_search_indexes.py.
+"""
+
+import base64
+import json
+
+from sqlalchemy import and_, func, or_
+
+from models import db, User
+
+PAGE_SIZE = 50
+TRIGRAM_MIN_LENGTH = 3
+
+# Sorts after any character that can appear in a room number, name or college id
+_PREFIX_UPPER_BOUND = '\U0010ffff'
+
+_trigram_available = {}
+
+
+def prefix_range(column, term):
+    """column starts with term, as a range any B-tree index on column can serve."""
+    return and_(column >= term, column < term + _PREFIX_UPPER_BOUND)
+
+
+def has_trigram():
+    """Whether the pg_trgm extension is installed on the bound database."""
+    engine = db.engine
+    if engine.dialect.name != 'postgresql':
+        return False
+    if engine.url not in _trigram_available:
+        with engine.connect() as conn:
+            found = conn.exec_driver_sql(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+            ).first()
+        _trigram_available[engine.url] = found is not None
+    return _trigram_available[engine.url]
+
+
+def room_filter(column, term):
+    """Filter a room-number column by an already upper-cased search term."""
+    if len(term) >= TRIGRAM_MIN_LENGTH and has_trigram():
+        return column.ilike(f'%{term}%')
+    return prefix_range(column, term)
+
+
+def search_users(query, term):
+    """Restrict a User query to rows whose room number or name starts with term."""
+    term = term.strip()
+    if not term:
+        return query
+    return query.filter(or_(
+        room_filter(User.room_number, term.upper()),
+        prefix_range(func.lower(User.name), term.lower()),
+    ))
+
+
+def encode_cursor(user):
+    raw = json.dumps([user.name, user.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (name, id) from a cursor, or None if it is missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        name, user_id = json.loads(raw)
+        return str(name), int(user_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def keyset_page(query, cursor=None, per_page=PAGE_SIZE):
+    """
+    Fetch one page of a User query ordered by (name, id).
+
+    Returns (users, next_cursor); next_cursor is None on the last page.
+    """
+    after = decode_cursor(cursor)
+    if after:
+        name, user_id = after
+        query = query.filter(or_(
+            User.name > name,
+            and_(User.name == name, User.id > user_id),
+        ))
+    rows = query.order_by(User.name, User.id).limit(per_page + 1).all()
+    users = rows[:per_page]
+    next_cursor = encode_cursor(users[-1]) if len(rows) > per_page else None
+    return users, next_cursor
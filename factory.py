@@ -0,0 +1,119 @@
+"""
+Application factory.
+
+create_app() builds the Flask app in two layers, so each entry point only
+imports and starts what it uses:
+
+    create_app(web=False)   config, database engines, password hashing and
+                            the cache and index hooks: enough for the CLI
+                            scripts (migrate.py, allocations.py, matching.py,
+                            inbox.py, mail_queue.py, archive.py, accounts.py,
+                            rooms.py, database.py) and for tests of the modules behind them
+    create_app()            adds what serving requests needs: login, Socket.IO,
+                            the mail queue, metrics and rate limits
+
+Either way feed.py pushes request list changes to browsers: through the
+app's own Socket.IO server, or from scripts through SOCKETIO_MESSAGE_QUEUE.
+
+app.py calls create_app() and registers the views and socket handlers, and
+`gunicorn app:app` serves the result; `uvicorn asgi:application` serves it
+from an asyncio event loop instead (SOCKETIO_ASYNC_MODE=asgi, asgi_server.py). Keyword arguments override config
+values, e.g. create_app(web=False, SQLALCHEMY_DATABASE_URI='sqlite://').
+
+Nothing here connects to anything: engines open connections on first use,
+the mail workers start on the first enqueue_mail() and Flask-Mail is loaded
+when they first send. Timings are in benchmarks/startup.py.
+"""
+
+import logging
+import os
+
+from flask import Flask
+
+from config import Config
+from models import db
+from db_engine import init_engines
+from credentials import init_credentials
+from user_cache import init_user_cache
+from render_cache import init_render_cache
+from room_index import init_room_index
+from rooms import init_rooms
+from feed import init_feed
+
+logger = logging.getLogger(__name__)
+
+
+ASYNC_MODES = ('threading', 'eventlet', 'gevent', 'asgi')
+
+
+def async_mode(config):
+    """
+    Socket.IO async mode: SOCKETIO_ASYNC_MODE when set, else eventlet on
+    Railway when it is installed, threading otherwise.
+    """
+    mode = config.get('SOCKETIO_ASYNC_MODE')
+    if mode:
+        if mode not in ASYNC_MODES:
+            raise ValueError(f'SOCKETIO_ASYNC_MODE must be one of {", ".join(ASYNC_MODES)}, not {mode!r}')
+        return mode
+    if os.getenv('PORT') or os.getenv('RAILWAY_ENVIRONMENT_NAME') or os.getenv('RAILWAY_PROJECT_NAME'):
+        try:
+            import eventlet  # noqa: F401
+            return 'eventlet'
+        except ImportError:
+            logger.warning('eventlet is not installed; Socket.IO falls back to threading')
+    return 'threading'
+
+
+def create_app(config=Config, web=True, **settings):
+    app = Flask(__name__)
+    app.config.from_object(config)
+    app.config.update(settings)
+
+    init_engines(app, db)
+    init_credentials(app)
+    # Keeps room ids in step with room numbers on every ORM write
+    init_rooms(app)
+    # CLI writes must still invalidate caches shared through Redis
+    init_user_cache(app)
+    init_render_cache(app)
+    # Built on the first dashboard view; scripts never build it, so their commits cost nothing here
+    init_room_index(app)
+    if web:
+        socketio = init_web(app)
+    elif app.config.get('SOCKETIO_MESSAGE_QUEUE'):
+        # Scripts reach the browsers through the workers' message queue
+        from socket_queue import external_socketio
+        socketio = external_socketio(app.config)
+    else:
+        socketio = None
+    init_feed(app, socketio)
+    return app
+
+
+def init_web(app):
+    """Login, Socket.IO, the mail queue, metrics and rate limits."""
+    from flask_login import LoginManager
+    from flask_socketio import SocketIO
+
+    from mail_queue import init_mail_queue
+    from metrics import init_metrics
+    from socket_queue import socketio_options
+    from throttle import init_throttle
+
+    login_manager = LoginManager(app)
+    login_manager.login_view = 'login'
+
+    mode = async_mode(app.config)
+    logger.info('Socket.IO async mode: %s', mode)
+    if mode == 'asgi':
+        # Flask-SocketIO's API over python-socketio's AsyncServer (see asgi_server.py)
+        from asgi_server import init_asgi
+        socketio = SocketIO(app, async_mode='threading')
+        init_asgi(app, socketio)
+    else:
+        socketio = SocketIO(app, cors_allowed_origins="*", async_mode=mode, **socketio_options(app.config))
+    init_mail_queue(app, start_task=socketio.start_background_task)
+    init_metrics(app)
+    init_throttle(app)
+    return socketio
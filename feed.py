@@ -0,0 +1,199 @@
+"""
+Live updates for the swap request lists.
+
+Every change to a swap request is appended to both parties' SwapRequestChange
+log by inbox.record_transitions(), numbered by a per-user sequence kept in
+InboxSummary.feed_seq. Numbers are taken with the same UPDATE that changes
+the counters, which holds the summary row until commit, so a user's entries
+become visible in sequence order and "everything after N" never skips one.
+
+Pages with /invitations or /my_requests lists start from the feed_seq they
+were rendered with and stay current two ways:
+
+    'swap_request_changes'             Socket.IO event with the entries of
+                                       each commit, sent to the user's room
+    GET /api/swap_requests/changes     entries after ?since=N, after a missed
+                                       event or a reconnect
+
+Both carry {'from', 'seq', 'changes', 'inbox'}: each change is the current
+state of one request as its row in that list ({'seq', 'id', 'list',
+'status', 'name', 'room_number'}, status None once the request is gone),
+and 'inbox' the badge counters. Several entries for one request collapse
+into the latest.
+
+Pushes are built just before commit and sent after it. CLI scripts send them
+through SOCKETIO_MESSAGE_QUEUE when one is configured; otherwise pages catch
+up on their next sync. Old entries are pruned with
+
+    python feed.py --prune-days 30
+
+and a client still behind the oldest remaining entry is told to reload.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app, has_app_context
+from sqlalchemy import delete, event, select
+from sqlalchemy.orm import Session, aliased
+
+from models import db, User, RoomPreference, SwapRequest, SwapRequestChange
+from inbox import COUNTERS, FEED_KEY, get_summary
+from notifications import notify_user
+
+PAGE_SIZE = 200
+EVENT = 'swap_request_changes'
+PUSH_KEY = 'feed_pushes'
+
+
+def _describe(entries):
+    """Change dicts for log entries (seq, request_id, as_owner), from the requests' current state."""
+    owner, requester = aliased(User), aliased(User)
+    ids = {entry.request_id for entry in entries}
+    rows = db.session.execute(
+        select(SwapRequest.id, SwapRequest.status, SwapRequest.from_room_number,
+               requester.name.label('requester_name'), owner.name.label('owner_name'),
+               owner.room_number.label('owner_room'))
+        .join(RoomPreference, SwapRequest.preference_id == RoomPreference.id)
+        .join(owner, RoomPreference.user_id == owner.id)
+        .join(requester, SwapRequest.requester_id == requester.id)
+        .where(SwapRequest.id.in_(ids))
+    ).all() if ids else []
+    current = {row.id: row for row in rows}
+
+    changes = []
+    for entry in entries:
+        change = {'seq': entry.seq, 'id': entry.request_id,
+                  'list': 'invitations' if entry.as_owner else 'my_requests', 'status': None}
+        row = current.get(entry.request_id)
+        if row is not None:
+            # The same columns the list templates show
+            if entry.as_owner:
+                change.update(status=row.status, name=row.requester_name, room_number=row.from_room_number)
+            else:
+                change.update(status=row.status, name=row.owner_name, room_number=row.owner_room)
+        changes.append(change)
+    return changes
+
+
+def _collapse(entries):
+    """Keep only the latest entry for each request and list, in sequence order."""
+    latest = {}
+    for entry in entries:
+        latest[(entry.request_id, entry.as_owner)] = entry
+    return sorted(latest.values(), key=lambda entry: entry.seq)
+
+
+def _counters(summary):
+    return {name: getattr(summary, name) for name in COUNTERS}
+
+
+def changes_since(user_id, since, limit=PAGE_SIZE):
+    """
+    Feed entries for user_id after sequence number `since`, at most `limit` of them.
+
+    'more' means the page was full and the client should ask again from
+    'seq'; 'reset' means entries after `since` were pruned and the client
+    has to reload its lists.
+    """
+    entries = db.session.execute(
+        select(SwapRequestChange.seq, SwapRequestChange.request_id, SwapRequestChange.as_owner)
+        .where(SwapRequestChange.user_id == user_id, SwapRequestChange.seq > since)
+        .order_by(SwapRequestChange.seq).limit(limit)
+    ).all()
+    summary = get_summary(user_id)
+    latest = max(summary.feed_seq, entries[-1].seq if entries else 0)
+    if since > latest or (since < latest and (not entries or entries[0].seq != since + 1)):
+        return {'from': since + 1, 'seq': latest, 'changes': [], 'more': False, 'reset': True,
+                'inbox': _counters(summary)}
+    return {'from': since + 1, 'seq': entries[-1].seq if entries else since,
+            'changes': _describe(_collapse(entries)), 'more': len(entries) == limit, 'reset': False,
+            'inbox': _counters(summary)}
+
+
+def pending_pushes(pending):
+    """{user_id: payload} for the entries inbox.record_transitions() wrote this transaction."""
+    collapsed = {user_id: _collapse(user_pending['entries']) for user_id, user_pending in pending.items()}
+    # One query describes every user's changes
+    changes = iter(_describe([entry for entries in collapsed.values() for entry in entries]))
+    pushes = {}
+    for user_id, user_pending in pending.items():
+        entries = user_pending['entries']
+        pushes[user_id] = {'from': entries[0].seq, 'seq': entries[-1].seq,
+                           'changes': [next(changes) for _ in collapsed[user_id]],
+                           'inbox': user_pending['counters']}
+    return pushes
+
+
+def prune(days):
+    """Delete entries older than `days` days; returns how many."""
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=days)
+    result = db.session.execute(delete(SwapRequestChange).where(SwapRequestChange.created_at < cutoff))
+    db.session.commit()
+    return result.rowcount
+
+
+class SwapFeed:
+    def __init__(self, socketio=None):
+        self.socketio = socketio
+        self.pushed = 0
+
+    def push(self, pushes):
+        for user_id, payload in pushes.items():
+            notify_user(self.socketio, user_id, EVENT, payload)
+        self.pushed += len(pushes)
+
+
+def _current_feed():
+    return current_app.extensions.get('swap_feed') if has_app_context() else None
+
+
+def _build_pushes(session):
+    # Still inside the transaction, so the payload matches what is about to commit
+    pending = session.info.pop(FEED_KEY, None)
+    feed = _current_feed()
+    if pending and feed is not None and feed.socketio is not None:
+        session.info[PUSH_KEY] = pending_pushes(pending)
+
+
+def _send_pushes(session):
+    pushes = session.info.pop(PUSH_KEY, None)
+    feed = _current_feed()
+    if pushes and feed is not None:
+        feed.push(pushes)
+
+
+def _forget_pushes(session):
+    session.info.pop(FEED_KEY, None)
+    session.info.pop(PUSH_KEY, None)
+
+
+SESSION_LISTENERS = (
+    ('before_commit', _build_pushes),
+    ('after_commit', _send_pushes),
+    ('after_rollback', _forget_pushes),
+)
+
+
+def init_feed(app, socketio=None):
+    """Push each commit's feed entries to the users involved through socketio (None: don't push)."""
+    feed = SwapFeed(socketio)
+    app.extensions['swap_feed'] = feed
+    # Registered for every Session once per process; pushes go through the current app's feed
+    for name, listener in SESSION_LISTENERS:
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
+    return feed
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from factory import create_app
+
+    parser = argparse.ArgumentParser(description='Prune the swap request change log.')
+    parser.add_argument('--prune-days', type=int, default=30, help='keep entries newer than this')
+    args = parser.parse_args()
+
+    app = create_app(web=False)
+    with app.app_context():
+        print(f"Pruned {prune(args.prune_days)} feed entries")
@@ -0,0 +1,220 @@
+"""
+Denormalized per-user request counters.
+
+InboxSummary holds pending-invites, pending-sent and committed-swaps counts
+for each user so the navigation badges and dashboard read one row instead of
+walking preferences and their requests. Every view that creates or changes a
+SwapRequest calls record_transition() inside its own transaction, which also
+appends the change to both parties' SwapRequestChange log (see feed.py), and
+rebuild() recomputes the counters from swap_requests and its archive.
+A rotation's moves (see matching.commit_cycle) are committed requests on the
+mover's own preference; they count once and are in no one's request lists:
+
+    python inbox.py             # rebuild every user's summary
+    python inbox.py 12 57       # rebuild selected users
+"""
+
+from collections import namedtuple
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User, RoomPreference, SwapRequest, SwapRequestArchive, InboxSummary, SwapRequestChange
+from render_cache import mark_stale
+
+COUNTERS = ('pending_invites', 'pending_sent', 'committed_swaps')
+REBUILD_BATCH_SIZE = 1000
+# session.info: {user_id: {'entries': [FeedEntry, ...], 'counters': {...}}} written in this
+# transaction, for feed.py to push on commit
+FEED_KEY = 'feed_pending'
+
+FeedEntry = namedtuple('FeedEntry', 'seq request_id as_owner')
+
+
+def get_summary(user_id):
+    summary = db.session.get(InboxSummary, user_id)
+    if summary is None:
+        summary = InboxSummary(user_id=user_id, pending_invites=0, pending_sent=0, committed_swaps=0, feed_seq=0)
+    return summary
+
+
+def _deltas(old_status, new_status):
+    """Counter changes for (owner, requester) when a request moves between states."""
+    owner, requester = dict.fromkeys(COUNTERS, 0), dict.fromkeys(COUNTERS, 0)
+    if old_status == 'pending':
+        owner['pending_invites'] -= 1
+        requester['pending_sent'] -= 1
+    if new_status == 'pending':
+        owner['pending_invites'] += 1
+        requester['pending_sent'] += 1
+    if old_status == 'committed':
+        owner['committed_swaps'] -= 1
+        requester['committed_swaps'] -= 1
+    if new_status == 'committed':
+        owner['committed_swaps'] += 1
+        requester['committed_swaps'] += 1
+    return owner, requester
+
+
+def _bump(user_id, deltas, changes=0):
+    """
+    Apply counter deltas and advance the feed by `changes` entries.
+
+    Returns the updated (feed_seq, *COUNTERS) row, or None if there was nothing to change.
+    """
+    values = {name: getattr(InboxSummary, name) + delta for name, delta in deltas.items() if delta}
+    if changes:
+        values['feed_seq'] = InboxSummary.feed_seq + changes
+    if not values:
+        return None
+    where = InboxSummary.user_id == user_id
+    returning = [InboxSummary.feed_seq] + [getattr(InboxSummary, name) for name in COUNTERS]
+    statement = update(InboxSummary).where(where).values(values).returning(*returning)
+    row = db.session.execute(statement).first()
+    if row is not None:
+        return row
+    # No summary yet: build it from swap_requests, which already include this change
+    try:
+        with db.session.begin_nested():
+            rebuild([user_id], commit=False)
+        statement = update(InboxSummary).where(where) \
+            .values(feed_seq=InboxSummary.feed_seq + changes).returning(*returning)
+    except IntegrityError:
+        # A concurrent transaction created the row first
+        pass
+    return db.session.execute(statement).first()
+
+
+def record_transition(owner_id, requester_id, old_status, new_status, request_id=None):
+    """
+    Update both parties' counters for a request going from old_status to new_status,
+    and log request_id in both parties' feeds.
+
+    Use None for a request being created (old) or deleted (new). Call before
+    the surrounding commit so the counters change in the same transaction.
+    """
+    record_transitions([(owner_id, requester_id, request_id)], old_status, new_status)
+
+
+def record_transitions(requests, old_status, new_status, skip=()):
+    """
+    Like record_transition for many (owner_id, requester_id, request_id); one UPDATE per user.
+
+    Users in `skip` are left alone, for accounts being deleted along with their summaries.
+    """
+    db.session.flush()
+    owner, requester = _deltas(old_status, new_status)
+    totals, changes = {}, {}
+    for owner_id, requester_id, request_id in requests:
+        sides = ((owner_id, owner, True), (requester_id, requester, False))
+        if owner_id == requester_id:
+            sides = sides[1:]
+        for user_id, deltas, as_owner in sides:
+            user_totals = totals.setdefault(user_id, dict.fromkeys(COUNTERS, 0))
+            for name, delta in deltas.items():
+                user_totals[name] += delta
+            if request_id is not None:
+                changes.setdefault(user_id, []).append((request_id, as_owner))
+    # The UPDATE locks each summary row until commit, so feed sequence numbers follow commit order
+    pending = db.session.info.setdefault(FEED_KEY, {})
+    log = []
+    for user_id in sorted(totals.keys() - set(skip)):
+        user_changes = changes.get(user_id, ())
+        row = _bump(user_id, totals[user_id], len(user_changes))
+        if not user_changes:
+            continue
+        first = row.feed_seq - len(user_changes) + 1
+        entries = [FeedEntry(first + offset, request_id, as_owner)
+                   for offset, (request_id, as_owner) in enumerate(user_changes)]
+        user_pending = pending.setdefault(user_id, {'entries': []})
+        user_pending['entries'] += entries
+        user_pending['counters'] = {name: getattr(row, name) for name in COUNTERS}
+        log += [{'user_id': user_id, **entry._asdict()} for entry in entries]
+    if log:
+        db.session.execute(SwapRequestChange.__table__.insert(), log)
+    mark_stale(db.session, totals)
+
+
+def _counts(user_ids=None):
+    """Recompute counters from swap_requests and the archive; returns {user_id: {counter: n}}."""
+    counts = {}
+
+    def add(rows, name):
+        for user_id, n in rows:
+            counts.setdefault(user_id, dict.fromkeys(COUNTERS, 0))[name] += n
+
+    owner = RoomPreference.user_id
+    pending = SwapRequest.status == 'pending'
+    committed = SwapRequest.status == 'committed'
+    invites = select(owner, func.count()).join(SwapRequest, SwapRequest.preference_id == RoomPreference.id) \
+        .where(pending).group_by(owner)
+    sent = select(SwapRequest.requester_id, func.count()).where(pending).group_by(SwapRequest.requester_id)
+    as_requester = select(SwapRequest.requester_id, func.count()).where(committed) \
+        .group_by(SwapRequest.requester_id)
+    as_owner = select(owner, func.count()).join(SwapRequest, SwapRequest.preference_id == RoomPreference.id) \
+        .where(committed, SwapRequest.requester_id != owner).group_by(owner)
+    # Archived requests are all resolved, but their committed swaps still count
+    archived = SwapRequestArchive
+    archived_as_requester = select(archived.requester_id, func.count()) \
+        .where(archived.status == 'committed').group_by(archived.requester_id)
+    archived_as_owner = select(archived.owner_id, func.count()) \
+        .where(archived.status == 'committed', archived.owner_id != archived.requester_id) \
+        .group_by(archived.owner_id)
+    if user_ids is not None:
+        invites = invites.where(owner.in_(user_ids))
+        as_owner = as_owner.where(owner.in_(user_ids))
+        sent = sent.where(SwapRequest.requester_id.in_(user_ids))
+        as_requester = as_requester.where(SwapRequest.requester_id.in_(user_ids))
+        archived_as_requester = archived_as_requester.where(archived.requester_id.in_(user_ids))
+        archived_as_owner = archived_as_owner.where(archived.owner_id.in_(user_ids))
+
+    add(db.session.execute(invites), 'pending_invites')
+    add(db.session.execute(sent), 'pending_sent')
+    add(db.session.execute(as_requester), 'committed_swaps')
+    add(db.session.execute(as_owner), 'committed_swaps')
+    add(db.session.execute(archived_as_requester), 'committed_swaps')
+    add(db.session.execute(archived_as_owner), 'committed_swaps')
+    return counts
+
+
+def _feed_seqs(user_ids):
+    """Current feed_seq of each user, so a rebuild never hands out a sequence number twice."""
+    seqs = dict(db.session.execute(
+        select(InboxSummary.user_id, InboxSummary.feed_seq).where(InboxSummary.user_id.in_(user_ids))
+    ).all())
+    logged = select(SwapRequestChange.user_id, func.max(SwapRequestChange.seq)) \
+        .where(SwapRequestChange.user_id.in_(user_ids)).group_by(SwapRequestChange.user_id)
+    for user_id, seq in db.session.execute(logged):
+        seqs[user_id] = max(seqs.get(user_id, 0), seq)
+    return seqs
+
+
+def rebuild(user_ids=None, commit=True):
+    """Recompute summaries for user_ids (every user if None) from swap_requests."""
+    if user_ids is None:
+        user_ids = db.session.scalars(select(User.id)).all()
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), REBUILD_BATCH_SIZE):
+        batch = user_ids[start:start + REBUILD_BATCH_SIZE]
+        counts = _counts(batch)
+        seqs = _feed_seqs(batch)
+        mark_stale(db.session, batch)
+        db.session.execute(delete(InboxSummary).where(InboxSummary.user_id.in_(batch)))
+        db.session.execute(InboxSummary.__table__.insert(), [
+            {'user_id': user_id, **counts.get(user_id, dict.fromkeys(COUNTERS, 0)), 'feed_seq': seqs.get(user_id, 0)}
+            for user_id in batch
+        ])
+        if commit:
+            db.session.commit()
+    return len(user_ids)
+
+
+if __name__ == '__main__':
+    import sys
+
+    from factory import create_app
+
+    app = create_app(web=False)
+    with app.app_context():
+        ids = [int(arg) for arg in sys.argv[1:]] or None
+        print(f"Rebuilt inbox summaries for {rebuild(ids)} users")
@@ -0,0 +1,229 @@
+"""
+Persistent outbound mail queue.
+
+Views call enqueue_mail(), which only inserts a row into mail_outbox, so a
+slow or unreachable SMTP server never blocks a request. Background workers
+claim due messages in batches, send each batch over a single SMTP
+connection, and retry failures with exponential backoff.
+
+Workers start lazily inside the web process on the first enqueue. To drain
+the queue from a separate process instead:
+
+    python mail_queue.py          # run until interrupted
+    python mail_queue.py --once   # send everything currently due, then exit
+"""
+
+import logging
+import smtplib
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import select, update
+
+from models import db, OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+# How long a claimed batch stays reserved before another worker may retry it
+CLAIM_LEASE = timedelta(minutes=5)
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class RecipientRateLimiter:
+    """Sliding-window limit on messages per recipient, per process."""
+
+    def __init__(self, limit, window_seconds=3600):
+        self.limit = limit
+        self.window = window_seconds
+        self._sent = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def retry_after(self, recipient, now=None):
+        """Seconds until recipient may receive another message; 0 if allowed now."""
+        if not self.limit:
+            return 0
+        now = now or time.monotonic()
+        with self._lock:
+            sent = self._sent[recipient]
+            while sent and now - sent[0] >= self.window:
+                sent.popleft()
+            if len(sent) >= self.limit:
+                return self.window - (now - sent[0])
+            return 0
+
+    def record(self, recipient, now=None):
+        """Count a message delivered to recipient; only sends that went through use up the limit."""
+        if not self.limit:
+            return
+        with self._lock:
+            self._sent[recipient].append(now or time.monotonic())
+
+
+class MailDispatcher:
+    def __init__(self, app, mail=None, start_task=None):
+        self.app = app
+        self._mail = mail
+        self.start_task = start_task or (lambda target: threading.Thread(target=target, daemon=True).start())
+        config = app.config
+        self.workers = config['MAIL_QUEUE_WORKERS']
+        self.batch_size = config['MAIL_QUEUE_BATCH_SIZE']
+        self.max_attempts = config['MAIL_QUEUE_MAX_ATTEMPTS']
+        self.backoff = config['MAIL_QUEUE_BACKOFF_SECONDS']
+        self.poll_interval = config['MAIL_QUEUE_POLL_SECONDS']
+        self.rate_limiter = RecipientRateLimiter(config['MAIL_QUEUE_PER_RECIPIENT_HOURLY'])
+        self._wakeup = threading.Event()
+        self._started = False
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._started or not self.workers:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            for _ in range(self.workers):
+                self.start_task(self.run)
+
+    @property
+    def mail(self):
+        # Flask-Mail is only imported once there is something to send
+        if self._mail is None:
+            from flask_mail import Mail
+            self._mail = Mail(self.app)
+        return self._mail
+
+    def wake(self):
+        self._wakeup.set()
+
+    def run(self):
+        while True:
+            try:
+                sent = self.process_batch()
+            except Exception:
+                logger.exception('Mail worker error')
+                sent = 0
+            if not sent:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _claim(self):
+        now = _utcnow()
+        token = uuid.uuid4().hex
+        due = select(OutboxMessage.id).where(
+            OutboxMessage.status.in_(('pending', 'sending')),
+            OutboxMessage.next_attempt_at <= now,
+        ).order_by(OutboxMessage.next_attempt_at).limit(self.batch_size)
+        # Rows another worker claimed first no longer match and are skipped
+        db.session.execute(update(OutboxMessage).where(
+            OutboxMessage.id.in_(due.scalar_subquery()),
+            OutboxMessage.next_attempt_at <= now,
+        ).values(status='sending', claim_token=token, next_attempt_at=now + CLAIM_LEASE)
+            .execution_options(synchronize_session=False))
+        db.session.commit()
+        return OutboxMessage.query.filter_by(claim_token=token, status='sending').all()
+
+    def _retry(self, message, error, delay=None):
+        message.attempts += 1
+        message.last_error = str(error)[:500]
+        if message.attempts >= self.max_attempts:
+            message.status = 'failed'
+            return
+        message.status = 'pending'
+        if delay is None:
+            delay = self.backoff * 2 ** (message.attempts - 1)
+        message.next_attempt_at = _utcnow() + timedelta(seconds=delay)
+
+    def process_batch(self):
+        """Claim and send one batch; returns the number of messages sent."""
+        from flask_mail import Message
+
+        with self.app.app_context():
+            batch = self._claim()
+            if not batch:
+                return 0
+            sent = 0
+            pending = deque(batch)
+            try:
+                with self.mail.connect() as conn:
+                    while pending:
+                        message = pending[0]
+                        wait = self.rate_limiter.retry_after(message.recipient)
+                        if wait:
+                            # Not a failure: reschedule without spending an attempt
+                            message.status = 'pending'
+                            message.next_attempt_at = _utcnow() + timedelta(seconds=wait)
+                        else:
+                            try:
+                                conn.send(Message(message.subject, recipients=[message.recipient],
+                                                  body=message.body, sender=message.sender))
+                                self.rate_limiter.record(message.recipient)
+                                message.status = 'sent'
+                                message.sent_at = _utcnow()
+                                message.attempts += 1
+                                sent += 1
+                            except smtplib.SMTPRecipientsRefused as e:
+                                self._retry(message, e)
+                        pending.popleft()
+            except (smtplib.SMTPException, OSError) as e:
+                # Connection-level failure: everything not yet handled is retried
+                for message in pending:
+                    self._retry(message, e)
+            db.session.commit()
+            return sent
+
+
+def init_mail_queue(app, mail=None, start_task=None):
+    app.extensions['mail_queue'] = MailDispatcher(app, mail, start_task)
+    return app.extensions['mail_queue']
+
+
+def enqueue_mail(recipient, subject, body, sender=None, commit=True):
+    """Queue a message for background delivery; never touches SMTP."""
+    message = OutboxMessage(
+        recipient=recipient,
+        subject=subject,
+        body=body,
+        sender=sender or current_app.config['MAIL_USERNAME'],
+        next_attempt_at=_utcnow(),
+    )
+    db.session.add(message)
+    if commit:
+        db.session.commit()
+    dispatcher = current_app.extensions.get('mail_queue')
+    if dispatcher:
+        dispatcher.ensure_started()
+        dispatcher.wake()
+    return message
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from factory import create_app
+
+    parser = argparse.ArgumentParser(description='Send queued mail.')
+    parser.add_argument('--once', action='store_true', help='exit when nothing is due')
+    args = parser.parse_args()
+
+    app = create_app(web=False)
+    init_mail_queue(app)
+
+    dispatcher = app.extensions['mail_queue']
+    if args.once:
+        total = 0
+        while True:
+            sent = dispatcher.process_batch()
+            total += sent
+            if not sent:
+                break
+        print(f"Sent {total} messages")
+    else:
+        dispatcher.run()
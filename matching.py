@@ -0,0 +1,297 @@
+"""
+Swap matching engine over open room preferences.
+
+Every open RoomPreference says "user U holds room `available` and would move
+to room `needed`". That gives a directed graph where U -> V whenever V holds
+a room U needs. Any cycle in that graph is a valid swap: each participant
+moves into the room of the next one. Direct pairs are 2-cycles; longer
+rotations (A -> B -> C -> A) are found the same way.
+
+Rooms are followed by id (see rooms.py). Wildcard needs ('FLOOR 2', 'ANY')
+are left out: they would make every holder on a floor a neighbour, so they
+are served by the dashboard's compatible swaps and free places instead.
+
+Usage:
+    python matching.py            # find and commit all cycles
+    python matching.py --dry-run  # only report what would be committed
+"""
+
+from collections import defaultdict, deque
+
+from sqlalchemy import select
+
+from inbox import record_transitions
+from models import db, User, RoomPreference, SwapRequest
+from swaps import SwapConflict, move_users, supersede_pending
+
+# Longest rotation we commit; bigger cycles are hard to coordinate in person
+MAX_CYCLE_LENGTH = 6
+
+_UNVISITED, _DONE = -1, -2
+
+
+def _open_preferences_query():
+    # A preference is only actionable while its owner still holds `available`
+    return select(
+        RoomPreference.id, RoomPreference.user_id,
+        RoomPreference.available_room_id, RoomPreference.needed_room_id,
+    ).join(User, User.id == RoomPreference.user_id).where(
+        RoomPreference.selected == False,  # noqa: E712
+        User.is_looking_to_swap == True,  # noqa: E712
+        RoomPreference.available_room_id == User.room_id,
+        RoomPreference.needed_room_id.isnot(None),
+    )
+
+
+def load_open_preferences():
+    """Return (pref_id, user_id, available room id, needed room id) rows for every open preference."""
+    return db.session.execute(_open_preferences_query()).all()
+
+
+class SwapGraph:
+    """In-memory graph of who holds what and who wants what."""
+
+    def __init__(self, rows=()):
+        self.room_of = {}
+        self.wants = defaultdict(list)     # user_id -> [(needed_room, pref_id)]
+        self.holders = defaultdict(list)   # room -> [user_id]
+        for row in rows:
+            self.add(*row)
+
+    def add(self, pref_id, user_id, available, needed):
+        if user_id not in self.room_of:
+            self.room_of[user_id] = available
+            self.holders[available].append(user_id)
+        self.wants[user_id].append((needed, pref_id))
+
+    def __len__(self):
+        return len(self.room_of)
+
+    def _pref_for(self, user_id, target_id):
+        # The preference of user_id that target_id's room satisfies
+        room = self.room_of[target_id]
+        for needed, pref_id in self.wants[user_id]:
+            if needed == room:
+                return pref_id
+        return None
+
+    def _as_cycle(self, users):
+        nxt = users[1:] + users[:1]
+        return [(u, self._pref_for(u, v)) for u, v in zip(users, nxt)]
+
+    def _candidates(self, user_id):
+        holders = self.holders
+        return [h for needed, _ in self.wants[user_id]
+                for h in holders.get(needed, ()) if h != user_id]
+
+    def _needs(self, user_id):
+        return {needed for needed, _ in self.wants[user_id]}
+
+    def find_pairs(self, used, adjacency=None):
+        """Find direct two-way swaps among users not yet in `used`."""
+        adjacency = adjacency or {u: self._candidates(u) for u in self.room_of}
+        needs = {u: self._needs(u) for u in self.room_of}
+        room_of = self.room_of
+        pairs = []
+        for user_id, candidates in adjacency.items():
+            if user_id in used:
+                continue
+            room = room_of[user_id]
+            for other in candidates:
+                if other not in used and room in needs[other]:
+                    used.update((user_id, other))
+                    pairs.append(self._as_cycle([user_id, other]))
+                    break
+        return pairs
+
+    def find_cycles(self, max_length=MAX_CYCLE_LENGTH):
+        """
+        Find vertex-disjoint swap cycles, direct pairs first.
+
+        Returns a list of cycles; each cycle is a list of (user_id, pref_id)
+        where the user moves into the next user's room via pref_id. Every
+        edge is followed at most once, so this runs in time linear in the
+        size of the graph.
+        """
+        adjacency = {u: self._candidates(u) for u in self.room_of}
+        used = set()
+        cycles = self.find_pairs(used, adjacency)
+        # state[user] is _UNVISITED, _DONE, or the user's index on the current path
+        state = dict.fromkeys(self.room_of, _UNVISITED)
+        for user_id in used:
+            state[user_id] = _DONE
+
+        for start in self.room_of:
+            if state[start] != _UNVISITED:
+                continue
+            path = [start]
+            state[start] = 0
+            while path:
+                # Candidates are consumed as they are followed, so no edge is revisited
+                candidates = adjacency[path[-1]]
+                while candidates and state[candidates[-1]] == _DONE:
+                    candidates.pop()
+                if not candidates:
+                    # Dead end: nothing reachable from here closes a cycle
+                    state[path.pop()] = _DONE
+                    continue
+                nxt = candidates.pop()
+                at = state[nxt]
+                if at == _UNVISITED:
+                    state[nxt] = len(path)
+                    path.append(nxt)
+                    continue
+                cycle = path[at:]
+                del path[at:]
+                if len(cycle) <= max_length:
+                    for member in cycle:
+                        state[member] = _DONE
+                    cycles.append(self._as_cycle(cycle))
+                else:
+                    # Too long to commit; let its members be explored again
+                    for member in cycle:
+                        state[member] = _UNVISITED
+        return cycles
+
+    def find_cycle_through(self, user_id, max_length=MAX_CYCLE_LENGTH):
+        """Shortest cycle containing user_id, or None (breadth-first search)."""
+        if user_id not in self.room_of:
+            return None
+        parent = {user_id: None}
+        frontier = deque([(user_id, 1)])
+        while frontier:
+            node, depth = frontier.popleft()
+            for other in self._candidates(node):
+                if other == user_id:
+                    continue
+                if other in parent:
+                    continue
+                parent[other] = node
+                if self.room_of[user_id] in self._needs(other):
+                    users = [other]
+                    while parent[users[-1]] is not None:
+                        users.append(parent[users[-1]])
+                    return self._as_cycle(users[::-1])
+                if depth + 1 < max_length:
+                    frontier.append((other, depth + 1))
+        return None
+
+
+def load_neighbourhood(user_id, max_length=MAX_CYCLE_LENGTH):
+    """
+    Build a SwapGraph of the preferences reachable from user_id.
+
+    Issues one set-based query per hop instead of loading every preference.
+    """
+    base = _open_preferences_query()
+    graph = SwapGraph(db.session.execute(base.where(RoomPreference.user_id == user_id)).all())
+    # Every user offers exactly one room, so loading each room once loads each user once
+    seen_rooms = set(graph.holders)
+    rooms = {needed for needed, _ in graph.wants.get(user_id, ())}
+    for _ in range(max_length - 1):
+        rooms -= seen_rooms
+        if not rooms:
+            break
+        seen_rooms |= rooms
+        rows = db.session.execute(base.where(RoomPreference.available_room_id.in_(rooms))).all()
+        for row in rows:
+            graph.add(*row)
+        rooms = {row.needed_room_id for row in rows}
+    return graph
+
+
+def commit_cycle(cycle):
+    """
+    Rotate room numbers across every participant of a cycle in one transaction.
+
+    Users are locked in id order and re-checked; returns False (and changes
+    nothing) if anyone has moved or withdrawn a preference since matching.
+    """
+    user_ids = [user_id for user_id, _ in cycle]
+    pref_ids = [pref_id for _, pref_id in cycle]
+    try:
+        held = {row.id: row for row in db.session.execute(
+            select(User.id, User.room_id, User.room_number).where(User.id.in_(user_ids))
+        )}
+        old_rooms = {user_id: row.room_number for user_id, row in held.items()}
+        prefs = {p.id: p for p in RoomPreference.query.filter(RoomPreference.id.in_(pref_ids))
+                 .with_for_update().all()}
+        if len(old_rooms) != len(cycle) or len(prefs) != len(cycle):
+            db.session.rollback()
+            return False
+
+        for index, (user_id, pref_id) in enumerate(cycle):
+            giver_id = user_ids[(index + 1) % len(cycle)]
+            pref = prefs[pref_id]
+            if pref.user_id != user_id or pref.selected or pref.available_room_id != held[user_id].room_id \
+                    or pref.needed_room_id != held[giver_id].room_id:
+                db.session.rollback()
+                return False
+
+        moves = {}
+        for index, (user_id, pref_id) in enumerate(cycle):
+            giver_id = user_ids[(index + 1) % len(cycle)]
+            moves[user_id] = (old_rooms[user_id], old_rooms[giver_id])
+            prefs[pref_id].selected = True
+            prefs[pref_id].accepted_by_id = giver_id
+            # Each participant's own move, on their own preference, so it shows up in swap history.
+            # No one sent it, so it counts once and stays out of the request lists (see inbox.py).
+            db.session.add(SwapRequest(
+                preference_id=pref_id,
+                requester_id=user_id,
+                status='committed',
+                from_room_number=old_rooms[user_id],
+                to_room_number=old_rooms[giver_id],
+                resolved_at=db.func.current_timestamp(),
+            ))
+        record_transitions([(user_id, user_id, None) for user_id in user_ids], None, 'committed')
+        move_users(moves)
+        supersede_pending(user_ids)
+        db.session.commit()
+        db.session.expire_all()
+        return True
+    except SwapConflict:
+        db.session.rollback()
+        return False
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def run_matching(dry_run=False, max_length=MAX_CYCLE_LENGTH):
+    """Match every open preference; returns (cycles found, cycles committed)."""
+    graph = SwapGraph(load_open_preferences())
+    cycles = graph.find_cycles(max_length)
+    if dry_run:
+        return cycles, []
+    committed = [cycle for cycle in cycles if commit_cycle(cycle)]
+    return cycles, committed
+
+
+def match_user(user_id, max_length=MAX_CYCLE_LENGTH):
+    """Incremental match after user_id posts a preference; returns the committed cycle or None."""
+    cycle = load_neighbourhood(user_id, max_length).find_cycle_through(user_id, max_length)
+    if cycle and commit_cycle(cycle):
+        return cycle
+    return None
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    from factory import create_app
+
+    parser = argparse.ArgumentParser(description='Find and commit room swap cycles.')
+    parser.add_argument('--dry-run', action='store_true', help='report cycles without committing')
+    parser.add_argument('--max-length', type=int, default=MAX_CYCLE_LENGTH)
+    args = parser.parse_args()
+
+    app = create_app(web=False)
+    with app.app_context():
+        started = time.perf_counter()
+        cycles, committed = run_matching(args.dry_run, args.max_length)
+        elapsed = time.perf_counter() - started
+        for cycle in cycles:
+            print(' -> '.join(str(user_id) for user_id, _ in cycle))
+        print(f"Found {len(cycles)} cycles, committed {len(committed)} in {elapsed:.3f}s")
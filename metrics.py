@@ -0,0 +1,343 @@
+"""
+Per-request SQL and timing instrumentation.
+
+Every request is counted and timed per route. A sampled fraction of requests
+(METRICS_SAMPLE_RATE, 0.0-1.0) additionally records how many SQL statements
+ran, how long they took and how long templates took to render; unsampled
+requests skip the per-statement bookkeeping, which keeps this cheap enough to
+leave on in production.
+
+    GET /metrics              Prometheus text format (this process only)
+    GET /metrics/slow_queries the slowest statements seen, as JSON
+
+Set METRICS_TOKEN to require `Authorization: Bearer <token>` on both;
+without one they only answer a scraper on the same host, connecting directly
+rather than through a proxy (the slow queries list raw SQL). With
+METRICS_DEBUG_HEADER on, sampled responses carry X-Query-Count and a
+Server-Timing header that browser dev tools display.
+
+Counters live in the worker process; with several gunicorn workers each one
+is scraped separately, as Prometheus expects.
+"""
+
+import heapq
+import hmac
+import ipaddress
+import random
+import threading
+import time
+from collections import defaultdict
+
+from flask import abort, before_render_template, g, has_app_context, jsonify, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+# Upper bounds, in seconds, of the request duration histogram
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Endpoints that are never recorded
+SKIP_ENDPOINTS = ('static', 'metrics_endpoint', 'slow_queries')
+
+
+class RequestTrace:
+    """What one sampled request did; kept on flask.g while it runs."""
+
+    __slots__ = ('queries', 'db_time', 'render_time', 'render_started', 'slowest')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.render_started = None
+        self.slowest = (0.0, None)
+
+
+class RouteStats:
+    __slots__ = ('requests', 'duration', 'buckets', 'sampled', 'queries', 'db_time', 'render_time')
+
+    def __init__(self):
+        self.requests = 0
+        self.duration = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.sampled = 0
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+
+
+class Metrics:
+    def __init__(self, sample_rate=0.1, slow_query_count=20, debug_header=False):
+        self.sample_rate = sample_rate
+        self.slow_query_count = slow_query_count
+        self.debug_header = debug_header
+        self.routes = defaultdict(RouteStats)
+        self.statuses = defaultdict(int)
+        self._slow = []  # min-heap of (seconds, seq, statement, route)
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def should_sample(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def record(self, route, method, status, duration, trace=None):
+        with self._lock:
+            stats = self.routes[(method, route)]
+            stats.requests += 1
+            stats.duration += duration
+            for i, bound in enumerate(BUCKETS):
+                if duration <= bound:
+                    stats.buckets[i] += 1
+                    break
+            self.statuses[(method, route, status)] += 1
+            if trace is None:
+                return
+            stats.sampled += 1
+            stats.queries += trace.queries
+            stats.db_time += trace.db_time
+            stats.render_time += trace.render_time
+            seconds, statement = trace.slowest
+            if statement is not None and self.slow_query_count:
+                self._seq += 1
+                entry = (seconds, self._seq, statement, f'{method} {route}')
+                if len(self._slow) < self.slow_query_count:
+                    heapq.heappush(self._slow, entry)
+                elif seconds > self._slow[0][0]:
+                    heapq.heapreplace(self._slow, entry)
+
+    def slow_queries(self):
+        with self._lock:
+            entries = sorted(self._slow, reverse=True)
+        return [{'ms': round(seconds * 1000, 3), 'route': route, 'statement': statement}
+                for seconds, _, statement, route in entries]
+
+    def render(self, extra=()):
+        """Prometheus text exposition of everything recorded so far."""
+        with self._lock:
+            routes = [(key, _copy(stats)) for key, stats in sorted(self.routes.items())]
+            statuses = sorted(self.statuses.items())
+
+        lines = [
+            '# HELP swap_http_requests_total HTTP requests by route and status.',
+            '# TYPE swap_http_requests_total counter',
+        ]
+        for (method, route, status), count in statuses:
+            lines.append(f'swap_http_requests_total{{{_labels(method, route)},status="{status}"}} {count}')
+
+        lines += [
+            '# HELP swap_http_request_duration_seconds Time from before_request to after_request.',
+            '# TYPE swap_http_request_duration_seconds histogram',
+        ]
+        for (method, route), stats in routes:
+            labels = _labels(method, route)
+            cumulative = 0
+            for bound, count in zip(BUCKETS, stats.buckets):
+                cumulative += count
+                lines.append(f'swap_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'swap_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.requests}')
+            lines.append(f'swap_http_request_duration_seconds_sum{{{labels}}} {stats.duration:.6f}')
+            lines.append(f'swap_http_request_duration_seconds_count{{{labels}}} {stats.requests}')
+
+        sampled = [
+            ('swap_sampled_requests_total', 'Requests whose SQL and templates were traced.', 'sampled', '{}'),
+            ('swap_db_queries_total', 'SQL statements issued by sampled requests.', 'queries', '{}'),
+            ('swap_db_seconds_total', 'Time spent in SQL by sampled requests.', 'db_time', '{:.6f}'),
+            ('swap_template_render_seconds_total', 'Template rendering time of sampled requests.',
+             'render_time', '{:.6f}'),
+        ]
+        for name, help_text, attr, fmt in sampled:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for (method, route), stats in routes:
+                lines.append(f'{name}{{{_labels(method, route)}}} {fmt.format(getattr(stats, attr))}')
+
+        for name, kind, help_text, value in extra:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+            # A dict holds one sample per label set: {'rule="writes"': 3, ...}
+            samples = sorted(value.items()) if isinstance(value, dict) else [(None, value)]
+            lines += [f'{name}{{{labels}}} {v}' if labels else f'{name} {v}' for labels, v in samples]
+        return '\n'.join(lines) + '\n'
+
+
+def _copy(stats):
+    copy = RouteStats()
+    for attr in RouteStats.__slots__:
+        value = getattr(stats, attr)
+        setattr(copy, attr, list(value) if isinstance(value, list) else value)
+    return copy
+
+
+def _labels(method, route):
+    route = route.replace('\\', '\\\\').replace('"', '\\"')
+    return f'method="{method}",route="{route}"'
+
+
+def _trace():
+    return g.get('_metrics_trace') if has_app_context() else None
+
+
+# Registered once per process on the Engine class, so every engine (and every
+# app created in tests or scripts) is covered; requests that aren't sampled
+# return after a single lookup.
+_engine_hooks_installed = False
+
+
+def _install_engine_hooks():
+    global _engine_hooks_installed
+    if _engine_hooks_installed:
+        return
+    _engine_hooks_installed = True
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        if _trace() is not None:
+            conn.info.setdefault('_metrics_started', []).append(time.perf_counter())
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        trace = _trace()
+        started = conn.info.get('_metrics_started')
+        if trace is None or not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        trace.queries += 1
+        trace.db_time += elapsed
+        if elapsed > trace.slowest[0]:
+            # Statement text only; parameters may hold personal data
+            trace.slowest = (elapsed, statement)
+
+
+def _is_loopback(address):
+    try:
+        return ipaddress.ip_address(address or '').is_loopback
+    except ValueError:
+        return False
+
+
+def _authorized(app):
+    token = app.config.get('METRICS_TOKEN')
+    if token:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    # A proxy on this host makes every request look local, but it adds X-Forwarded-For
+    return _is_loopback(request.remote_addr) and 'X-Forwarded-For' not in request.headers
+
+
+def _extra_metrics(app):
+    extra = []
+    cache = app.extensions.get('user_cache')
+    if cache is not None:
+        stats = cache.stats()
+        extra += [
+            ('swap_user_cache_hits_total', 'counter', 'User loader cache hits.', stats['hits']),
+            ('swap_user_cache_misses_total', 'counter', 'User loader cache misses.', stats['misses']),
+            ('swap_user_cache_invalidations_total', 'counter', 'User cache entries invalidated.',
+             stats['invalidations']),
+        ]
+    render_cache = app.extensions.get('render_cache')
+    if render_cache is not None:
+        stats = render_cache.stats()
+        extra += [
+            ('swap_render_cache_hits_total', 'counter', 'Pages served from the render cache.', stats['hits']),
+            ('swap_render_cache_misses_total', 'counter', 'Cacheable pages that had to be rendered.', stats['misses']),
+            ('swap_render_cache_not_modified_total', 'counter', 'Revalidations answered with 304.',
+             stats['not_modified']),
+            ('swap_render_cache_bytes', 'gauge', 'Size of the rendered pages held.', stats['bytes']),
+        ]
+    limiter = app.extensions.get('rate_limiter')
+    if limiter is not None:
+        extra.append(('swap_rate_limited_total', 'counter', 'Requests refused with 429, by rule and bucket.',
+                      limiter.stats()))
+    coalescer = app.extensions.get('coalescer')
+    if coalescer is not None:
+        extra.append(('swap_coalesced_requests_total', 'counter',
+                      'Duplicate concurrent requests answered from the first one.', coalescer.coalesced))
+    feed = app.extensions.get('swap_feed')
+    if feed is not None:
+        extra.append(('swap_feed_pushes_total', 'counter', 'Request list updates pushed to users over Socket.IO.',
+                      feed.pushed))
+    room_index = app.extensions.get('room_index')
+    if room_index is not None:
+        stats = room_index.stats()
+        extra += [
+            ('swap_room_index_preferences', 'gauge', 'Open preferences in the compatibility index.',
+             stats['preferences']),
+            ('swap_room_index_bytes', 'gauge', 'Approximate size of the compatibility index.', stats['bytes']),
+            ('swap_room_index_rebuilds_total', 'counter', 'Compatibility index rebuilds.', stats['rebuilds']),
+        ]
+    pool_state = app.extensions.get('db_pool')
+    if pool_state is not None:
+        extra.append(('swap_db_pool_timeouts_total', 'counter',
+                      'Requests that gave up waiting for a database connection.', pool_state['timeouts']))
+        pool = app.extensions['sqlalchemy'].engine.pool
+        if isinstance(pool, QueuePool):
+            extra += [
+                ('swap_db_pool_size', 'gauge', 'Connections the pool keeps open.', pool.size()),
+                ('swap_db_pool_checked_out', 'gauge', 'Connections in use.', pool.checkedout()),
+                ('swap_db_pool_overflow', 'gauge', 'Connections open beyond the pool size.', max(pool.overflow(), 0)),
+            ]
+    return extra
+
+
+def init_metrics(app):
+    metrics = Metrics(
+        sample_rate=app.config.get('METRICS_SAMPLE_RATE', 0.1),
+        slow_query_count=app.config.get('METRICS_SLOW_QUERIES', 20),
+        debug_header=app.config.get('METRICS_DEBUG_HEADER', False),
+    )
+    app.extensions['metrics'] = metrics
+    if not app.config.get('METRICS_ENABLED', True):
+        return metrics
+    _install_engine_hooks()
+
+    @app.before_request
+    def start_request_timer():
+        if request.endpoint in SKIP_ENDPOINTS:
+            return
+        g._metrics_started = time.perf_counter()
+        if metrics.should_sample():
+            g._metrics_trace = RequestTrace()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('_metrics_started', None)
+        if started is None:
+            return response
+        duration = time.perf_counter() - started
+        trace = g.pop('_metrics_trace', None)
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        metrics.record(route, request.method, response.status_code, duration, trace)
+        if trace is not None and metrics.debug_header:
+            response.headers['X-Query-Count'] = str(trace.queries)
+            response.headers['Server-Timing'] = (
+                f'db;dur={trace.db_time * 1000:.2f};desc="{trace.queries} queries", '
+                f'render;dur={trace.render_time * 1000:.2f}, total;dur={duration * 1000:.2f}'
+            )
+        return response
+
+    def start_render(sender, template, context, **extra):
+        trace = _trace()
+        if trace is not None:
+            trace.render_started = time.perf_counter()
+
+    def end_render(sender, template, context, **extra):
+        trace = _trace()
+        if trace is not None and trace.render_started is not None:
+            trace.render_time += time.perf_counter() - trace.render_started
+            trace.render_started = None
+
+    before_render_template.connect(start_render, app, weak=False)
+    template_rendered.connect(end_render, app, weak=False)
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        if not _authorized(app):
+            abort(403)
+        body = metrics.render(_extra_metrics(app))
+        return body, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+    @app.route('/metrics/slow_queries')
+    def slow_queries():
+        if not _authorized(app):
+            abort(403)
+        return jsonify(metrics.slow_queries())
+
+    return metrics
@@ -0,0 +1,258 @@
+"""
+Versioned schema migrations.
+
+Each file in migrations/ named NNNN_description.py is one migration. It
+defines upgrade(op) and may set `transactional = False` when it must run
+outside a transaction (CREATE INDEX CONCURRENTLY on PostgreSQL). Applied
+versions are recorded in schema_migrations, so running the migrator again
+only applies what is new:
+
+    python migrate.py            # apply pending migrations
+    python migrate.py status     # list applied and pending versions
+    python migrate.py --to 3     # stop after version 3
+
+Transactional migrations are recorded in the same transaction as their
+changes. Non-transactional ones must be safe to re-run (every helper on
+Operations is), since a crash can leave them applied but unrecorded.
+On PostgreSQL an advisory lock keeps two deploys from migrating at once.
+
+The app no longer creates tables on import; run this before starting it.
+"""
+
+import importlib.util
+import os
+import re
+import warnings
+from datetime import datetime, timezone
+
+import sqlalchemy as sa
+from sqlalchemy.schema import CreateColumn
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+FILENAME_PATTERN = re.compile(r'^(\d{4})_(\w+)\.py$')
+
+# Arbitrary key for pg_advisory_lock, shared by every process running migrations
+ADVISORY_LOCK_KEY = 7251903
+
+version_table = sa.Table(
+    'schema_migrations', sa.MetaData(),
+    sa.Column('version', sa.Integer, primary_key=True, autoincrement=False),
+    sa.Column('name', sa.String(100), nullable=False),
+    sa.Column('applied_at', sa.DateTime, nullable=False),
+)
+
+
+class Migration:
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+        self._module = None
+
+    @property
+    def module(self):
+        if self._module is None:
+            spec = importlib.util.spec_from_file_location(f'migrations.m{self.version:04d}', self.path)
+            self._module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(self._module)
+        return self._module
+
+    @property
+    def transactional(self):
+        return getattr(self.module, 'transactional', True)
+
+    def __repr__(self):
+        return f'<Migration {self.version:04d} {self.name}>'
+
+
+def discover(directory=MIGRATIONS_DIR):
+    migrations = []
+    for filename in os.listdir(directory):
+        match = FILENAME_PATTERN.match(filename)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    migrations.sort(key=lambda m: m.version)
+    versions = [m.version for m in migrations]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f'duplicate migration versions in {directory}')
+    return migrations
+
+
+class Operations:
+    """Dialect-aware, idempotent schema helpers handed to each upgrade(op)."""
+
+    def __init__(self, conn, transactional=True):
+        self.conn = conn
+        self.dialect = conn.dialect.name
+        self.postgres = self.dialect == 'postgresql'
+        self.sqlite = self.dialect == 'sqlite'
+        # Boolean literal as each dialect renders it, so partial index predicates match queries
+        self.true = '1' if self.sqlite else 'true'
+        # CONCURRENTLY is only allowed outside a transaction block
+        self.concurrently = self.postgres and not transactional
+
+    def execute(self, sql, **params):
+        return self.conn.execute(sa.text(sql), params)
+
+    def _inspector(self):
+        # Fresh each time: an inspector caches what it has already seen
+        return sa.inspect(self.conn)
+
+    def has_table(self, name):
+        return self._inspector().has_table(name)
+
+    def has_column(self, table, column):
+        return any(c['name'] == column for c in self._inspector().get_columns(table))
+
+    def has_index(self, table, name):
+        return any(i['name'] == name for i in self._inspector().get_indexes(table))
+
+    def ensure_table(self, table):
+        """Create table, or add whichever of its columns and indexes are missing."""
+        if not self.has_table(table.name):
+            table.create(self.conn)
+            return
+        for column in table.columns:
+            self.add_column(table.name, column)
+        for index in table.indexes:
+            index.create(self.conn, checkfirst=True)
+
+    def add_column(self, table, column):
+        if self.has_column(table, column.name):
+            return
+        ddl = CreateColumn(column).compile(dialect=self.conn.dialect)
+        # Column-level REFERENCES works in ADD COLUMN on SQLite as well as PostgreSQL
+        for key in column.foreign_keys:
+            target_table, target_column = key.target_fullname.split('.')
+            ddl = f'{ddl} REFERENCES {target_table} ({target_column})'
+        self.execute(f'ALTER TABLE {table} ADD COLUMN {ddl}')
+
+    def create_index(self, name, table, expressions, unique=False, where=None, using=None):
+        """
+        CREATE INDEX IF NOT EXISTS, concurrently on PostgreSQL outside a transaction.
+
+        expressions are SQL snippets ('lower(name)', 'room_number gin_trgm_ops');
+        `using` (e.g. 'gin') is only honoured on PostgreSQL.
+        """
+        if self.concurrently:
+            # A failed concurrent build leaves an INVALID index that IF NOT EXISTS would keep
+            valid = self.execute(
+                'SELECT i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid '
+                'WHERE c.relname = :name', name=name,
+            ).scalar()
+            if valid is False:
+                self.drop_index(name)
+        sql = ['CREATE', 'UNIQUE INDEX' if unique else 'INDEX']
+        if self.concurrently:
+            sql.append('CONCURRENTLY')
+        sql.append(f'IF NOT EXISTS {name} ON {table}')
+        if using and self.postgres:
+            sql.append(f'USING {using}')
+        sql.append(f'({", ".join(expressions)})')
+        if where:
+            sql.append(f'WHERE {where}')
+        self.execute(' '.join(sql))
+
+    def drop_index(self, name):
+        self.execute(f'DROP INDEX {"CONCURRENTLY " if self.concurrently else ""}IF EXISTS {name}')
+
+    def analyze(self):
+        """Refresh planner statistics after reshaping indexes."""
+        self.execute('ANALYZE')
+
+    def create_extension(self, name):
+        """Install a PostgreSQL extension; returns False where that isn't possible."""
+        if not self.postgres:
+            return False
+        try:
+            if self.concurrently:
+                self.execute(f'CREATE EXTENSION IF NOT EXISTS {name}')
+            else:
+                with self.conn.begin_nested():
+                    self.execute(f'CREATE EXTENSION IF NOT EXISTS {name}')
+        except sa.exc.DBAPIError:
+            # Managed databases may not grant CREATE EXTENSION
+            return False
+        return True
+
+
+def applied_versions(engine):
+    with engine.begin() as conn:
+        version_table.create(conn, checkfirst=True)
+        return {row.version: row for row in conn.execute(sa.select(version_table))}
+
+
+def _record(conn, migration):
+    conn.execute(version_table.insert().values(
+        version=migration.version, name=migration.name,
+        applied_at=datetime.now(timezone.utc).replace(tzinfo=None),
+    ))
+
+
+def _apply(engine, migration):
+    if migration.transactional:
+        with engine.begin() as conn:
+            migration.module.upgrade(Operations(conn))
+            _record(conn, migration)
+    else:
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            migration.module.upgrade(Operations(conn, transactional=False))
+            _record(conn, migration)
+
+
+def upgrade(engine, target=None, log=print):
+    """Apply every pending migration up to target (all if None); returns those applied."""
+    lock = None
+    if engine.dialect.name == 'postgresql':
+        lock = engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+        lock.execute(sa.text('SELECT pg_advisory_lock(:key)'), {'key': ADVISORY_LOCK_KEY})
+    try:
+        done = applied_versions(engine)
+        applied = []
+        for migration in discover():
+            if migration.version in done or (target is not None and migration.version > target):
+                continue
+            log(f'Applying {migration.version:04d} {migration.name}')
+            _apply(engine, migration)
+            applied.append(migration)
+        return applied
+    finally:
+        if lock is not None:
+            lock.execute(sa.text('SELECT pg_advisory_unlock(:key)'), {'key': ADVISORY_LOCK_KEY})
+            lock.close()
+
+
+def reset(engine, log=print):
+    """Drop every table and migrate from scratch. Development and benchmarks only."""
+    metadata = sa.MetaData()
+    with warnings.catch_warnings():
+        # Expression indexes such as lower(name) can't be reflected on SQLite; they drop with their table
+        warnings.simplefilter('ignore', sa.exc.SAWarning)
+        metadata.reflect(engine)
+    metadata.drop_all(engine)
+    return upgrade(engine, log=log)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from factory import create_app
+    from models import db
+
+    parser = argparse.ArgumentParser(description='Apply schema migrations.')
+    parser.add_argument('command', nargs='?', choices=('upgrade', 'status'), default='upgrade')
+    parser.add_argument('--to', type=int, help='stop after this version')
+    args = parser.parse_args()
+
+    app = create_app(web=False)
+    with app.app_context():
+        engine = db.engine
+        if args.command == 'status':
+            done = applied_versions(engine)
+            for migration in discover():
+                row = done.get(migration.version)
+                state = f'applied {row.applied_at:%Y-%m-%d %H:%M}' if row else 'pending'
+                print(f'{migration.version:04d} {migration.name:<40} {state}')
+        else:
+            applied = upgrade(engine, args.to)
+            print(f"Applied {len(applied)} migrations" if applied else "Database is up to date")
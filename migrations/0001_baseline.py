@@ -0,0 +1,49 @@
+"""
+Users, room preferences and swap requests as they stood before migrations.
+
+Databases made by the old db.create_all() already have these tables; for
+them this only adds what older deployments may lack (is_looking_to_swap, the
+room snapshot columns on swap_requests, and the per-column indexes). It
+replaces add_swap_availability.py, which only worked through psycopg2.
+"""
+
+import sqlalchemy as sa
+
+metadata = sa.MetaData()
+
+users = sa.Table(
+    'users', metadata,
+    sa.Column('id', sa.Integer, primary_key=True, autoincrement=True),
+    sa.Column('college_id', sa.String(20), unique=True, nullable=False),
+    sa.Column('name', sa.String(50), unique=True, nullable=False),
+    sa.Column('password', sa.String(100), nullable=False),
+    sa.Column('email', sa.String(100), unique=True, nullable=False),
+    sa.Column('room_number', sa.String(20), nullable=False, index=True),
+    sa.Column('is_looking_to_swap', sa.Boolean, server_default=sa.true(), index=True),
+)
+
+room_preferences = sa.Table(
+    'room_preferences', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id'), nullable=False, index=True),
+    sa.Column('available', sa.String(20), nullable=False, index=True),
+    sa.Column('needed', sa.String(20), nullable=False, index=True),
+    sa.Column('selected', sa.Boolean, index=True),
+    sa.Column('accepted_by_id', sa.Integer, sa.ForeignKey('users.id'), nullable=True, index=True),
+    sa.Column('created_at', sa.DateTime, index=True),
+)
+
+swap_requests = sa.Table(
+    'swap_requests', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('preference_id', sa.Integer, sa.ForeignKey('room_preferences.id'), nullable=False, index=True),
+    sa.Column('requester_id', sa.Integer, sa.ForeignKey('users.id'), nullable=False, index=True),
+    sa.Column('status', sa.String(20), nullable=False, index=True),
+    sa.Column('from_room_number', sa.String(20)),
+    sa.Column('to_room_number', sa.String(20)),
+)
+
+
+def upgrade(op):
+    for table in metadata.sorted_tables:
+        op.ensure_table(table)
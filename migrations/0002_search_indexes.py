@@ -0,0 +1,34 @@
+"""
+Indexes for the user directory search (see directory.py).
+
+Replaces migrate_indexes.py. Its idx_* copies of the per-column indexes only
+slowed writes down (and idx_room_preferences_accepted_by named a column that
+doesn't exist), so they are dropped wherever that script managed to create
+them.
+"""
+
+transactional = False
+
+DUPLICATE_INDEXES = (
+    'idx_users_college_id',
+    'idx_users_email',
+    'idx_room_preferences_user_id',
+    'idx_room_preferences_available',
+    'idx_room_preferences_needed',
+    'idx_room_preferences_selected',
+    'idx_room_preferences_accepted_by',
+    'idx_room_preferences_created_at',
+)
+
+
+def upgrade(op):
+    for name in DUPLICATE_INDEXES:
+        op.drop_index(name)
+
+    op.create_index('ix_users_name_lower', 'users', ['lower(name)'])
+
+    # Substring room searches use trigram indexes where pg_trgm is available
+    if op.create_extension('pg_trgm'):
+        op.create_index('idx_users_room_number_trgm', 'users', ['room_number gin_trgm_ops'], using='gin')
+        op.create_index('idx_room_preferences_available_trgm', 'room_preferences',
+                        ['available gin_trgm_ops'], using='gin')
@@ -0,0 +1,28 @@
+"""
+Persistent outbound mail queue (see mail_queue.py).
+"""
+
+import sqlalchemy as sa
+
+metadata = sa.MetaData()
+
+mail_outbox = sa.Table(
+    'mail_outbox', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('recipient', sa.String(100), nullable=False),
+    sa.Column('subject', sa.String(200), nullable=False),
+    sa.Column('body', sa.Text, nullable=False),
+    sa.Column('sender', sa.String(100)),
+    sa.Column('status', sa.String(20), nullable=False),
+    sa.Column('attempts', sa.Integer, nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime, nullable=False),
+    sa.Column('claim_token', sa.String(32)),
+    sa.Column('last_error', sa.String(500)),
+    sa.Column('created_at', sa.DateTime),
+    sa.Column('sent_at', sa.DateTime),
+    sa.Index('ix_mail_outbox_status_due', 'status', 'next_attempt_at'),
+)
+
+
+def upgrade(op):
+    op.ensure_table(mail_outbox)
@@ -0,0 +1,41 @@
+"""
+Per-user request counters (see inbox.py), backfilled from swap_requests.
+
+A rotation's move is a committed request on the mover's own preference
+(see matching.commit_cycle); like inbox._counts, it counts once.
+"""
+
+import sqlalchemy as sa
+
+metadata = sa.MetaData()
+
+# Only here so the foreign key below resolves; users itself is left alone
+sa.Table('users', metadata, sa.Column('id', sa.Integer, primary_key=True))
+
+inbox_summaries = sa.Table(
+    'inbox_summaries', metadata,
+    sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id'), primary_key=True),
+    sa.Column('pending_invites', sa.Integer, nullable=False),
+    sa.Column('pending_sent', sa.Integer, nullable=False),
+    sa.Column('committed_swaps', sa.Integer, nullable=False),
+)
+
+BACKFILL = """
+INSERT INTO inbox_summaries (user_id, pending_invites, pending_sent, committed_swaps)
+SELECT u.id,
+       (SELECT count(*) FROM swap_requests r JOIN room_preferences p ON r.preference_id = p.id
+         WHERE p.user_id = u.id AND r.status = 'pending'),
+       (SELECT count(*) FROM swap_requests r
+         WHERE r.requester_id = u.id AND r.status = 'pending'),
+       (SELECT count(*) FROM swap_requests r JOIN room_preferences p ON r.preference_id = p.id
+         WHERE p.user_id = u.id AND r.status = 'committed' AND r.requester_id <> p.user_id)
+     + (SELECT count(*) FROM swap_requests r
+         WHERE r.requester_id = u.id AND r.status = 'committed')
+FROM users u
+WHERE NOT EXISTS (SELECT 1 FROM inbox_summaries s WHERE s.user_id = u.id)
+"""
+
+
+def upgrade(op):
+    op.ensure_table(inbox_summaries)
+    op.execute(BACKFILL)
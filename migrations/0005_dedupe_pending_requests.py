@@ -0,0 +1,50 @@
+"""
+Supersede duplicate pending requests so 0006 can make them unique.
+
+Double-clicking "Request" could create several pending requests for the same
+(preference, requester). The oldest is kept; the rest become 'superseded',
+and the inbox counters of everyone involved are recomputed.
+"""
+
+import sqlalchemy as sa
+
+DUPLICATES = """
+SELECT r.id, r.requester_id, p.user_id
+FROM swap_requests r JOIN room_preferences p ON r.preference_id = p.id
+WHERE r.status = 'pending' AND EXISTS (
+    SELECT 1 FROM swap_requests older
+    WHERE older.status = 'pending' AND older.preference_id = r.preference_id
+      AND older.requester_id = r.requester_id AND older.id < r.id)
+"""
+
+# Same as 0004, restricted to the affected users
+BACKFILL = """
+INSERT INTO inbox_summaries (user_id, pending_invites, pending_sent, committed_swaps)
+SELECT u.id,
+       (SELECT count(*) FROM swap_requests r JOIN room_preferences p ON r.preference_id = p.id
+         WHERE p.user_id = u.id AND r.status = 'pending'),
+       (SELECT count(*) FROM swap_requests r
+         WHERE r.requester_id = u.id AND r.status = 'pending'),
+       (SELECT count(*) FROM swap_requests r JOIN room_preferences p ON r.preference_id = p.id
+         WHERE p.user_id = u.id AND r.status = 'committed' AND r.requester_id <> p.user_id)
+     + (SELECT count(*) FROM swap_requests r
+         WHERE r.requester_id = u.id AND r.status = 'committed')
+FROM users u
+WHERE u.id IN :user_ids
+"""
+
+
+def upgrade(op):
+    rows = op.execute(DUPLICATES).all()
+    if not rows:
+        return
+    user_ids = sorted({row.requester_id for row in rows} | {row.user_id for row in rows})
+    op.conn.execute(
+        sa.text("UPDATE swap_requests SET status = 'superseded' WHERE id IN :ids")
+        .bindparams(sa.bindparam('ids', expanding=True)),
+        {'ids': [row.id for row in rows]},
+    )
+    expanding = sa.bindparam('user_ids', expanding=True)
+    op.conn.execute(sa.text('DELETE FROM inbox_summaries WHERE user_id IN :user_ids').bindparams(expanding),
+                    {'user_ids': user_ids})
+    op.conn.execute(sa.text(BACKFILL).bindparams(expanding), {'user_ids': user_ids})
@@ -0,0 +1,49 @@
+"""
+Index set matched to the queries the app actually runs.
+
+Most columns had their own index, including low-cardinality flags (selected,
+status, is_looking_to_swap) that no query can use selectively, and every one
+of them was maintained on each insert. They are replaced by composite and
+partial indexes for the hot lookups:
+
+    users             (name, id) WHERE is_looking_to_swap    directory pages
+    room_preferences  (user_id, available, needed)           own preferences, duplicate check
+    swap_requests     (requester_id, status)                 sent requests, inbox counts
+                      (preference_id, status)                invitations, history
+                      UNIQUE (preference_id, requester_id)   one pending request each
+                          WHERE status = 'pending'
+    mail_outbox       (claim_token) WHERE status = 'sending' worker claims
+
+New indexes are built before the old ones are dropped, so no query is ever
+left without one. benchmarks/explain_indexes.py checks the query plans.
+"""
+
+transactional = False
+
+OBSOLETE_INDEXES = (
+    'ix_users_is_looking_to_swap',
+    'ix_room_preferences_user_id',
+    'ix_room_preferences_needed',
+    'ix_room_preferences_selected',
+    'ix_room_preferences_accepted_by_id',
+    'ix_room_preferences_created_at',
+    'ix_swap_requests_preference_id',
+    'ix_swap_requests_requester_id',
+    'ix_swap_requests_status',
+)
+
+
+def upgrade(op):
+    op.create_index('ix_users_looking_name', 'users', ['name', 'id'], where=f'is_looking_to_swap = {op.true}')
+    op.create_index('ix_room_preferences_user_rooms', 'room_preferences', ['user_id', 'available', 'needed'])
+    op.create_index('ix_room_preferences_accepted_by', 'room_preferences', ['accepted_by_id'],
+                    where='accepted_by_id IS NOT NULL')
+    op.create_index('ix_swap_requests_requester_status', 'swap_requests', ['requester_id', 'status'])
+    op.create_index('ix_swap_requests_preference_status', 'swap_requests', ['preference_id', 'status'])
+    op.create_index('uq_swap_requests_pending', 'swap_requests', ['preference_id', 'requester_id'],
+                    unique=True, where="status = 'pending'")
+    op.create_index('ix_mail_outbox_claim', 'mail_outbox', ['claim_token'], where="status = 'sending'")
+
+    for name in OBSOLETE_INDEXES:
+        op.drop_index(name)
+    op.analyze()
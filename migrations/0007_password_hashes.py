@@ -0,0 +1,13 @@
+"""
+Room for password hashes in users.password.
+
+A scrypt hash from werkzeug is about 160 characters, more than the old
+VARCHAR(100). Widening a VARCHAR on PostgreSQL only updates the catalog;
+SQLite doesn't enforce lengths. Existing plaintext passwords stay as they
+are and are hashed on each user's next login (see credentials.py).
+"""
+
+
+def upgrade(op):
+    if op.postgres:
+        op.execute('ALTER TABLE users ALTER COLUMN password TYPE VARCHAR(255)')
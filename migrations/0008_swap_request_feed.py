@@ -0,0 +1,22 @@
+"""
+Change log and per-user sequence numbers for the live request lists (see feed.py).
+"""
+
+import sqlalchemy as sa
+
+metadata = sa.MetaData()
+
+swap_request_changes = sa.Table(
+    'swap_request_changes', metadata,
+    sa.Column('user_id', sa.Integer, primary_key=True, autoincrement=False),
+    sa.Column('seq', sa.Integer, primary_key=True, autoincrement=False),
+    sa.Column('request_id', sa.Integer, nullable=False),
+    sa.Column('as_owner', sa.Boolean, nullable=False),
+    sa.Column('created_at', sa.DateTime, nullable=False),
+)
+
+
+def upgrade(op):
+    # Existing users start their feed at 0; their current lists are the baseline
+    op.add_column('inbox_summaries', sa.Column('feed_seq', sa.Integer, nullable=False, server_default='0'))
+    op.ensure_table(swap_request_changes)
@@ -0,0 +1,37 @@
+"""
+Archive table for resolved swap requests, and when each request was resolved (see archive.py).
+
+Requests resolved before this migration have no recorded time; they count
+as resolved now, so they reach the archive ARCHIVE_AFTER_DAYS from now, or
+straight away with `python archive.py --days 0`.
+"""
+
+import sqlalchemy as sa
+
+transactional = False
+
+metadata = sa.MetaData()
+
+swap_request_archive = sa.Table(
+    'swap_request_archive', metadata,
+    sa.Column('id', sa.Integer, primary_key=True, autoincrement=False),
+    sa.Column('preference_id', sa.Integer, nullable=False),
+    sa.Column('owner_id', sa.Integer),
+    sa.Column('requester_id', sa.Integer, nullable=False),
+    sa.Column('status', sa.String(20), nullable=False),
+    sa.Column('from_room_number', sa.String(20)),
+    sa.Column('to_room_number', sa.String(20)),
+    sa.Column('resolved_at', sa.DateTime),
+    sa.Column('archived_at', sa.DateTime, nullable=False),
+    sa.Index('ix_swap_request_archive_requester', 'requester_id', 'status', 'id'),
+    sa.Index('ix_swap_request_archive_owner', 'owner_id', 'status', 'id'),
+)
+
+
+def upgrade(op):
+    op.add_column('swap_requests', sa.Column('resolved_at', sa.DateTime))
+    # Safe to re-run: only rows still missing a time are touched
+    op.execute("UPDATE swap_requests SET resolved_at = CURRENT_TIMESTAMP "
+               "WHERE status <> 'pending' AND resolved_at IS NULL")
+    op.create_index('ix_swap_requests_resolved', 'swap_requests', ['resolved_at'], where='resolved_at IS NOT NULL')
+    op.ensure_table(swap_request_archive)
@@ -0,0 +1,88 @@
+"""
+Rooms as rows of their own, and integer references to them (see rooms.py).
+
+Every room number found in users.room_number or room_preferences becomes a
+room, its floor the first digit of a three-digit number and its capacity
+unknown until `python allocations.py import-rooms` sets it. users.room_id and the
+preferences' available_room_id / needed_room_id are then filled in from the
+numbers; 'ANY' needs (written 'Any' by older versions) keep NULL, and 'FLOOR n'
+needs, in whatever case and spacing they were typed, get needed_floor n and
+the label the dashboard writes now. Each step only touches rows still missing
+a room or floor, so it is safe to re-run.
+"""
+
+import re
+
+import sqlalchemy as sa
+
+transactional = False
+
+BATCH_SIZE = 1000
+ROOM_NUMBER = re.compile(r'^\d{3}$')
+FLOOR_NEED = re.compile(r'^FLOOR ?(\d{1,2})$')
+
+metadata = sa.MetaData()
+
+rooms = sa.Table(
+    'rooms', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('number', sa.String(20), unique=True, nullable=False),
+    sa.Column('block', sa.String(20)),
+    sa.Column('floor', sa.Integer),
+    sa.Column('capacity', sa.Integer),
+    sa.Column('attributes', sa.JSON),
+    sa.Index('ix_rooms_floor', 'floor'),
+)
+
+NUMBERS = """
+SELECT room_number FROM users WHERE room_id IS NULL
+UNION SELECT available FROM room_preferences WHERE available_room_id IS NULL
+UNION SELECT needed FROM room_preferences
+ WHERE needed_room_id IS NULL AND upper(needed) <> 'ANY' AND upper(needed) NOT LIKE 'FLOOR%'
+"""
+
+BACKFILL = (
+    "UPDATE room_preferences SET needed = 'ANY' WHERE upper(needed) = 'ANY' AND needed <> 'ANY'",
+    "UPDATE users SET room_id = (SELECT r.id FROM rooms r WHERE r.number = users.room_number) "
+    "WHERE room_id IS NULL",
+    "UPDATE room_preferences SET available_room_id = "
+    "(SELECT r.id FROM rooms r WHERE r.number = room_preferences.available) WHERE available_room_id IS NULL",
+    "UPDATE room_preferences SET needed_room_id = "
+    "(SELECT r.id FROM rooms r WHERE r.number = room_preferences.needed) "
+    "WHERE needed_room_id IS NULL AND needed <> 'ANY'",
+)
+
+FLOOR_NEEDS = "SELECT id, needed FROM room_preferences WHERE needed_floor IS NULL AND upper(needed) LIKE 'FLOOR%'"
+SET_FLOOR = sa.text("UPDATE room_preferences SET needed = :needed, needed_floor = :floor WHERE id = :pref_id")
+
+
+def upgrade(op):
+    op.ensure_table(rooms)
+    op.add_column('users', sa.Column('room_id', sa.Integer, sa.ForeignKey('rooms.id')))
+    op.add_column('room_preferences', sa.Column('available_room_id', sa.Integer, sa.ForeignKey('rooms.id')))
+    op.add_column('room_preferences', sa.Column('needed_room_id', sa.Integer, sa.ForeignKey('rooms.id')))
+    op.add_column('room_preferences', sa.Column('needed_floor', sa.Integer))
+
+    known = {number for (number,) in op.execute('SELECT number FROM rooms')}
+    numbers = sorted({number for (number,) in op.execute(NUMBERS) if number} - known)
+    for start in range(0, len(numbers), BATCH_SIZE):
+        op.conn.execute(rooms.insert(), [
+            {'number': number, 'floor': int(number[0]) if ROOM_NUMBER.match(number) else None}
+            for number in numbers[start:start + BATCH_SIZE]
+        ])
+    for statement in BACKFILL:
+        op.execute(statement)
+    floors = []
+    for pref_id, needed in op.execute(FLOOR_NEEDS):
+        match = FLOOR_NEED.match(' '.join(needed.upper().split()))
+        if match:
+            floors.append({'pref_id': pref_id, 'needed': f'FLOOR {int(match.group(1))}', 'floor': int(match.group(1))})
+    for start in range(0, len(floors), BATCH_SIZE):
+        op.conn.execute(SET_FLOOR, floors[start:start + BATCH_SIZE])
+
+    op.create_index('ix_users_room_id', 'users', ['room_id'])
+    op.create_index('ix_room_preferences_available_room', 'room_preferences', ['available_room_id'])
+    op.create_index('ix_room_preferences_needed_room', 'room_preferences', ['needed_room_id'],
+                    where='needed_room_id IS NOT NULL')
+    op.create_index('ix_room_preferences_needed_floor', 'room_preferences', ['needed_floor'],
+                    where='needed_floor IS NOT NULL')
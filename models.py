@@ -2,7 +2,24 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from sqlalchemy.orm import relationship
 
-db = SQLAlchemy()
+from credentials import hash_password, verify_password
+from db_engine import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# A room of the hostel; users hold one and preferences offer and ask for them (see rooms.py)
+class Room(db.Model):
+    __tablename__ = 'rooms'
+
+    id = db.Column(db.Integer, primary_key=True)
+    number = db.Column(db.String(20), unique=True, nullable=False)  # as users type it, e.g. '214'
+    block = db.Column(db.String(20))
+    floor = db.Column(db.Integer, index=True)  # from the number unless imported
+    capacity = db.Column(db.Integer)           # beds; NULL until known, and then never offered as free
+    attributes = db.Column(db.JSON)            # free-form, e.g. {"ac": true, "bath": "attached"}
+
+    def __repr__(self):
+        return f'<Room {self.number}>'
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -10,16 +27,34 @@ class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     college_id = db.Column(db.String(20), unique=True, nullable=False)
     name = db.Column(db.String(50), unique=True, nullable=False)
-    password = db.Column(db.String(100), nullable=False)
-    email = db.Column(db.String(100), unique=True, nullable=False, index=True)
+    password = db.Column(db.String(255), nullable=False)  # werkzeug hash, see credentials.py
+    email = db.Column(db.String(100), unique=True, nullable=False)
     room_number = db.Column(db.String(20), nullable=False, index=True)
-    is_looking_to_swap = db.Column(db.Boolean, default=True, index=True)  # Toggle for swap availability
+    room_id = db.Column(db.Integer, db.ForeignKey('rooms.id'), index=True)  # kept in step with room_number
+    is_looking_to_swap = db.Column(db.Boolean, default=True)  # Toggle for swap availability
+
+    __table_args__ = (
+        # Case-insensitive prefix search on name (see directory.search_users)
+        db.Index('ix_users_name_lower', db.func.lower(name)),
+        # The directory pages through users looking to swap in (name, id) order
+        db.Index('ix_users_looking_name', name, id,
+                 sqlite_where=is_looking_to_swap == True, postgresql_where=is_looking_to_swap == True),  # noqa: E712
+    )
+
+    room = relationship('Room')
 
     def get_id(self):
         return str(self.id)
 
     def set_password(self, new_password):
-        self.password = new_password
+        self.password = hash_password(new_password)
+
+    def check_password(self, password):
+        # Plaintext or outdated hashes are replaced on a successful check; the caller commits
+        matches, rehashed = verify_password(self.password, password)
+        if rehashed:
+            self.password = rehashed
+        return matches
 
     def __repr__(self):
         return f'<User {self.name}>'
@@ -28,16 +63,36 @@ class RoomPreference(db.Model):
     __tablename__ = 'room_preferences'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     available = db.Column(db.String(20), nullable=False, index=True)
-    needed = db.Column(db.String(20), nullable=False, index=True)
-    selected = db.Column(db.Boolean, default=False, index=True)
-    accepted_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)
-    created_at = db.Column(db.DateTime, default=db.func.current_timestamp(), index=True)
+    needed = db.Column(db.String(20), nullable=False)  # a room number, 'FLOOR 2' or 'ANY'
+    # Filled in from available/needed on flush (see rooms.py); NULL needed_room_id is a wildcard
+    available_room_id = db.Column(db.Integer, db.ForeignKey('rooms.id'))
+    needed_room_id = db.Column(db.Integer, db.ForeignKey('rooms.id'))
+    needed_floor = db.Column(db.Integer)
+    selected = db.Column(db.Boolean, default=False)
+    accepted_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+    __table_args__ = (
+        # A user's own preferences, including the duplicate check on posting
+        db.Index('ix_room_preferences_user_rooms', user_id, available, needed),
+        # Matching follows preferences by the room they offer, and by the room or floor they need
+        db.Index('ix_room_preferences_available_room', available_room_id),
+        db.Index('ix_room_preferences_needed_room', needed_room_id,
+                 sqlite_where=needed_room_id.isnot(None), postgresql_where=needed_room_id.isnot(None)),
+        db.Index('ix_room_preferences_needed_floor', needed_floor,
+                 sqlite_where=needed_floor.isnot(None), postgresql_where=needed_floor.isnot(None)),
+        # Mostly NULL; only here so deleting a user needn't scan for references
+        db.Index('ix_room_preferences_accepted_by', accepted_by_id,
+                 sqlite_where=accepted_by_id.isnot(None), postgresql_where=accepted_by_id.isnot(None)),
+    )
 
     # Relationships
     user = relationship('User', foreign_keys=[user_id], backref='room_preferences')
     accepted_user = relationship('User', foreign_keys=[accepted_by_id], post_update=True)
+    available_room = relationship('Room', foreign_keys=[available_room_id])
+    needed_room = relationship('Room', foreign_keys=[needed_room_id])
 
     def __repr__(self):
         return f'<RoomPreference {self.available} -> {self.needed}>'
@@ -46,11 +101,22 @@ class SwapRequest(db.Model):
     __tablename__ = 'swap_requests'
 
     id = db.Column(db.Integer, primary_key=True)
-    preference_id = db.Column(db.Integer, db.ForeignKey('room_preferences.id'), nullable=False, index=True)
-    requester_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
-    status = db.Column(db.String(20), default='pending', nullable=False, index=True)  # pending, committed, rejected
+    preference_id = db.Column(db.Integer, db.ForeignKey('room_preferences.id'), nullable=False)
+    requester_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, committed, rejected, superseded
     from_room_number = db.Column(db.String(20))  # requester's room at request time
     to_room_number = db.Column(db.String(20))    # preference owner's room at request time
+    resolved_at = db.Column(db.DateTime)         # when it stopped being pending; see archive.py
+
+    __table_args__ = (
+        db.Index('ix_swap_requests_requester_status', requester_id, status),
+        db.Index('ix_swap_requests_preference_status', preference_id, status),
+        db.Index('ix_swap_requests_resolved', resolved_at,
+                 sqlite_where=resolved_at.isnot(None), postgresql_where=resolved_at.isnot(None)),
+        # At most one pending request per (preference, requester)
+        db.Index('uq_swap_requests_pending', preference_id, requester_id, unique=True,
+                 sqlite_where=status == 'pending', postgresql_where=status == 'pending'),
+    )
 
     # Relationships
     requester = relationship('User', foreign_keys=[requester_id])
@@ -58,3 +124,80 @@ class SwapRequest(db.Model):
 
     def __repr__(self):
         return f'<SwapRequest {self.id} by {self.requester_id} for {self.preference_id}>'
+
+# Resolved swap requests moved out of swap_requests by archive.py, under their original ids
+class SwapRequestArchive(db.Model):
+    __tablename__ = 'swap_request_archive'
+
+    # No foreign keys: archived requests outlive the preferences they were made for
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    preference_id = db.Column(db.Integer, nullable=False)
+    owner_id = db.Column(db.Integer)  # the preference's owner when archived
+    requester_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    from_room_number = db.Column(db.String(20))
+    to_room_number = db.Column(db.String(20))
+    resolved_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=db.func.current_timestamp(), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_swap_request_archive_requester', requester_id, status, id),
+        db.Index('ix_swap_request_archive_owner', owner_id, status, id),
+    )
+
+    def __repr__(self):
+        return f'<SwapRequestArchive {self.id} by {self.requester_id} for {self.preference_id} ({self.status})>'
+
+# Per-user request counters maintained by inbox.py; rebuildable from swap_requests
+class InboxSummary(db.Model):
+    __tablename__ = 'inbox_summaries'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    pending_invites = db.Column(db.Integer, default=0, nullable=False)
+    pending_sent = db.Column(db.Integer, default=0, nullable=False)
+    committed_swaps = db.Column(db.Integer, default=0, nullable=False)
+    # Sequence number of the latest entry in this user's SwapRequestChange log
+    feed_seq = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+
+    def __repr__(self):
+        return f'<InboxSummary {self.user_id}: {self.pending_invites}/{self.pending_sent}/{self.committed_swaps}>'
+
+# Per-user log of swap request changes behind the live request lists (see feed.py)
+class SwapRequestChange(db.Model):
+    __tablename__ = 'swap_request_changes'
+
+    # No foreign keys: entries outlive cancelled requests, which show up as removals
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    request_id = db.Column(db.Integer, nullable=False)
+    as_owner = db.Column(db.Boolean, nullable=False)  # an invitation to user_id, else a request user_id sent
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp(), nullable=False)
+
+    def __repr__(self):
+        return f'<SwapRequestChange {self.user_id}#{self.seq}: request {self.request_id}>'
+
+class OutboxMessage(db.Model):
+    __tablename__ = 'mail_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(100), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    sender = db.Column(db.String(100))
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    # Due time for pending rows; lease expiry for rows a worker is sending
+    next_attempt_at = db.Column(db.DateTime, default=db.func.current_timestamp(), nullable=False)
+    claim_token = db.Column(db.String(32))
+    last_error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_mail_outbox_status_due', 'status', 'next_attempt_at'),
+        db.Index('ix_mail_outbox_claim', 'claim_token',
+                 sqlite_where=db.text("status = 'sending'"), postgresql_where=db.text("status = 'sending'")),
+    )
+
+    def __repr__(self):
+        return f'<OutboxMessage {self.id} to {self.recipient} ({self.status})>'
@@ -0,0 +1,41 @@
+"""
+Socket.IO room naming and targeted delivery.
+
+Every authenticated socket joins its owner's personal room on connect, so a
+notification costs one delivery per recipient instead of one per connected
+client. Sockets may also subscribe to the room for their own floor.
+Everything is sent by the server after the change it reports has
+committed, to recipients taken from the database; clients only listen.
+"""
+
+from datetime import datetime, timezone
+
+
+def user_room(user_id):
+    return f'user:{user_id}'
+
+
+def floor_room(room_number):
+    """Room for everyone on the floor of a room number like '204' (floor '2')."""
+    room_number = (room_number or '').strip()
+    if len(room_number) < 2 or not room_number[0].isalnum():
+        return None
+    return f'floor:{room_number[0]}'
+
+
+def timestamp():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def notify_user(socketio, user_id, event, payload):
+    socketio.emit(event, payload, to=user_room(user_id))
+
+
+def notify_floor(socketio, need, event, payload):
+    """Emit to the floor that can meet a parsed need (validation.Need); ANY names no floor."""
+    if need.room:
+        room = floor_room(need.room)
+    else:
+        room = f'floor:{need.floor}' if need.floor is not None else None
+    if room:
+        socketio.emit(event, payload, to=room)
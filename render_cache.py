@@ -0,0 +1,273 @@
+"""
+Rendered-page cache with ETags for the request tables.
+
+Pages such as /invitations only change when one of the viewer's swap
+requests changes state, or when someone shown on it edits their profile.
+Each cached page is keyed on the viewer, the URL and a set of version
+counters:
+
+    user:<id>   bumped for both parties of every request transition
+                (inbox.record_transitions) and when that user's row or
+                preferences change
+    profiles    bumped when any user or existing preference changes
+    directory   bumped when any user or preference is added, changed or removed
+
+Counters are bumped after the transaction commits, from session events, so
+every write path (accept, commit_request, reject_request, cancel,
+edit_profile, the matching engine, imports) invalidates without calling
+this module. Bulk Core statements that bypass the ORM report what they
+touched through mark_stale() or user_cache.mark_changed().
+
+The ETag is derived from the same key, so a browser revalidating an
+unchanged page gets a 304 without the view running at all. Pages are never
+cached while flashed messages are waiting to be shown.
+
+RENDER_CACHE_BACKEND selects where the counters live:
+    memory             per process (default). Writes by other workers and by
+                       scripts never bump them, so pages and ETags also
+                       expire every RENDER_CACHE_TTL seconds
+    redis://host/db    shared between workers
+    none               disable the cache and ETags
+
+Rendered pages are always held per process, in an LRU capped at
+RENDER_CACHE_MAX_BYTES. Pages read from a replica can be cached from
+slightly stale data; the TTL bounds how long.
+"""
+
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, has_app_context, make_response, request, session
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import User, RoomPreference
+
+STALE_KEY = 'stale_render_versions'
+
+
+class MemoryVersions:
+    def __init__(self, ttl=None):
+        self.epoch = secrets.token_hex(8)
+        self.ttl = ttl
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, keys):
+        """(epoch, [version of each key]); with a ttl the epoch moves on every ttl seconds."""
+        epoch = f'{self.epoch}:{int(time.time() // self.ttl)}' if self.ttl else self.epoch
+        with self._lock:
+            return epoch, [self._versions.get(key, 0) for key in keys]
+
+    def bump(self, keys):
+        with self._lock:
+            for key in keys:
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+
+class RedisVersions:
+    def __init__(self, url, prefix='render:'):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, keys):
+        # The epoch changes if Redis loses its data, so versions restarting from 0 never reuse an ETag
+        epoch_key = self.prefix + 'epoch'
+        epoch, *versions = self.client.mget([epoch_key] + [self.prefix + key for key in keys])
+        if epoch is None:
+            self.client.set(epoch_key, secrets.token_hex(8), nx=True)
+            epoch = self.client.get(epoch_key)
+        return epoch.decode(), [int(version or 0) for version in versions]
+
+    def bump(self, keys):
+        pipeline = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipeline.incr(self.prefix + key)
+        pipeline.execute()
+
+
+class PageCache:
+    """LRU of rendered pages, bounded by total size in bytes."""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, ttl=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is None:
+                return None
+            expires, page = entry
+            if expires is not None and expires < time.monotonic():
+                self._drop(key)
+                return None
+            self._pages.move_to_end(key)
+            return page
+
+    def set(self, key, page):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._pages:
+                self._drop(key)
+            self._pages[key] = (expires, page)
+            self.size += len(page)
+            while self.size > self.max_bytes and self._pages:
+                self._drop(next(iter(self._pages)))
+
+    def _drop(self, key):
+        _, page = self._pages.pop(key)
+        self.size -= len(page)
+
+    def __len__(self):
+        return len(self._pages)
+
+
+class RenderCache:
+    def __init__(self, versions, pages, salt=''):
+        self.versions = versions
+        self.pages = pages
+        self.salt = salt
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def invalidate(self, keys):
+        if self.versions is not None and keys:
+            self.versions.bump(sorted(keys))
+
+    def respond(self, name, scopes, view):
+        """Response for the current request from cache, as a 304, or by calling view()."""
+        keys = [f'user:{current_user.id}', *scopes]
+        epoch, versions = self.versions.get(keys)
+        key = (name, current_user.id, request.full_path, epoch, tuple(versions))
+        etag = hashlib.sha1(repr((self.salt, key)).encode()).hexdigest()
+        if etag in request.if_none_match:
+            self.not_modified += 1
+            response = make_response('', 304)
+        else:
+            page = self.pages.get(key)
+            if page is None:
+                self.misses += 1
+                page = view()
+                if not isinstance(page, str):
+                    return page
+                page = page.encode()
+                self.pages.set(key, page)
+            else:
+                self.hits += 1
+            response = make_response(page)
+        response.set_etag(etag)
+        # Browsers must revalidate every time; the ETag makes that cheap
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'not_modified': self.not_modified,
+                'pages': len(self.pages), 'bytes': self.pages.size}
+
+
+def render_cached(*scopes):
+    """
+    Cache a logged-in view's rendered page, invalidated by the viewer's own
+    version plus the given global scopes ('profiles', 'directory').
+    """
+    def decorator(view):
+        name = view.__name__
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = current_app.extensions.get('render_cache')
+            if cache is None or cache.versions is None or request.method != 'GET' or '_flashes' in session:
+                return view(*args, **kwargs)
+            return cache.respond(name, scopes, lambda: view(*args, **kwargs))
+        return wrapper
+    return decorator
+
+
+def mark_stale(session, user_ids=(), profiles=False, directory=False):
+    """Invalidate pages of user_ids (and global scopes) once the session commits."""
+    stale = session.info.setdefault(STALE_KEY, set())
+    stale.update(f'user:{user_id}' for user_id in user_ids)
+    if profiles:
+        stale.add('profiles')
+    if directory:
+        stale.add('directory')
+
+
+def _template_digest(app):
+    """Changes whenever a template does, so a deploy never serves an old page for a matching ETag."""
+    digest = hashlib.sha1()
+    for root, _, files in sorted(os.walk(os.path.join(app.root_path, app.template_folder))):
+        for filename in sorted(files):
+            with open(os.path.join(root, filename), 'rb') as f:
+                digest.update(filename.encode() + f.read())
+    return digest.hexdigest()
+
+
+def _make_versions(config):
+    kind = config.get('RENDER_CACHE_BACKEND', 'memory')
+    if not kind or kind == 'none':
+        return None
+    if kind.startswith(('redis://', 'rediss://')):
+        return RedisVersions(kind)
+    # Other workers' and scripts' writes are only noticed when the ETags and pages expire
+    return MemoryVersions(config.get('RENDER_CACHE_TTL', 60))
+
+
+def _collect_stale_pages(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User) and obj.id is not None:
+            mark_stale(session, [obj.id], profiles=obj not in session.new, directory=True)
+        elif isinstance(obj, RoomPreference) and obj.user_id is not None:
+            mark_stale(session, [obj.user_id], profiles=obj not in session.new, directory=True)
+
+
+def _collect_changed_users(session):
+    # Rows changed with Core statements and reported to user_cache.mark_changed
+    changed = session.info.get('changed_user_ids')
+    if changed:
+        mark_stale(session, changed, profiles=True, directory=True)
+
+
+def _bump_versions(session):
+    stale = session.info.pop(STALE_KEY, ())
+    cache = current_app.extensions.get('render_cache') if has_app_context() else None
+    if cache is not None:
+        cache.invalidate(stale)
+
+
+def _forget_stale_pages(session):
+    session.info.pop(STALE_KEY, None)
+
+
+SESSION_LISTENERS = (
+    ('after_flush', _collect_stale_pages),
+    ('before_commit', _collect_changed_users),
+    ('after_commit', _bump_versions),
+    ('after_rollback', _forget_stale_pages),
+)
+
+
+def init_render_cache(app):
+    versions = _make_versions(app.config)
+    ttl = versions.ttl if isinstance(versions, MemoryVersions) else None
+    cache = RenderCache(versions, PageCache(app.config.get('RENDER_CACHE_MAX_BYTES', 32 * 1024 * 1024), ttl),
+                        salt=_template_digest(app))
+    app.extensions['render_cache'] = cache
+    # Registered once per process; commits bump the counters of whichever app is current
+    for name, listener in SESSION_LISTENERS:
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
+    return cache
@@ -0,0 +1,333 @@
+"""
+In-memory index of open room preferences, for ranking compatible swaps.
+
+The dashboard asks "who has a room I need and needs the room I have?". Each
+process keeps every unselected preference in compact columns: room strings
+are interned to small integers, and preferences live in parallel
+array('l') columns indexed by slot, with per-room slot lists for "offered
+by" and "wanted by". A lookup touches only the rooms involved, so ranking
+every reciprocal match takes microseconds, and 100k preferences take about
+a quarter of the memory of the same rows as ORM objects (numbers in
+benchmarks/room_index.py).
+
+Ranking scores both directions of a swap: 2 when the candidate offers a room
+the user needs (1 if it only meets a 'FLOOR 2' or 'ANY' need), plus 2 when
+the candidate needs the user's room (1 for their floor or any room). Only
+candidates that score on both sides are returned, best score first and then
+newest first. Floor needs are looked up through per-floor slot lists, so
+they cost no more than a room's.
+
+The index is built from room_preferences on first use and kept current from
+session events, like the caches: new, changed and deleted RoomPreference
+rows are applied after commit. Core UPDATEs and bulk deletes that bypass the
+ORM (commit_swap, delete_account) report what they removed with
+mark_removed(). Writes made by other processes are picked up by a rebuild
+once the index is ROOM_INDEX_MAX_AGE seconds old; the caller confirms the
+top candidates against the database, so a stale entry is never shown.
+"""
+
+import sys
+import threading
+import time
+from array import array
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, joinedload
+
+from models import db, RoomPreference
+from validation import WILDCARD_ROOM, floor_of, parse_need
+
+OPS_KEY = 'room_index_ops'
+
+
+def _normalize(room):
+    return (room or '').strip().upper()
+
+
+def _normalize_need(needed):
+    need = parse_need(needed)
+    return need.label if need else _normalize(needed)
+
+
+class RoomIndex:
+    def __init__(self):
+        self._room_ids = {}                 # room or need label -> room id
+        self._rooms = []                    # room id -> room or need label
+        self._room_floors = []              # room id -> floor of the room (None for need labels)
+        self._floors = {}                   # room id of a 'FLOOR n' label -> n
+        self._needs = {}                    # needed value as stored -> room id of its label
+        self._slots = {}                    # preference id -> slot
+        self._free = []                     # slots of removed preferences, for reuse
+        self.pref_ids = array('l')          # slot -> preference id (0 when free)
+        self.users = array('l')             # slot -> owner id
+        self.offers = array('l')            # slot -> room id offered (available)
+        self.wants = array('l')             # slot -> room id wanted (needed)
+        self.offered_by = {}                # room id -> array of slots
+        self.wanted_by = {}                 # room id -> array of slots
+        self.by_user = {}                   # owner id -> array of slots
+        self.offered_on_floor = {}          # floor -> array of slots offering a room on it
+        self._any = self._intern(WILDCARD_ROOM)
+
+    def _intern(self, room):
+        room_id = self._room_ids.get(room)
+        if room_id is None:
+            room_id = self._room_ids[sys.intern(room)] = len(self._rooms)
+            self._rooms.append(room)
+            self._room_floors.append(floor_of(room))
+            need = parse_need(room)
+            if need and need.floor is not None:
+                self._floors[room_id] = need.floor
+        return room_id
+
+    def _slot_lists(self, slot):
+        """(lists, key) pairs that hold slot."""
+        offer = self.offers[slot]
+        floor = self._room_floors[offer]
+        return ((self.offered_by, offer), (self.wanted_by, self.wants[slot]), (self.by_user, self.users[slot]),
+                (self.offered_on_floor, floor) if floor is not None else (None, None))
+
+    def __len__(self):
+        return len(self._slots)
+
+    def add(self, pref_id, user_id, available, needed):
+        if pref_id in self._slots:
+            self.remove(pref_id)
+        want = self._needs.get(needed)
+        if want is None:
+            # parse_need() is slow next to a dict lookup, so each distinct value is parsed once
+            want = self._needs[needed] = self._intern(_normalize_need(needed))
+        offer = self._intern(_normalize(available))
+        if self._free:
+            slot = self._free.pop()
+            self.pref_ids[slot], self.users[slot], self.offers[slot], self.wants[slot] = pref_id, user_id, offer, want
+        else:
+            slot = len(self.pref_ids)
+            self.pref_ids.append(pref_id)
+            self.users.append(user_id)
+            self.offers.append(offer)
+            self.wants.append(want)
+        self._slots[pref_id] = slot
+        for lists, key in self._slot_lists(slot):
+            if lists is not None:
+                lists.setdefault(key, array('l')).append(slot)
+
+    def remove(self, pref_id):
+        slot = self._slots.pop(pref_id, None)
+        if slot is None:
+            return
+        for lists, key in self._slot_lists(slot):
+            if lists is None:
+                continue
+            slots = lists[key]
+            slots.remove(slot)
+            if not slots:
+                del lists[key]
+        self.pref_ids[slot] = 0
+        self._free.append(slot)
+
+    def rank(self, user_id, room, term='', limit=None):
+        """
+        [(preference id, score)] of other users' preferences that swap with user_id,
+        who holds `room` and needs whatever their own indexed preferences ask for.
+        `term` keeps only candidates offering a room that starts with it.
+        """
+        room = _normalize(room)
+        room_id = self._room_ids.get(room)
+        floor = floor_of(room)
+        floor_id = self._room_ids.get(f'FLOOR {floor}') if floor is not None else None
+        needs = {self.wants[slot] for slot in self.by_user.get(user_id, ())}
+        if not needs:
+            return []
+        any_room = self._any in needs
+        needs.discard(self._any)
+        floors = {self._floors[need] for need in needs if need in self._floors}
+
+        candidates = set()
+        for need in needs:
+            candidates.update(self.offered_by.get(need, ()))
+        for need_floor in floors:
+            candidates.update(self.offered_on_floor.get(need_floor, ()))
+        if any_room:
+            # Everyone offers some room, so only those who want this one (or its floor) can score
+            for wanted in (room_id, floor_id):
+                if wanted is not None:
+                    candidates.update(self.wanted_by.get(wanted, ()))
+
+        term = _normalize(term)
+        ranked = []
+        for slot in candidates:
+            if self.users[slot] == user_id:
+                continue
+            offer, want = self.offers[slot], self.wants[slot]
+            if offer in needs:
+                have = 2
+            elif offer != self._any and offer not in self._floors \
+                    and (any_room or self._room_floors[offer] in floors):
+                have = 1
+            else:
+                have = 0
+            need = 2 if want == room_id else 1 if want == self._any or want == floor_id else 0
+            if have and need and (not term or self._rooms[offer].startswith(term)):
+                ranked.append((have + need, self.pref_ids[slot]))
+        ranked.sort(reverse=True)
+        return [(pref_id, score) for score, pref_id in ranked[:limit]]
+
+    def memory_bytes(self):
+        """Approximate size of the index structures, excluding the interned strings' own sizes."""
+        size = sum(sys.getsizeof(column) for column in (self.pref_ids, self.users, self.offers, self.wants))
+        size += sys.getsizeof(self._slots) + sys.getsizeof(self._room_ids) + sys.getsizeof(self._rooms) \
+            + sys.getsizeof(self._room_floors) + sys.getsizeof(self._floors) + sys.getsizeof(self._needs)
+        for lists in (self.offered_by, self.wanted_by, self.by_user, self.offered_on_floor):
+            size += sys.getsizeof(lists) + sum(sys.getsizeof(slots) for slots in lists.values())
+        return size
+
+
+class LiveRoomIndex:
+    """A RoomIndex built on first use, updated after commits and rebuilt when it gets old."""
+
+    def __init__(self, app, max_age=60):
+        self.app = app
+        self.max_age = max_age
+        self.index = None
+        self.built_at = 0.0
+        self.rebuilds = 0
+        self._lock = threading.Lock()       # guards the index and _missed
+        self._building = threading.Lock()   # held while loading
+        self._missed = None                 # commits seen during a load
+
+    def _load(self):
+        index = RoomIndex()
+        rows = db.session.execute(
+            select(RoomPreference.id, RoomPreference.user_id, RoomPreference.available, RoomPreference.needed)
+            .where(RoomPreference.selected == False)  # noqa: E712
+            .execution_options(yield_per=10000)
+        )
+        for row in rows:
+            index.add(*row)
+        return index
+
+    def _rebuild(self):
+        with self._lock:
+            self._missed = []
+        try:
+            with self.app.app_context():
+                index = self._load()
+            with self._lock:
+                # Commits applied to the old index while loading may be missing from the snapshot
+                for op in self._missed:
+                    self._apply(index, op)
+                self.index, self.built_at = index, time.monotonic()
+                self.rebuilds += 1
+        finally:
+            with self._lock:
+                self._missed = None
+
+    def rebuild(self):
+        """Reload the index from the database, unless another thread already is."""
+        if self._building.acquire(blocking=False):
+            try:
+                self._rebuild()
+            finally:
+                self._building.release()
+
+    def ready(self):
+        """The index, built now if this is the first use; starts a background rebuild when stale."""
+        if self.index is None:
+            with self._building:
+                if self.index is None:
+                    self._rebuild()
+        elif self.max_age and time.monotonic() - self.built_at > self.max_age and not self._building.locked():
+            threading.Thread(target=self.rebuild, daemon=True).start()
+        return self.index
+
+    @staticmethod
+    def _apply(index, op):
+        kind, args = op
+        if kind == 'add':
+            index.add(*args)
+        else:
+            index.remove(*args)
+
+    def apply(self, ops):
+        with self._lock:
+            if self.index is not None:
+                for op in ops:
+                    self._apply(self.index, op)
+            if self._missed is not None:
+                self._missed.extend(ops)
+
+    def rank(self, user_id, room, term='', limit=None):
+        index = self.ready()
+        with self._lock:
+            return index.rank(user_id, room, term, limit)
+
+    def compatible(self, user, term='', limit=50):
+        """
+        The user's best `limit` matches as RoomPreference objects with .match_score,
+        re-checked against the database: still open, and offered by someone who
+        is looking to swap and still holds that room.
+        """
+        scores = dict(self.rank(user.id, user.room_number, term, limit * 2))
+        if not scores:
+            return []
+        prefs = RoomPreference.query.options(joinedload(RoomPreference.user)) \
+            .filter(RoomPreference.id.in_(scores)).all()
+        current = []
+        for pref in prefs:
+            if not pref.selected and pref.user.is_looking_to_swap and pref.available == pref.user.room_number:
+                pref.match_score = scores[pref.id]
+                current.append(pref)
+        current.sort(key=lambda pref: (pref.match_score, pref.id), reverse=True)
+        return current[:limit]
+
+    def stats(self):
+        index = self.index
+        return {'preferences': len(index) if index else 0, 'bytes': index.memory_bytes() if index else 0,
+                'rebuilds': self.rebuilds}
+
+
+def mark_removed(session, pref_ids):
+    """Report preferences selected or deleted with Core statements; applied after commit."""
+    session.info.setdefault(OPS_KEY, []).extend(('remove', (pref_id,)) for pref_id in pref_ids)
+
+
+def _collect_preference_changes(session, flush_context):
+    ops = session.info.setdefault(OPS_KEY, [])
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, RoomPreference):
+            if obj.selected:
+                ops.append(('remove', (obj.id,)))
+            else:
+                ops.append(('add', (obj.id, obj.user_id, obj.available, obj.needed)))
+    for obj in session.deleted:
+        if isinstance(obj, RoomPreference):
+            ops.append(('remove', (obj.id,)))
+
+
+def _apply_preference_changes(session):
+    ops = session.info.pop(OPS_KEY, None)
+    live = current_app.extensions.get('room_index') if has_app_context() else None
+    if ops and live is not None:
+        live.apply(ops)
+
+
+def _forget_preference_changes(session):
+    session.info.pop(OPS_KEY, None)
+
+
+SESSION_LISTENERS = (
+    ('after_flush', _collect_preference_changes),
+    ('after_commit', _apply_preference_changes),
+    ('after_rollback', _forget_preference_changes),
+)
+
+
+def init_room_index(app):
+    live = LiveRoomIndex(app, app.config.get('ROOM_INDEX_MAX_AGE', 60))
+    app.extensions['room_index'] = live
+    # Once per process, like rooms.init_rooms; each commit updates the current app's index
+    for name, listener in SESSION_LISTENERS:
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
+    return live
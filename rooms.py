@@ -0,0 +1,170 @@
+"""
+Rooms, and the room references of users and preferences.
+
+Room numbers are what students type and see, so users.room_number,
+room_preferences.available/needed and the swap request snapshots keep them.
+Each number is also a row of rooms (block, floor, capacity, attributes), and
+users.room_id and the preferences' available_room_id / needed_room_id point
+at it, so matching joins and looks up on indexed integers. A preference
+needs one of:
+
+    '214'       that room               needed_room_id
+    'FLOOR 2'   any room on floor 2     needed_floor
+    'ANY'       any room at all         both NULL
+
+The references follow the numbers by themselves: before each flush,
+link_rooms() resolves the numbers of new or changed User and RoomPreference
+rows, creating rooms it has not seen yet (floor from the first digit,
+capacity unknown). Core statements that write room numbers set the ids
+themselves: swaps.py with a subquery on the number, allocations.py and the
+benchmark seeds through room_ids().
+
+Occupancy is counted from users.room_id rather than stored. A room whose
+capacity is known and not reached has free places: the dashboard lists the
+ones that meet a user's needs, and move_in() takes one, counting again under
+a lock on the room so two students can't both take the last bed. Capacities,
+blocks and attributes are loaded with `python allocations.py import-rooms`.
+"""
+
+from sqlalchemy import event, func, insert, inspect, or_, select
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session
+
+from models import db, Room, User, RoomPreference
+from swaps import SwapConflict, move_users, supersede_pending
+from validation import WILDCARD_ROOM, floor_of, parse_need
+
+FREE_ROOMS_LIMIT = 20
+
+MOVED = 'moved'
+NOT_FOUND = 'not_found'
+SAME_ROOM = 'same_room'
+FULL = 'full'
+CONFLICT = 'conflict'
+
+
+def room_ids(session, numbers):
+    """{number: room id} for the numbers, creating the rooms that don't exist yet."""
+    numbers = {number for number in numbers if number}
+    if not numbers:
+        return {}
+    with session.no_autoflush:
+        found = dict(session.execute(select(Room.number, Room.id).where(Room.number.in_(numbers))).all())
+        missing = sorted(numbers - found.keys())
+        if missing:
+            try:
+                with session.begin_nested():
+                    session.execute(insert(Room), [{'number': number, 'floor': floor_of(number)}
+                                                   for number in missing])
+            except IntegrityError:
+                # A concurrent transaction created some of them first
+                pass
+            found.update(session.execute(select(Room.number, Room.id).where(Room.number.in_(missing))).all())
+    return found
+
+
+def _changed(obj, *names):
+    state = inspect(obj)
+    return state.pending or any(state.attrs[name].history.has_changes() for name in names)
+
+
+def link_rooms(session, flush_context, instances):
+    """Point new and changed users and preferences at the rooms their numbers name."""
+    users, prefs = [], []
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, User) and _changed(obj, 'room_number'):
+            users.append(obj)
+        elif isinstance(obj, RoomPreference) and _changed(obj, 'available', 'needed'):
+            prefs.append(obj)
+    if not users and not prefs:
+        return
+    needs = [parse_need(pref.needed) for pref in prefs]
+    ids = room_ids(session, {user.room_number for user in users} | {pref.available for pref in prefs}
+                   | {need.room for need in needs if need and need.room})
+    for user in users:
+        user.room_id = ids.get(user.room_number)
+    for pref, need in zip(prefs, needs):
+        pref.available_room_id = ids.get(pref.available)
+        if need is None:
+            # Matches nothing, like any other room nobody holds
+            pref.needed_room_id = pref.needed_floor = None
+            continue
+        pref.needed = need.label
+        pref.needed_room_id = ids.get(need.room)
+        pref.needed_floor = need.floor
+
+
+def occupants():
+    """Number of users in each Room, as a correlated subquery."""
+    return select(func.count()).where(User.room_id == Room.id).correlate(Room).scalar_subquery()
+
+
+def free_rooms(user, limit=FREE_ROOMS_LIMIT):
+    """
+    [(Room, occupants)] with free places that meet one of the user's open needs,
+    other than the room the user is in, by room number.
+    """
+    needs = db.session.execute(
+        select(RoomPreference.needed, RoomPreference.needed_room_id, RoomPreference.needed_floor)
+        .where(RoomPreference.user_id == user.id, RoomPreference.selected == False)  # noqa: E712
+    ).all()
+    if any(need.needed == WILDCARD_ROOM for need in needs):
+        meets = Room.id.isnot(None)
+    else:
+        rooms = {need.needed_room_id for need in needs if need.needed_room_id}
+        floors = {need.needed_floor for need in needs if need.needed_floor is not None}
+        if not rooms and not floors:
+            return []
+        meets = or_(Room.id.in_(rooms), Room.floor.in_(floors))
+    count = occupants()
+    query = select(Room, count).where(
+        meets, Room.capacity.isnot(None), count < Room.capacity,
+    ).order_by(Room.number).limit(limit)
+    if user.room_id is not None:
+        query = query.where(Room.id != user.room_id)
+    return db.session.execute(query).all()
+
+
+def move_in(user_id, room_id):
+    """
+    Move a user into a free place in a room, superseding their pending requests.
+
+    Returns MOVED (committed), NOT_FOUND, SAME_ROOM, FULL (no known free
+    place) or CONFLICT (the user moved, or another move got there first).
+    """
+    try:
+        # Locked so concurrent move-ins into this room count one at a time
+        room = db.session.execute(
+            select(Room.id, Room.number, Room.capacity).where(Room.id == room_id).with_for_update()
+        ).first()
+        current = db.session.execute(select(User.room_number, User.room_id).where(User.id == user_id)).first()
+        if room is None or current is None:
+            db.session.rollback()
+            return NOT_FOUND
+        if current.room_id == room.id:
+            db.session.rollback()
+            return SAME_ROOM
+        occupants = db.session.scalar(select(func.count()).where(User.room_id == room.id))
+        if room.capacity is None or occupants >= room.capacity:
+            db.session.rollback()
+            return FULL
+        move_users({user_id: (current.room_number, room.number)})
+        supersede_pending([user_id])
+        db.session.commit()
+        return MOVED
+    except (SwapConflict, OperationalError):
+        db.session.rollback()
+        return CONFLICT
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        # Core UPDATEs bypass the identity map
+        db.session.expire_all()
+
+
+def init_rooms(app):
+    # Registered once per process: the listener applies to every Session
+    if not event.contains(Session, 'before_flush', link_rooms):
+        event.listen(Session, 'before_flush', link_rooms)
+
@@ -0,0 +1,106 @@
+"""
+Message-queue configuration for running Socket.IO across several workers.
+
+Without a queue each gunicorn worker only knows about its own sockets, so an
+emit in one worker never reaches a browser connected to another. Setting
+SOCKETIO_MESSAGE_QUEUE makes every worker (and any offline script using
+external_socketio()) publish through a shared backend:
+
+    redis://localhost:6379/0   Redis pub/sub (production)
+    amqp://...                 RabbitMQ via kombu
+    loopback://                in-process stand-in for tests and local runs
+
+asgi mode (asgi_server.py) reaches the same Redis or RabbitMQ queue through
+python-socketio's asyncio managers; loopback:// has no asyncio counterpart.
+"""
+
+import queue
+import threading
+from collections import defaultdict
+
+import socketio as python_socketio
+from flask_socketio import SocketIO
+
+LOOPBACK_URL = 'loopback://'
+
+
+class LoopbackManager(python_socketio.PubSubManager):
+    """
+    Pub/sub client manager that fans messages out inside a single process.
+
+    Behaves like RedisManager for several SocketIO servers created in the same
+    interpreter: messages are JSON-encoded and every subscriber on the channel
+    receives them on its own listener thread.
+    """
+    name = 'loopback'
+
+    _subscribers = defaultdict(list)
+    _lock = threading.Lock()
+
+    def __init__(self, url=LOOPBACK_URL, channel='socketio', write_only=False, logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self._inbox = None
+
+    def initialize(self):
+        # Subscribe before the listener starts so no early publish is missed
+        if not self.write_only and self._inbox is None:
+            self._inbox = queue.Queue()
+            with self._lock:
+                self._subscribers[self.channel].append(self._inbox)
+        super().initialize()
+
+    def _publish(self, data):
+        message = self.json.dumps(data)
+        with self._lock:
+            inboxes = list(self._subscribers[self.channel])
+        for inbox in inboxes:
+            inbox.put(message)
+
+    def _listen(self):
+        while True:
+            yield self._inbox.get()
+
+
+def socketio_options(config):
+    """Keyword arguments for SocketIO() derived from the app config."""
+    options = {}
+    url = config.get('SOCKETIO_MESSAGE_QUEUE')
+    channel = config.get('SOCKETIO_CHANNEL', 'flask-socketio')
+    if url and url.startswith(LOOPBACK_URL):
+        options['client_manager'] = LoopbackManager(channel=channel)
+    elif url:
+        options['message_queue'] = url
+        options['channel'] = channel
+    if config.get('SOCKETIO_TRANSPORTS'):
+        options['transports'] = config['SOCKETIO_TRANSPORTS']
+    return options
+
+
+def external_socketio(config):
+    """
+    Write-only SocketIO for emitting from outside a web worker (CLI scripts).
+
+    Returns None when no message queue is configured, since there would be
+    no way to reach the workers' sockets.
+    """
+    url = config.get('SOCKETIO_MESSAGE_QUEUE')
+    if not url:
+        return None
+    channel = config.get('SOCKETIO_CHANNEL', 'flask-socketio')
+    if url.startswith(LOOPBACK_URL):
+        manager = LoopbackManager(channel=channel, write_only=True)
+        return SocketIO(message_queue=None, client_manager=manager)
+    return SocketIO(message_queue=url, channel=channel)
+
+
+def async_client_manager(config):
+    """Client manager for an AsyncServer on SOCKETIO_MESSAGE_QUEUE, or None without a queue."""
+    url = config.get('SOCKETIO_MESSAGE_QUEUE')
+    if not url:
+        return None
+    channel = config.get('SOCKETIO_CHANNEL', 'flask-socketio')
+    if url.startswith(LOOPBACK_URL):
+        raise ValueError('SOCKETIO_MESSAGE_QUEUE=loopback:// only works with the threading, eventlet and gevent modes')
+    if url.startswith(('redis://', 'rediss://')):
+        return python_socketio.AsyncRedisManager(url, channel=channel)
+    return python_socketio.AsyncAioPikaManager(url, channel=channel)
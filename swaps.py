@@ -0,0 +1,183 @@
+"""
+Swap commit service.
+
+commit_swap() is the only place a pending SwapRequest turns into moved
+rooms. It is safe under concurrent commits on SQLite and PostgreSQL:
+
+- the request moves pending -> committed with a compare-and-set UPDATE, so
+  exactly one caller can win it;
+- both users are locked in id order (FOR UPDATE on PostgreSQL) and their
+  rooms are swapped with UPDATEs that require the room read under the lock,
+  so a concurrent move is detected instead of overwritten;
+- every other pending request that involves either user was made against
+  rooms that no longer hold, so it is marked 'superseded' in the same
+  transaction.
+
+Conflicts roll back and are retried a few times before giving up.
+"""
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.exc import OperationalError
+
+from inbox import record_transition, record_transitions
+from mail_queue import enqueue_mail
+from models import db, Room, User, RoomPreference, SwapRequest
+from room_index import mark_removed
+from user_cache import mark_changed
+
+MAX_RETRIES = 3
+
+COMMITTED = 'committed'
+NOT_FOUND = 'not_found'
+FORBIDDEN = 'forbidden'
+NOT_PENDING = 'not_pending'
+STALE = 'stale'
+CONFLICT = 'conflict'
+
+
+class SwapConflict(Exception):
+    pass
+
+
+def _lock_users(user_ids):
+    users = db.session.execute(
+        select(User.id, User.room_number).where(User.id.in_(user_ids))
+        .order_by(User.id).with_for_update()
+    ).all()
+    return {user_id: room for user_id, room in users}
+
+
+def _move(user_id, expected_room, new_room):
+    # room_id follows the number, as rooms.link_rooms() does for ORM writes
+    new_room_id = select(Room.id).where(Room.number == new_room).scalar_subquery()
+    result = db.session.execute(
+        update(User).where(User.id == user_id, User.room_number == expected_room)
+        .values(room_number=new_room, room_id=new_room_id).execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        raise SwapConflict(f'user {user_id} is no longer in room {expected_room}')
+
+
+def supersede_pending(user_ids, exclude_ids=()):
+    """Mark every other pending request involving user_ids as superseded; returns how many."""
+    owner = RoomPreference.user_id
+    # Keep both sides of the OR on swap_requests so each can use its (..., status) index
+    owned = select(RoomPreference.id).where(owner.in_(user_ids)).scalar_subquery()
+    query = select(SwapRequest.id, owner, SwapRequest.requester_id) \
+        .join(RoomPreference, SwapRequest.preference_id == RoomPreference.id) \
+        .where(SwapRequest.status == 'pending',
+               or_(SwapRequest.requester_id.in_(user_ids), SwapRequest.preference_id.in_(owned)))
+    if exclude_ids:
+        query = query.where(SwapRequest.id.not_in(exclude_ids))
+    rows = db.session.execute(query.with_for_update(of=SwapRequest)).all()
+    if not rows:
+        return 0
+    db.session.execute(
+        update(SwapRequest)
+        .where(SwapRequest.id.in_([row.id for row in rows]), SwapRequest.status == 'pending')
+        .values(status='superseded', resolved_at=func.current_timestamp())
+        .execution_options(synchronize_session=False)
+    )
+    record_transitions([(row.user_id, row.requester_id, row.id) for row in rows], 'pending', 'superseded')
+    return len(rows)
+
+
+def move_users(moves):
+    """
+    Apply {user_id: (expected_room, new_room)} under row locks taken in id order.
+
+    Raises SwapConflict if any user is not in the expected room.
+    """
+    current = _lock_users(sorted(moves))
+    for user_id in sorted(moves):
+        expected, new_room = moves[user_id]
+        if current.get(user_id) != expected:
+            raise SwapConflict(f'user {user_id} is no longer in room {expected}')
+        _move(user_id, expected, new_room)
+    mark_changed(db.session, moves)
+
+
+def _commit_once(req_id, owner_id):
+    row = db.session.execute(
+        select(SwapRequest.status, SwapRequest.requester_id, SwapRequest.preference_id,
+               SwapRequest.from_room_number, SwapRequest.to_room_number, RoomPreference.user_id)
+        .join(RoomPreference, SwapRequest.preference_id == RoomPreference.id)
+        .where(SwapRequest.id == req_id)
+    ).first()
+    if row is None:
+        return NOT_FOUND
+    if row.user_id != owner_id:
+        return FORBIDDEN
+    if row.status != 'pending':
+        return NOT_PENDING
+
+    requester_id = row.requester_id
+    claimed = db.session.execute(
+        update(SwapRequest).where(SwapRequest.id == req_id, SwapRequest.status == 'pending')
+        .values(status=COMMITTED, resolved_at=func.current_timestamp())
+        .execution_options(synchronize_session=False)
+    )
+    if claimed.rowcount != 1:
+        db.session.rollback()
+        return NOT_PENDING
+
+    rooms = _lock_users([owner_id, requester_id])
+    # Requests created before room snapshots existed swap whatever rooms are current
+    from_room = row.from_room_number or rooms.get(requester_id)
+    to_room = row.to_room_number or rooms.get(owner_id)
+    if rooms.get(requester_id) != from_room or rooms.get(owner_id) != to_room:
+        # Someone moved since the request was made; it can never be honoured
+        db.session.rollback()
+        db.session.execute(
+            update(SwapRequest).where(SwapRequest.id == req_id, SwapRequest.status == 'pending')
+            .values(status='superseded', resolved_at=func.current_timestamp())
+            .execution_options(synchronize_session=False)
+        )
+        record_transition(owner_id, requester_id, 'pending', 'superseded', req_id)
+        db.session.commit()
+        return STALE
+
+    move_users({
+        requester_id: (from_room, to_room),
+        owner_id: (to_room, from_room),
+    })
+    db.session.execute(
+        update(RoomPreference).where(RoomPreference.id == row.preference_id)
+        .values(selected=True, accepted_by_id=requester_id)
+        .execution_options(synchronize_session=False)
+    )
+    mark_removed(db.session, [row.preference_id])
+    record_transition(owner_id, requester_id, 'pending', COMMITTED, req_id)
+    supersede_pending([owner_id, requester_id], exclude_ids=[req_id])
+
+    requester_email = db.session.scalar(select(User.email).where(User.id == requester_id))
+    owner_name = db.session.scalar(select(User.name).where(User.id == owner_id))
+    enqueue_mail(requester_email, 'Your room swap was accepted',
+                 f'{owner_name} accepted your swap request. Your new room is {to_room}.',
+                 commit=False)
+    db.session.commit()
+    return COMMITTED
+
+
+def commit_swap(req_id, owner_id, retries=MAX_RETRIES):
+    """
+    Commit a pending swap request on behalf of the preference owner.
+
+    Returns one of COMMITTED, NOT_FOUND, FORBIDDEN, NOT_PENDING, STALE or
+    CONFLICT (still losing a race after `retries` attempts).
+    """
+    for _ in range(retries):
+        try:
+            result = _commit_once(req_id, owner_id)
+        except (SwapConflict, OperationalError):
+            # Lost a race (or a lock wait / deadlock); start over from fresh rows
+            db.session.rollback()
+            continue
+        except Exception:
+            db.session.rollback()
+            raise
+        # Core UPDATEs bypass the identity map, so drop anything this session cached
+        db.session.expire_all()
+        return result
+    db.session.expire_all()
+    return CONFLICT
@@ -0,0 +1,75 @@
+"""
+Shared fixtures: the web app on a throwaway SQLite file, seeded per test.
+
+Config reads the environment when it is imported, so the settings go in
+before anything from the app is. Rate limits, mail workers and the caches
+are off, so what a test sees doesn't depend on the tests before it.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'benchmarks')]
+
+_db_path = os.path.join(tempfile.mkdtemp(prefix='swap-my-room-tests-'), 'test.db')
+os.environ.update({
+    'SECRET_KEY': 'test-secret',
+    'DATABASE_URL': f'sqlite:///{_db_path}',
+    'MAIL_QUEUE_WORKERS': '0',
+    'RATE_LIMIT_BACKEND': 'none',
+    'USER_CACHE_BACKEND': 'none',
+    'RENDER_CACHE_BACKEND': 'none',
+})
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def hostel(app):
+    """seed_hostel(users, ...) inside an app context; the room index is rebuilt on next use."""
+    from seed import seed_hostel
+
+    def seed(users, **kwargs):
+        with app.app_context():
+            counts = seed_hostel(users, **kwargs)
+        app.extensions['room_index'].index = None
+        return counts
+    return seed
+
+
+@pytest.fixture
+def login(app):
+    """A test client logged in as the given user id."""
+    def client_for(user_id):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        return client
+    return client_for
+
+
+@pytest.fixture
+def rotation(app):
+    """rotation(rooms) adds users holding `rooms`, each wanting the next one's room; returns their ids."""
+    from models import db, User, RoomPreference
+
+    def add(rooms):
+        users = [User(name=f'Student {room}', college_id=f'SB{room}', password='x', email=f'{room}@example.com',
+                      room_number=room) for room in rooms]
+        db.session.add_all(users)
+        db.session.flush()
+        for user, needed in zip(users, rooms[1:] + rooms[:1]):
+            db.session.add(RoomPreference(user_id=user.id, available=user.room_number, needed=needed))
+        db.session.commit()
+        return [user.id for user in users]
+    return add
@@ -0,0 +1,66 @@
+import pytest
+from sqlalchemy import select
+
+import archive
+import inbox
+from accounts import delete_accounts
+from models import db, RoomPreference, SwapRequest, SwapRequestArchive
+from swaps import commit_swap, COMMITTED
+
+
+def request(owner_id, owner_room, requester_id, requester_room):
+    pref = RoomPreference(user_id=owner_id, available=owner_room, needed=requester_room)
+    db.session.add(pref)
+    db.session.flush()
+    req = SwapRequest(preference_id=pref.id, requester_id=requester_id, status='pending',
+                      from_room_number=requester_room, to_room_number=owner_room)
+    db.session.add(req)
+    db.session.commit()
+    return req.id
+
+
+def counters(user_id):
+    summary = inbox.get_summary(user_id)
+    return summary.pending_invites, summary.pending_sent, summary.committed_swaps
+
+
+@pytest.mark.parametrize('notify', [True, False])
+def test_deleted_account_leaves_counterparties_their_swaps(app, hostel, notify):
+    hostel(4, prefs_per_user=0, requests_per_user=0)
+    with app.app_context():
+        # 1 owns a swap with 2, asks for 3's room, which is then archived, and leaves one open request to 4
+        assert commit_swap(request(1, '100', 2, '101'), 1) == COMMITTED
+        archived_id = request(3, '102', 1, '101')
+        assert commit_swap(archived_id, 3) == COMMITTED
+        archive.move([archived_id])
+        request(4, '103', 1, '102')
+        inbox.rebuild()
+        before = {user_id: counters(user_id) for user_id in (2, 3)}
+
+        delete_accounts([1], notify=notify)
+        db.session.commit()
+
+        assert db.session.scalars(select(SwapRequest)).all() == []
+        assert {(row.owner_id, row.requester_id) for row in db.session.scalars(select(SwapRequestArchive))} == \
+            {(None, 2), (3, 0)}
+        assert {user_id: counters(user_id) for user_id in (2, 3)} == before
+        assert counters(4) == (0, 0, 0)
+        entries, _ = archive.history_page(2)
+        assert [(e.name, e.from_room, e.to_room) for e in entries] == [(None, '101', '100')]
+        entries, _ = archive.history_page(3)
+        assert [(e.name, e.from_room, e.to_room) for e in entries] == [(None, '102', '101')]
+        inbox.rebuild()
+        assert {user_id: counters(user_id) for user_id in (2, 3)} == before
+
+
+def test_archive_rows_go_once_no_party_is_left(app, hostel):
+    hostel(3, prefs_per_user=0, requests_per_user=0)
+    with app.app_context():
+        req_id = request(1, '100', 2, '101')
+        assert commit_swap(req_id, 1) == COMMITTED
+        delete_accounts([1])
+        db.session.commit()
+        assert db.session.scalar(select(SwapRequestArchive.id)) == req_id
+        delete_accounts([2])
+        db.session.commit()
+        assert db.session.scalars(select(SwapRequestArchive)).all() == []
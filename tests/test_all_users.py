@@ -0,0 +1,31 @@
+from sqlalchemy import event
+
+from models import db
+
+
+def count_statements(app, client, path):
+    """Statements run for one GET of path, after a first GET has warmed the user and its session."""
+    assert client.get(path).status_code == 200
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200
+    return len(statements)
+
+
+def test_all_users_statements_do_not_grow_with_users(app, hostel, login):
+    counts = []
+    # One partial page and a full page of users with preferences and sent requests
+    for users in (10, 200):
+        hostel(users, prefs_per_user=2, requests_per_user=3)
+        counts.append(count_statements(app, login(1), '/all_users'))
+    assert counts[0] == counts[1], counts
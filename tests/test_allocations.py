@@ -0,0 +1,42 @@
+import csv
+import io
+
+import pytest
+
+from allocations import export_table, import_file, import_rooms
+
+STUDENT_FIELDS = ('college_id', 'name', 'email', 'room_number')
+
+
+def export(app, table, fmt='csv'):
+    stream = io.StringIO()
+    with app.app_context():
+        export_table(table, stream, fmt)
+    return stream.getvalue()
+
+
+def students(exported):
+    return sorted(tuple(row[field] for field in STUDENT_FIELDS) for row in csv.DictReader(io.StringIO(exported)))
+
+
+@pytest.mark.parametrize('fmt, suffix', [('csv', '.csv'), ('jsonl', '.jsonl')])
+def test_export_then_import_restores_students_and_rooms(app, hostel, tmp_path, fmt, suffix):
+    hostel(30, requests_per_user=0)
+    users, rooms = tmp_path / f'users{suffix}', tmp_path / f'rooms{suffix}'
+    users.write_text(export(app, 'users', fmt))
+    rooms.write_text(export(app, 'rooms', fmt))
+    before = export(app, 'users'), export(app, 'rooms')
+
+    hostel(0)
+    errors = io.StringIO()
+    with app.app_context():
+        assert import_rooms(str(rooms), errors=errors).inserted == 30
+        report = import_file(str(users), errors=errors, batch_size=7)
+    assert (report.inserted, report.updated, report.failed) == (30, 0, 0), errors.getvalue()
+    assert students(export(app, 'users')) == students(before[0])
+    # Same ids, numbers, floors and occupants
+    assert export(app, 'rooms') == before[1]
+
+    with app.app_context():
+        report = import_file(str(users), errors=errors)
+    assert (report.inserted, report.updated, report.unchanged) == (0, 0, 30)
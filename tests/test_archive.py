@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select
+
+import archive
+import inbox
+from models import db, SwapRequest, SwapRequestArchive
+
+
+def resolved_before(cutoff):
+    return db.session.scalar(select(func.count()).select_from(SwapRequest)
+                             .where(SwapRequest.resolved_at < cutoff, SwapRequest.status != 'pending'))
+
+
+def test_archive_moves_old_requests_in_batches(app, hostel):
+    hostel(200, requests_per_user=3)
+    with app.app_context():
+        cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=180)
+        due, total = resolved_before(cutoff), db.session.scalar(select(func.count()).select_from(SwapRequest))
+        assert due > 50
+        inbox.rebuild()
+        counts = inbox._counts()
+        histories = {user_id: archive.history_page(user_id, per_page=500)[0] for user_id in range(1, 201)}
+
+        assert archive.archive_batch(cutoff, 50) == 50
+        assert archive.archive(180, batch_size=50) == due - 50
+        assert archive.archive(180, batch_size=50) == 0
+
+        assert resolved_before(cutoff) == 0
+        assert db.session.scalar(select(func.count()).select_from(SwapRequestArchive)) == due
+        assert db.session.scalar(select(func.count()).select_from(SwapRequest)) == total - due
+        # Archived swaps still count and still show in history
+        assert inbox._counts() == counts
+        assert {user_id: archive.history_page(user_id, per_page=500)[0] for user_id in range(1, 201)} == histories
@@ -0,0 +1,74 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+import requests
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def server(app, hostel):
+    """asgi:application under uvicorn, on the test database; yields its base URL."""
+    hostel(3, prefs_per_user=0, requests_per_user=0)
+    port = free_port()
+    # Another interpreter: asgi.py has to build the app with SOCKETIO_ASYNC_MODE=asgi
+    proc = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'asgi:application', '--port', str(port),
+                             '--log-level', 'warning'], cwd=ROOT, env=os.environ.copy())
+    base = f'http://127.0.0.1:{port}'
+    try:
+        for _ in range(300):
+            assert proc.poll() is None, 'server exited'
+            try:
+                requests.get(base + '/login', timeout=1)
+                break
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        yield base
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+
+def test_pages_and_sockets_through_asgi_application(app, server):
+    signer = app.session_interface.get_signing_serializer(app)
+    cookie = {user_id: 'session=' + signer.dumps({'_user_id': str(user_id), '_fresh': True}) for user_id in (1, 2)}
+
+    assert requests.get(server + '/login').status_code == 200
+    # An @async_reads view, served on the loop through aiosqlite
+    page = requests.get(server + '/dashboard', headers={'Cookie': cookie[1]}, allow_redirects=False)
+    assert page.status_code == 200 and b'Student 000000' in page.content
+
+    client = socketio.Client(reconnection=False)
+    connected, notified = threading.Event(), []
+    client.on('connected', lambda data: connected.set())
+    client.on('swap_request_notification', notified.append)
+    client.connect(server, headers={'Cookie': cookie[1]}, transports=['websocket'])
+    try:
+        assert connected.wait(10)
+        # A write on the threads, whose notification is handed to the loop
+        sent = requests.post(server + '/send_direct_request/1', headers={'Cookie': cookie[2]},
+                             allow_redirects=False)
+        assert sent.status_code == 302
+        for _ in range(100):
+            if notified:
+                break
+            time.sleep(0.1)
+        assert [n['requester'] for n in notified] == ['Student 000001']
+    finally:
+        client.disconnect()
+
+    anonymous = socketio.Client(reconnection=False)
+    with pytest.raises(socketio.exceptions.ConnectionError):
+        anonymous.connect(server, transports=['websocket'])
@@ -0,0 +1,44 @@
+from flask import g
+from sqlalchemy import func, select
+
+import migrate
+from db_engine import REPLICA_BIND, read_replica
+from factory import create_app
+from models import db, User
+
+
+def count_users():
+    return db.session.scalar(select(func.count()).select_from(User))
+
+
+def test_replica_serves_reads_until_the_request_writes(tmp_path):
+    app = create_app(web=False, SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path / "primary.db"}',
+                     DATABASE_REPLICA_URL=f'sqlite:///{tmp_path / "replica.db"}')
+    with app.app_context():
+        for engine in db.engines.values():
+            migrate.upgrade(engine, log=lambda message: None)
+        # A replica that hasn't caught up with this student yet
+        db.session.add(User(name='Student', college_id='SB000001', password='x', email='s@example.com',
+                            room_number='101'))
+        db.session.commit()
+
+    @read_replica
+    def view():
+        seen = [count_users()]
+        db.session.add(User(name='Other', college_id='SB000002', password='x', email='o@example.com',
+                            room_number='102'))
+        db.session.flush()
+        seen.append(count_users())
+        db.session.commit()
+        return seen
+
+    with app.test_request_context():
+        assert view() == [0, 2]
+        assert not g._db_read_replica
+    with app.test_request_context():
+        assert count_users() == 2
+    with app.app_context():
+        with db.engines[REPLICA_BIND].connect() as replica:
+            assert replica.scalar(select(func.count()).select_from(User)) == 0
+        for engine in db.engines.values():
+            engine.dispose()
@@ -0,0 +1,51 @@
+from directory import decode_cursor, keyset_page, search_users
+from models import User
+
+
+def all_pages(query, per_page):
+    pages, cursor = [], None
+    while True:
+        users, cursor = keyset_page(query, cursor, per_page)
+        pages.append([user.id for user in users])
+        if cursor is None:
+            return pages
+
+
+def test_keyset_pages_cover_every_user_once(app, hostel):
+    hostel(120, requests_per_user=0)
+    with app.app_context():
+        ordered = [user.id for user in User.query.order_by(User.name, User.id)]
+
+        pages = all_pages(User.query, 50)
+        assert [len(page) for page in pages] == [50, 50, 20]
+        assert sum(pages, []) == ordered
+        assert all_pages(User.query, 120) == [ordered]
+        # A cursor that doesn't decode starts over
+        assert decode_cursor('not a cursor') is None
+        assert [user.id for user in keyset_page(User.query, 'not a cursor', 5)[0]] == ordered[:5]
+
+
+def test_search_matches_room_or_name_prefix(app, hostel):
+    hostel(120, requests_per_user=0)
+    with app.app_context():
+        def found(term):
+            return sorted(user.id for user in search_users(User.query, term))
+        assert found('10') == list(range(1, 11))
+        assert found(' 105 ') == [6]
+        assert found('student 00011') == list(range(111, 121))
+        assert found('STUDENT 000007') == [8]
+        assert found('') == list(range(1, 121))
+        assert found('nobody') == []
+
+
+def test_api_users_follows_cursors(hostel, login):
+    hostel(30, requests_per_user=0)
+    client = login(1)
+    seen, after = [], ''
+    while after is not None:
+        page = client.get(f'/api/users?q=1&limit=4&after={after}').get_json()
+        seen += [user['room_number'] for user in page['users']]
+        after = page['next_cursor']
+    # Rooms 101..129 that are looking to swap, but never the caller's own
+    assert '100' not in seen and len(seen) == len(set(seen)) > 4
+    assert all(room.startswith('1') for room in seen)
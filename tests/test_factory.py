@@ -0,0 +1,27 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import feed
+import render_cache
+import room_index
+import user_cache
+from factory import create_app
+from models import db, RoomPreference
+
+
+def test_apps_in_one_process_keep_their_own_commits(app, hostel):
+    hostel(3)
+    other = create_app(web=False)
+    for module in (user_cache, render_cache, room_index, feed):
+        for name, listener in module.SESSION_LISTENERS:
+            assert event.contains(Session, name, listener)
+
+    with app.app_context():
+        assert len(app.extensions['room_index'].ready()) == 3
+    with other.app_context():
+        assert len(other.extensions['room_index'].ready()) == 3
+        db.session.add(RoomPreference(user_id=1, available='100', needed='555'))
+        db.session.commit()
+
+    assert len(other.extensions['room_index'].index) == 4
+    assert len(app.extensions['room_index'].index) == 3
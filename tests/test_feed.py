@@ -0,0 +1,82 @@
+from sqlalchemy import delete, select
+
+from feed import EVENT, changes_since
+from models import db, SwapRequest, SwapRequestChange
+
+
+def requests_to(app, user_id, requester_ids, login):
+    """
+    Each requester sends user_id a direct request; returns {requester_id: request id}.
+
+    Requests are made outside any app context: one that is already pushed would
+    be shared, along with the user it has logged in.
+    """
+    for requester_id in requester_ids:
+        login(requester_id).post(f'/send_direct_request/{user_id}')
+    with app.app_context():
+        return dict(db.session.execute(select(SwapRequest.requester_id, SwapRequest.id)).all())
+
+
+def test_entries_follow_commit_order_and_collapse_per_request(app, hostel, login):
+    hostel(4, prefs_per_user=0, requests_per_user=0)
+    sent = requests_to(app, 1, [2, 3, 4], login)
+    owner = login(1)
+    owner.post(f'/reject_request/{sent[3]}')
+    owner.post(f'/commit_request/{sent[2]}')
+
+    with app.app_context():
+        feed = changes_since(1, 0)
+        assert (feed['from'], feed['seq'], feed['more'], feed['reset']) == (1, 6, False, False)
+        assert [(c['seq'], c['id'], c['list'], c['status']) for c in feed['changes']] == [
+            (4, sent[3], 'invitations', 'rejected'),
+            (5, sent[2], 'invitations', 'committed'),
+            (6, sent[4], 'invitations', 'superseded'),
+        ]
+        assert feed['inbox'] == {'pending_invites': 0, 'pending_sent': 0, 'committed_swaps': 1}
+
+        requester = changes_since(2, 0)
+        assert [(c['seq'], c['list'], c['status'], c['room_number']) for c in requester['changes']] == \
+            [(2, 'my_requests', 'committed', '101')]
+
+
+def test_pages_and_resets(app, hostel, login):
+    hostel(4, prefs_per_user=0, requests_per_user=0)
+    requests_to(app, 1, [2, 3, 4], login)
+    with app.app_context():
+        pages = []
+        since, more = 0, True
+        while more:
+            page = changes_since(1, since, limit=2)
+            pages.append([change['seq'] for change in page['changes']])
+            since, more = page['seq'], page['more']
+        assert pages == [[1, 2], [3]]
+        assert changes_since(1, 3)['changes'] == []
+        assert changes_since(1, 99)['reset']
+
+        # Pruned entries can't be replayed; the client has to reload
+        db.session.execute(delete(SwapRequestChange).where(SwapRequestChange.user_id == 1,
+                                                           SwapRequestChange.seq <= 2))
+        db.session.commit()
+        assert changes_since(1, 0)['reset']
+        assert not changes_since(1, 2)['reset']
+
+
+def test_api_and_push_carry_the_same_entries(app, hostel, login):
+    hostel(3, prefs_per_user=0, requests_per_user=0)
+    socket = app.extensions['socketio'].test_client(app, flask_test_client=login(2))
+    socket.get_received()
+    try:
+        sent = requests_to(app, 1, [2], login)
+        login(1).post(f'/commit_request/{sent[2]}')
+        with app.app_context():
+            expected = changes_since(2, 0)
+
+        pushed = [event['args'][0] for event in socket.get_received() if event['name'] == EVENT]
+        assert [(push['from'], push['seq']) for push in pushed] == [(1, 1), (2, 2)]
+        assert pushed[-1]['changes'] == expected['changes']
+        response = login(2).get('/api/swap_requests/changes?since=0')
+        assert response.status_code == 200
+        assert response.get_json() == expected
+        assert login(2).get('/api/swap_requests/changes?since=1').get_json()['changes'] == expected['changes']
+    finally:
+        socket.disconnect()
@@ -0,0 +1,33 @@
+import pytest
+from sqlalchemy import inspect
+
+from explain_indexes import check_hot_queries
+from models import db
+
+
+def test_hot_queries_use_their_indexes(app, hostel):
+    hostel(2000)
+    with app.app_context(), db.engine.connect() as conn:
+        failed = {name: problems for name, problems, _ in check_hot_queries(conn) if problems}
+        conn.rollback()
+    assert failed == {}
+
+
+@pytest.mark.filterwarnings('ignore:Skipped unsupported reflection of expression-based index')
+def test_no_index_duplicates_another(app, hostel):
+    """Every index is a write cost; one whose leading columns another index or key already covers buys nothing."""
+    hostel(0)
+    with app.app_context():
+        inspector = inspect(db.engine)
+        redundant = []
+        for table in inspector.get_table_names():
+            keys = [tuple(inspector.get_pk_constraint(table)['constrained_columns'])]
+            keys += [tuple(constraint['column_names']) for constraint in inspector.get_unique_constraints(table)]
+            # Partial indexes cover only some rows, so they neither duplicate nor stand in for another
+            indexes = {index['name']: tuple(index['column_names']) for index in inspector.get_indexes(table)
+                       if index['dialect_options'].get('sqlite_where') is None}
+            for name, columns in indexes.items():
+                others = keys + [other for other_name, other in indexes.items() if other_name != name]
+                if any(other[:len(columns)] == columns for other in others):
+                    redundant.append(f'{table}.{name} {columns}')
+    assert redundant == []
@@ -0,0 +1,128 @@
+import smtplib
+from datetime import timedelta
+
+import pytest
+from flask_mail import Mail
+
+from mail_queue import MailDispatcher, RecipientRateLimiter, _utcnow, enqueue_mail
+from models import db, OutboxMessage
+
+
+class StubSMTP:
+    """Stands in for smtplib.SMTP; connections fail while `down` is set, recipients while `refused` is."""
+
+    down = False
+    refused = False
+    sent = []
+
+    def __init__(self, host, port):
+        if StubSMTP.down:
+            raise ConnectionRefusedError('connection refused')
+
+    def set_debuglevel(self, level):
+        pass
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        pass
+
+    def sendmail(self, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+        if StubSMTP.refused:
+            raise smtplib.SMTPRecipientsRefused({to: (550, b'mailbox unavailable') for to in to_addrs})
+        StubSMTP.sent.append((from_addr, list(to_addrs), msg))
+
+    def quit(self):
+        pass
+
+
+@pytest.fixture
+def dispatcher(app, hostel, monkeypatch):
+    hostel(0)
+    StubSMTP.down, StubSMTP.refused, StubSMTP.sent = False, False, []
+    monkeypatch.setattr(smtplib, 'SMTP', StubSMTP)
+    # TESTING would otherwise make Flask-Mail skip the connection entirely
+    monkeypatch.setitem(app.config, 'MAIL_SUPPRESS_SEND', False)
+    monkeypatch.setitem(app.extensions, 'mail', None)
+    return MailDispatcher(app, Mail(app))
+
+
+def queue_one(app):
+    with app.app_context():
+        return enqueue_mail('student@example.com', 'Swap request', 'Someone wants your room.',
+                            sender='hostel@example.com').id
+
+
+def test_sends_due_messages(app, dispatcher):
+    message_id = queue_one(app)
+    assert dispatcher.process_batch() == 1
+    [(sender, recipients, body)] = StubSMTP.sent
+    assert (sender, recipients) == ('hostel@example.com', ['student@example.com'])
+    assert b'Someone wants your room.' in body
+    with app.app_context():
+        message = db.session.get(OutboxMessage, message_id)
+        assert (message.status, message.attempts) == ('sent', 1)
+    assert dispatcher.process_batch() == 0
+
+
+def test_retries_with_backoff_then_gives_up(app, dispatcher):
+    message_id = queue_one(app)
+    StubSMTP.down = True
+    for attempt in range(1, dispatcher.max_attempts + 1):
+        started = _utcnow()
+        assert dispatcher.process_batch() == 0
+        with app.app_context():
+            message = db.session.get(OutboxMessage, message_id)
+            assert message.attempts == attempt
+            assert 'connection refused' in message.last_error
+            if attempt < dispatcher.max_attempts:
+                assert message.status == 'pending'
+                delay = message.next_attempt_at - started
+                expected = timedelta(seconds=dispatcher.backoff * 2 ** (attempt - 1))
+                assert expected <= delay < expected + timedelta(seconds=5)
+                # Due again now, instead of waiting out the backoff
+                message.next_attempt_at = _utcnow()
+                db.session.commit()
+            else:
+                assert message.status == 'failed'
+    assert StubSMTP.sent == []
+    assert dispatcher.process_batch() == 0
+
+
+def test_failed_sends_leave_the_recipient_limit_alone(app, dispatcher):
+    dispatcher.rate_limiter = RecipientRateLimiter(1)
+    message_id = queue_one(app)
+    StubSMTP.refused = True
+    assert dispatcher.process_batch() == 0
+    StubSMTP.refused = False
+    with app.app_context():
+        db.session.get(OutboxMessage, message_id).next_attempt_at = _utcnow()
+        db.session.commit()
+    assert dispatcher.process_batch() == 1
+
+    # That one did go through, so the next waits out the hour
+    message_id = queue_one(app)
+    assert dispatcher.process_batch() == 0
+    with app.app_context():
+        message = db.session.get(OutboxMessage, message_id)
+        assert (message.status, message.attempts) == ('pending', 0)
+        assert message.next_attempt_at > _utcnow() + timedelta(minutes=59)
+
+
+def test_worker_logs_errors_and_keeps_polling(app, dispatcher, monkeypatch, caplog):
+    class Stop(Exception):
+        pass
+
+    def fail():
+        raise RuntimeError('database is down')
+
+    def stop(timeout):
+        raise Stop
+
+    monkeypatch.setattr(dispatcher, 'process_batch', fail)
+    monkeypatch.setattr(dispatcher._wakeup, 'wait', stop)
+    with pytest.raises(Stop):
+        dispatcher.run()
+    [record] = [r for r in caplog.records if r.name == 'mail_queue']
+    assert record.getMessage() == 'Mail worker error' and 'database is down' in record.exc_text
@@ -0,0 +1,28 @@
+import pytest
+
+import inbox
+from archive import history_page
+from matching import run_matching
+from models import db, User
+
+
+@pytest.mark.parametrize('rooms', [['101', '202'], ['101', '202', '303']])
+def test_rotation_records_each_move_once(app, hostel, rotation, rooms):
+    hostel(0)
+    with app.app_context():
+        user_ids = rotation(rooms)
+        _, committed = run_matching()
+        assert len(committed) == 1
+
+        names = {user.id: user.name for user in User.query}
+        live = {user_id: inbox.get_summary(user_id).committed_swaps for user_id in user_ids}
+        for index, user_id in enumerate(user_ids):
+            giver_id = user_ids[(index + 1) % len(user_ids)]
+            assert db.session.get(User, user_id).room_number == rooms[(index + 1) % len(rooms)]
+            entries, _ = history_page(user_id)
+            assert [(entry.name, entry.from_room, entry.to_room) for entry in entries] == \
+                [(names[giver_id], rooms[index], rooms[(index + 1) % len(rooms)])]
+            assert live[user_id] == 1
+
+        inbox.rebuild()
+        assert {user_id: inbox.get_summary(user_id).committed_swaps for user_id in user_ids} == live
@@ -0,0 +1,20 @@
+import pytest
+
+
+@pytest.mark.parametrize('path', ['/metrics', '/metrics/slow_queries', '/stats/user_cache'])
+def test_metrics_without_token_only_answer_this_host(app, path):
+    client = app.test_client()
+    assert client.get(path).status_code == 200
+    assert client.get(path, environ_base={'REMOTE_ADDR': '10.0.0.7'}).status_code == 403
+    # Through a proxy on this host
+    assert client.get(path, headers={'X-Forwarded-For': '203.0.113.9'}).status_code == 403
+
+
+@pytest.mark.parametrize('path', ['/metrics', '/metrics/slow_queries', '/stats/user_cache'])
+def test_metrics_token_is_required_when_set(app, monkeypatch, path):
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 'scrape-me')
+    client = app.test_client()
+    assert client.get(path).status_code == 403
+    assert client.get(path, headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    assert client.get(path, headers={'Authorization': 'Bearer scrape-me'},
+                      environ_base={'REMOTE_ADDR': '10.0.0.7'}).status_code == 200
@@ -0,0 +1,95 @@
+import sqlalchemy as sa
+from sqlalchemy import delete, select, text
+
+import inbox
+import migrate
+from matching import run_matching
+from models import db, Room, InboxSummary, RoomPreference, SwapRequest
+
+
+def migration(version):
+    return next(m for m in migrate.discover() if m.version == version).module
+
+
+def summaries():
+    return {row.user_id: (row.pending_invites, row.pending_sent, row.committed_swaps)
+            for row in db.session.scalars(select(InboxSummary))}
+
+
+def test_inbox_backfill_matches_rebuild(app, hostel, rotation):
+    hostel(50, requests_per_user=3)
+    with app.app_context():
+        rotation(['901', '902', '903'])
+        run_matching()
+        inbox.rebuild()
+        rebuilt = summaries()
+        db.session.execute(delete(InboxSummary))
+        db.session.commit()
+        with db.engine.begin() as conn:
+            migration(4).upgrade(migrate.Operations(conn))
+        assert summaries() == rebuilt
+
+
+def test_dedupe_recount_matches_rebuild(app, hostel, rotation):
+    hostel(0)
+    with app.app_context():
+        first, second, _ = rotation(['901', '902', '903'])
+        run_matching()
+        # Duplicates as they were before 0006 made pending requests unique
+        pref_id = db.session.scalar(select(RoomPreference.id).where(RoomPreference.user_id == second))
+        db.session.execute(text('DROP INDEX uq_swap_requests_pending'))
+        db.session.execute(SwapRequest.__table__.insert(), [
+            {'preference_id': pref_id, 'requester_id': first, 'status': 'pending'} for _ in range(2)
+        ])
+        db.session.commit()
+        inbox.rebuild()
+        with db.engine.begin() as conn:
+            migration(5).upgrade(migrate.Operations(conn))
+        db.session.expire_all()
+        recounted = summaries()
+        inbox.rebuild()
+        assert recounted == summaries()
+        assert recounted[first][1] == 1
+
+
+def test_rooms_backfill_parses_floor_needs(app, hostel):
+    hostel(1, prefs_per_user=0, requests_per_user=0)
+    typed = ['floor 2', 'FLOOR3', 'Floor  12', '101', 'Any', 'FLOORS']
+    with app.app_context():
+        db.session.execute(RoomPreference.__table__.insert(), [
+            {'user_id': 1, 'available': '100', 'needed': needed, 'selected': False} for needed in typed
+        ])
+        db.session.commit()
+        with db.engine.begin() as conn:
+            migration(10).upgrade(migrate.Operations(conn))
+        room_101 = db.session.scalar(select(Room.id).where(Room.number == '101'))
+        rows = db.session.execute(
+            select(RoomPreference.needed, RoomPreference.needed_floor, RoomPreference.needed_room_id)
+            .order_by(RoomPreference.id)
+        ).all()
+        assert [tuple(row) for row in rows] == [
+            ('FLOOR 2', 2, None), ('FLOOR 3', 3, None), ('FLOOR 12', 12, None),
+            ('101', None, room_101), ('ANY', None, None), ('FLOORS', None, None),
+        ]
+
+
+def test_upgrade_applies_each_migration_once(tmp_path):
+    engine = sa.create_engine(f'sqlite:///{tmp_path / "fresh.db"}')
+    versions = [m.version for m in migrate.discover()]
+    logged = []
+
+    assert [m.version for m in migrate.upgrade(engine, target=5, log=logged.append)] == versions[:5]
+    assert sorted(migrate.applied_versions(engine)) == versions[:5]
+    assert migrate.upgrade(engine, target=5, log=logged.append) == []
+    assert [m.version for m in migrate.upgrade(engine, log=logged.append)] == versions[5:]
+    assert migrate.upgrade(engine, log=logged.append) == []
+    assert logged == [f'Applying {m.version:04d} {m.name}' for m in migrate.discover()]
+
+    applied = migrate.applied_versions(engine)
+    assert {version: row.name for version, row in applied.items()} == {m.version: m.name for m in migrate.discover()}
+    assert set(db.metadata.tables) <= set(sa.inspect(engine).get_table_names())
+    # Every step checks before it changes anything, so re-running one is harmless
+    for m in migrate.discover():
+        with engine.begin() as conn:
+            m.module.upgrade(migrate.Operations(conn))
+    engine.dispose()
@@ -0,0 +1,49 @@
+import pytest
+
+
+@pytest.fixture
+def sockets(app, login):
+    """sockets(user_id) connects a Socket.IO test client as that user."""
+    socketio = app.extensions['socketio']
+    clients = []
+
+    def connect(user_id):
+        client = socketio.test_client(app, flask_test_client=login(user_id))
+        clients.append(client)
+        return client
+    yield connect
+    for client in clients:
+        if client.is_connected():
+            client.disconnect()
+
+
+def events(client, name):
+    return [event['args'][0] for event in client.get_received() if event['name'] == name]
+
+
+def test_new_preference_reaches_the_floor_holding_the_wanted_room(hostel, login, sockets):
+    hostel(3, prefs_per_user=0, requests_per_user=0)
+    poster, neighbour = sockets(1), sockets(2)
+    neighbour.emit('subscribe_floor', {})
+    poster.get_received(), neighbour.get_received()
+
+    login(1).post('/dashboard', data={'available': '100', 'needed': '101'})
+    assert [update['needed'] for update in events(neighbour, 'preference_update')] == ['101']
+
+    login(1).post('/dashboard', data={'available': '100', 'needed': 'FLOOR 2'})
+    assert events(neighbour, 'preference_update') == []
+
+
+def test_clients_cannot_push_notifications_to_other_users(hostel, login, sockets):
+    hostel(3, prefs_per_user=0, requests_per_user=0)
+    sender, target, bystander = sockets(1), sockets(2), sockets(3)
+    target.get_received(), bystander.get_received()
+
+    sender.emit('request_sent', {'to_user_id': 2, 'available': '100', 'needed': '999'})
+    sender.emit('new_preference', {'available': '100', 'needed': '101'})
+    assert target.get_received() == []
+
+    login(1).post('/send_direct_request/2')
+    notified = events(target, 'swap_request_notification')
+    assert [(n['available'], n['needed']) for n in notified] == [('100', '101')]
+    assert events(bystander, 'swap_request_notification') == []
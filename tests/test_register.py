@@ -0,0 +1,19 @@
+from credentials import HasherBusy
+from models import User
+
+
+def test_register_busy_hasher_asks_to_retry(app, hostel, monkeypatch):
+    hostel(0)
+
+    def busy(password):
+        raise HasherBusy()
+
+    monkeypatch.setattr(app.extensions['password_hasher'], 'hash', busy)
+    response = app.test_client().post('/register', data={
+        'name': 'New Student', 'college_id': 'SB123456', 'email': 'new@example.com',
+        'room_number': '101', 'password': 'secret-password',
+    })
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '2'
+    with app.app_context():
+        assert User.query.count() == 0
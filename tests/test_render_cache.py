@@ -0,0 +1,22 @@
+import time
+
+from render_cache import MemoryVersions, PageCache, RenderCache
+
+
+def test_memory_etags_expire_after_ttl(app, hostel, login, monkeypatch):
+    hostel(5)
+    monkeypatch.setitem(app.extensions, 'render_cache', RenderCache(MemoryVersions(ttl=60), PageCache(ttl=60)))
+    now = [time.time() // 60 * 60]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    client = login(1)
+
+    first = client.get('/my_requests')
+    assert first.status_code == 200 and first.headers['ETag']
+    now[0] += 59
+    assert client.get('/my_requests', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    # Writes by other workers or scripts never reach these counters; the ETag still has to change
+    now[0] += 1
+    second = client.get('/my_requests', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.headers['ETag'] != first.headers['ETag']
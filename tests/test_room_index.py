@@ -0,0 +1,73 @@
+from room_index import LiveRoomIndex, RoomIndex
+
+# (preference id, owner, available, needed); user 1 holds 101
+PREFERENCES = [
+    (10, 2, '202', '101'),        # offers what 1 needs, needs 1's room
+    (11, 3, '202', 'floor 1'),    # needs 1's floor
+    (12, 4, '205', '101'),        # offers a room on a floor 1 will take
+    (13, 5, '202', 'ANY'),
+    (14, 6, '202', '303'),        # needs someone else's room
+    (15, 1, '101', '202'),
+    (16, 1, '101', 'FLOOR 2'),
+]
+
+
+def index_of(preferences=PREFERENCES):
+    index = RoomIndex()
+    for preference in preferences:
+        index.add(*preference)
+    return index
+
+
+def test_scores_exact_floor_and_any_matches():
+    index = index_of()
+    # Best score first, then newest
+    assert index.rank(1, '101') == [(10, 4), (13, 3), (12, 3), (11, 3)]
+    assert index.rank(1, '101', limit=2) == [(10, 4), (13, 3)]
+    # Someone who takes any room still needs a candidate who wants theirs
+    index.add(17, 7, '303', 'any')
+    assert index.rank(7, '303') == [(14, 3)]
+    assert index.rank(8, '404') == []
+
+
+def test_term_keeps_candidates_offering_matching_rooms():
+    index = index_of()
+    assert index.rank(1, '101', term='205') == [(12, 3)]
+    assert index.rank(1, '101', term=' 20') == [(10, 4), (13, 3), (12, 3), (11, 3)]
+    assert index.rank(1, '101', term='3') == []
+
+
+def test_removed_slots_are_reused():
+    index = index_of()
+    slot = index._slots[10]
+    index.remove(10)
+    index.remove(10)
+    assert 10 not in dict(index.rank(1, '101'))
+    assert len(index) == len(PREFERENCES) - 1
+
+    index.add(20, 9, '202', '101')
+    assert index._slots[20] == slot
+    assert index.rank(1, '101')[0] == (20, 4)
+    # Re-adding a preference replaces it
+    index.add(20, 9, '202', '999')
+    assert 20 not in dict(index.rank(1, '101'))
+    assert len(index) == len(PREFERENCES)
+
+
+def test_rebuild_replays_commits_made_while_loading(app, monkeypatch):
+    live = LiveRoomIndex(app, max_age=0)
+    live.index = index_of()
+
+    def load():
+        snapshot = index_of()
+        # Committed after the snapshot was read, before it replaces the old index
+        live.apply([('remove', (10,)), ('add', (21, 9, '202', '101'))])
+        return snapshot
+    monkeypatch.setattr(live, '_load', load)
+    live.rebuild()
+
+    assert live.rebuilds == 1
+    assert live.rank(1, '101')[0] == (21, 4)
+    assert 10 not in dict(live.rank(1, '101'))
+    live.apply([('remove', (21,))])
+    assert live._missed is None and 21 not in dict(live.rank(1, '101'))
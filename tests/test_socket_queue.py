@@ -0,0 +1,48 @@
+import json
+import queue
+import uuid
+
+import pytest
+import socketio as python_socketio
+
+from factory import create_app
+from socket_queue import LoopbackManager, async_client_manager, external_socketio, socketio_options
+
+
+def test_options_follow_the_queue_setting():
+    assert socketio_options({}) == {}
+    assert socketio_options({'SOCKETIO_MESSAGE_QUEUE': 'redis://cache:6379/0', 'SOCKETIO_CHANNEL': 'rooms',
+                             'SOCKETIO_TRANSPORTS': ['websocket']}) == \
+        {'message_queue': 'redis://cache:6379/0', 'channel': 'rooms', 'transports': ['websocket']}
+    manager = socketio_options({'SOCKETIO_MESSAGE_QUEUE': 'loopback://', 'SOCKETIO_CHANNEL': 'rooms'})['client_manager']
+    assert isinstance(manager, LoopbackManager) and manager.channel == 'rooms'
+
+
+def test_scripts_only_emit_through_a_queue():
+    assert external_socketio({}) is None
+    script = external_socketio({'SOCKETIO_MESSAGE_QUEUE': 'loopback://'})
+    assert script.server_options['client_manager'].write_only
+
+
+def test_asgi_managers():
+    assert async_client_manager({}) is None
+    with pytest.raises(ValueError):
+        async_client_manager({'SOCKETIO_MESSAGE_QUEUE': 'loopback://'})
+    manager = async_client_manager({'SOCKETIO_MESSAGE_QUEUE': 'redis://cache:6379/0', 'SOCKETIO_CHANNEL': 'rooms'})
+    assert isinstance(manager, python_socketio.AsyncRedisManager) and manager.channel == 'rooms'
+
+
+def test_script_emits_reach_the_workers_channel_over_loopback():
+    channel = f'test-{uuid.uuid4()}'
+    settings = {'SOCKETIO_MESSAGE_QUEUE': 'loopback://', 'SOCKETIO_CHANNEL': channel}
+    script = create_app(web=False, **settings)
+    # Where a worker's manager subscribes once its server starts
+    inbox = queue.Queue()
+    LoopbackManager._subscribers[channel].append(inbox)
+    try:
+        script.extensions['swap_feed'].socketio.emit('announcement', {'text': 'hello'}, to='user:1')
+        message = json.loads(inbox.get(timeout=5))
+    finally:
+        del LoopbackManager._subscribers[channel]
+    assert (message['method'], message['event'], message['data'], message['room']) == \
+        ('emit', 'announcement', [{'text': 'hello'}], 'user:1')
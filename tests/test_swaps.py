@@ -0,0 +1,77 @@
+from sqlalchemy import select, update
+
+import inbox
+from models import db, User, RoomPreference, SwapRequest
+from swaps import commit_swap, COMMITTED, FORBIDDEN, NOT_PENDING, STALE
+
+
+def request(owner_id, owner_room, requester_id, requester_room):
+    pref = db.session.scalar(select(RoomPreference).where(RoomPreference.user_id == owner_id))
+    if pref is None:
+        pref = RoomPreference(user_id=owner_id, available=owner_room, needed='ANY')
+        db.session.add(pref)
+        db.session.flush()
+    req = SwapRequest(preference_id=pref.id, requester_id=requester_id, status='pending',
+                      from_room_number=requester_room, to_room_number=owner_room)
+    db.session.add(req)
+    db.session.flush()
+    inbox.record_transition(owner_id, requester_id, None, 'pending', req.id)
+    db.session.commit()
+    return req.id
+
+
+def status(req_id):
+    return db.session.scalar(select(SwapRequest.status).where(SwapRequest.id == req_id))
+
+
+def rooms():
+    return dict(db.session.execute(select(User.id, User.room_number)).all())
+
+
+def counters(user_id):
+    summary = inbox.get_summary(user_id)
+    return summary.pending_invites, summary.pending_sent, summary.committed_swaps
+
+
+def test_commit_moves_both_users_and_supersedes_competing_requests(app, hostel):
+    hostel(4, prefs_per_user=0, requests_per_user=0)
+    with app.app_context():
+        req_id = request(1, '100', 2, '101')
+        competing = request(1, '100', 3, '102')
+        elsewhere = request(4, '103', 2, '101')
+        unrelated = request(4, '103', 3, '102')
+
+        assert commit_swap(req_id, 1) == COMMITTED
+        assert rooms() == {1: '101', 2: '100', 3: '102', 4: '103'}
+        assert (status(req_id), status(competing), status(elsewhere), status(unrelated)) == \
+            (COMMITTED, 'superseded', 'superseded', 'pending')
+        assert [counters(user_id) for user_id in (1, 2, 3, 4)] == \
+            [(0, 0, 1), (0, 0, 1), (0, 1, 0), (1, 0, 0)]
+        live = {user_id: counters(user_id) for user_id in (1, 2, 3, 4)}
+        inbox.rebuild()
+        assert {user_id: counters(user_id) for user_id in (1, 2, 3, 4)} == live
+
+
+def test_a_request_commits_once(app, hostel):
+    hostel(2, prefs_per_user=0, requests_per_user=0)
+    with app.app_context():
+        req_id = request(1, '100', 2, '101')
+        assert commit_swap(req_id, 2) == FORBIDDEN
+        assert commit_swap(req_id, 1) == COMMITTED
+        assert commit_swap(req_id, 1) == NOT_PENDING
+        assert rooms() == {1: '101', 2: '100'}
+        assert counters(1) == counters(2) == (0, 0, 1)
+
+
+def test_request_for_a_room_that_has_moved_is_stale(app, hostel):
+    hostel(2, prefs_per_user=0, requests_per_user=0)
+    with app.app_context():
+        req_id = request(1, '100', 2, '101')
+        db.session.execute(update(User).where(User.id == 1).values(room_number='150'))
+        db.session.commit()
+
+        assert commit_swap(req_id, 1) == STALE
+        assert status(req_id) == 'superseded'
+        assert rooms() == {1: '150', 2: '101'}
+        assert counters(1) == counters(2) == (0, 0, 0)
+        assert commit_swap(req_id, 1) == NOT_PENDING
@@ -0,0 +1,84 @@
+import threading
+
+from flask import make_response
+from sqlalchemy import func, select
+
+import app as views
+from models import db, SwapRequest
+from throttle import Coalescer
+
+
+class WatchedCalls(dict):
+    """The coalescer's in-flight table, noting when a second caller finds a call under way."""
+
+    def __init__(self):
+        super().__init__()
+        self.joined = threading.Event()
+
+    def get(self, key, default=None):
+        call = super().get(key, default)
+        if call is not None:
+            self.joined.set()
+        return call
+
+
+def test_concurrent_identical_submissions_write_once(app, hostel, login, monkeypatch):
+    hostel(2, prefs_per_user=0, requests_per_user=0)
+    coalescer = app.extensions['coalescer']
+    inflight = WatchedCalls()
+    monkeypatch.setattr(coalescer, '_inflight', inflight)
+    notify_user = views.notify_user
+
+    def notify_once_followed(*args):
+        # The first submission holds its run open until the second one waits on it
+        assert inflight.joined.wait(5)
+        notify_user(*args)
+    monkeypatch.setattr(views, 'notify_user', notify_once_followed)
+
+    responses = {}
+
+    def submit(name):
+        responses[name] = login(1).post('/send_direct_request/2')
+    first = threading.Thread(target=submit, args=('first',))
+    first.start()
+    while not inflight:
+        pass
+    submit('second')
+    first.join()
+
+    with app.app_context():
+        assert db.session.scalar(select(func.count()).select_from(SwapRequest)) == 1
+    assert coalescer.coalesced == 1
+    assert responses['first'].status_code == responses['second'].status_code == 302
+    assert responses['first'].location == responses['second'].location
+
+
+def test_replay_leaves_out_the_first_callers_headers(app):
+    coalescer = Coalescer()
+    coalescer._inflight = inflight = WatchedCalls()
+
+    def view():
+        assert inflight.joined.wait(5)
+        response = make_response('Request sent')
+        response.set_cookie('remember_token', 'first-caller')
+        response.set_etag('v1')
+        response.headers['Content-Language'] = 'en'
+        return response
+
+    responses = {}
+
+    def call(name):
+        with app.test_request_context('/send_direct_request/2', method='POST'):
+            responses[name] = coalescer.run('key', view)
+    first = threading.Thread(target=call, args=('first',))
+    first.start()
+    while not inflight:
+        pass
+    call('second')
+    first.join()
+
+    assert coalescer.coalesced == 1
+    replayed = responses['second']
+    assert replayed.get_data() == b'Request sent'
+    assert 'Set-Cookie' not in replayed.headers and 'ETag' not in replayed.headers
+    assert replayed.headers['Content-Language'] == 'en'
@@ -0,0 +1,58 @@
+import pytest
+from sqlalchemy import select
+
+from models import db, RoomPreference, SwapRequest, User
+from swaps import commit_swap, COMMITTED
+from user_cache import MemoryBackend, UserCache
+
+
+@pytest.fixture
+def cache(app, monkeypatch):
+    cache = UserCache(MemoryBackend())
+    monkeypatch.setitem(app.extensions, 'user_cache', cache)
+    return cache
+
+
+def room_of(cache, user_id):
+    user = cache.load(user_id)
+    room = user.room_number
+    db.session.remove()
+    return room
+
+
+def test_commits_invalidate_cached_users(app, hostel, cache):
+    hostel(2, prefs_per_user=0, requests_per_user=0)
+    with app.app_context():
+        assert room_of(cache, 1) == '100' and room_of(cache, 1) == '100'
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        # An ORM write
+        db.session.get(User, 1).name = 'Renamed'
+        db.session.commit()
+        assert cache.load(1).name == 'Renamed'
+        db.session.remove()
+        assert (cache.misses, cache.invalidations) == (2, 1)
+
+        # A Core write reported with mark_changed
+        pref = RoomPreference(user_id=1, available='100', needed='101')
+        db.session.add(pref)
+        db.session.flush()
+        req = SwapRequest(preference_id=pref.id, requester_id=2, status='pending',
+                          from_room_number='101', to_room_number='100')
+        db.session.add(req)
+        db.session.commit()
+        assert commit_swap(req.id, 1) == COMMITTED
+        db.session.remove()
+        assert room_of(cache, 1) == '101'
+
+
+def test_rolled_back_changes_keep_the_entry(app, hostel, cache):
+    hostel(1, prefs_per_user=0, requests_per_user=0)
+    with app.app_context():
+        room_of(cache, 1)
+        db.session.get(User, 1).room_number = '999'
+        db.session.flush()
+        db.session.rollback()
+        assert cache.invalidations == 0
+        assert room_of(cache, 1) == '100'
+        assert db.session.scalar(select(User.room_number).where(User.id == 1)) == '100'
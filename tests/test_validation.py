@@ -0,0 +1,28 @@
+import pytest
+
+from validation import Need, floor_of, parse_need
+
+
+@pytest.mark.parametrize('value, need', [
+    ('214', Need('214', '214', None)),
+    (' 214 ', Need('214', '214', None)),
+    ('any', Need('ANY', None, None)),
+    ('FLOOR 2', Need('FLOOR 2', None, 2)),
+    ('floor2', Need('FLOOR 2', None, 2)),
+    ('Floor   02', Need('FLOOR 2', None, 2)),
+    ('FLOOR 12', Need('FLOOR 12', None, 12)),
+    ('', None),
+    (None, None),
+    ('21', None),
+    ('2144', None),
+    ('FLOOR', None),
+    ('FLOOR 123', None),
+    ('ANYWHERE', None),
+])
+def test_parse_need(value, need):
+    assert parse_need(value) == need
+
+
+@pytest.mark.parametrize('room_number, floor', [('214', 2), (' 907', 9), ('21', None), ('ANY', None), (None, None)])
+def test_floor_of(room_number, floor):
+    assert floor_of(room_number) == floor
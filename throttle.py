@@ -0,0 +1,258 @@
+"""
+Rate limiting and request coalescing for the write endpoints.
+
+@rate_limit(rule) charges one token from a bucket per (rule, user) and per
+(rule, client IP). Each bucket holds up to N tokens and refills evenly over
+its period, so "30/minute" allows a burst of 30 and then one every two
+seconds. An empty bucket gets a 429 with Retry-After. Rates come from the
+RATE_LIMIT_* settings in config.py; RATE_LIMIT_BACKEND selects the store:
+
+    memory             per-process buckets (default)
+    redis://host/db    shared between workers, updated atomically in Redis
+    none               disable rate limiting
+
+@coalesce collapses identical concurrent requests (same user, endpoint,
+arguments and form) into one: the first runs the view, and the others wait
+for it and replay its response and flashed messages instead of repeating
+the work. A double-clicked "Request" button therefore creates one swap
+request and shows the same result twice. Cookies and other headers tied
+to the first response are not replayed. Coalescing is per process; across
+workers the unique constraints still prevent duplicates.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import wraps
+
+from flask import Response, current_app, flash, jsonify, request, session
+from flask_login import current_user
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+# rule -> ((scope, config key), ...); the 'user' scope is skipped for anonymous requests
+RULES = {
+    'writes': (('user', 'RATE_LIMIT_WRITES_PER_USER'), ('ip', 'RATE_LIMIT_WRITES_PER_IP')),
+    'password_reset': (('ip', 'RATE_LIMIT_PASSWORD_RESET_PER_IP'),),
+}
+
+
+class Rate:
+    def __init__(self, count, period):
+        self.capacity = count
+        self.period = period
+        self.per_second = count / period
+
+    @classmethod
+    def parse(cls, text):
+        """'30/minute' -> Rate(30, 60)."""
+        count, _, period = text.partition('/')
+        if period not in PERIODS:
+            raise ValueError(f'rate {text!r} must look like 30/minute (second, minute, hour or day)')
+        return cls(int(count), PERIODS[period])
+
+
+class MemoryBackend:
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate):
+        """Spend a token from key's bucket; returns seconds to wait, 0 if allowed."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (rate.capacity, now))
+            tokens = min(rate.capacity, tokens + (now - updated) * rate.per_second)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate.per_second
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+# Same arithmetic as MemoryBackend.take, atomic in Redis and timed by the Redis clock
+TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local per_second = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - updated) * per_second)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / per_second
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / per_second * 1000))
+return tostring(wait)
+"""
+
+
+class RedisBackend:
+    def __init__(self, url, prefix='ratelimit:'):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(TAKE_SCRIPT)
+
+    def take(self, key, rate):
+        return float(self._take(keys=[self.prefix + key], args=[rate.capacity, rate.per_second]))
+
+
+class RateLimited(Exception):
+    def __init__(self, rule, scope, retry_after):
+        super().__init__(f'{rule} limit reached for {scope}')
+        self.rule = rule
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    def __init__(self, backend, rates, proxy_hops=0):
+        self.backend = backend
+        self.rates = rates
+        self.proxy_hops = proxy_hops
+        self.rejected = defaultdict(int)
+
+    def client_ip(self):
+        # With N trusted proxies in front, the client is the Nth address from the right
+        route = request.access_route if self.proxy_hops else [request.remote_addr]
+        return route[-self.proxy_hops] if len(route) >= self.proxy_hops > 0 else route[0]
+
+    def hit(self, rule):
+        """Charge the current request against rule; raises RateLimited when a bucket is empty."""
+        if self.backend is None:
+            return
+        for scope, rate in self.rates[rule]:
+            if scope == 'user':
+                if not current_user.is_authenticated:
+                    continue
+                identity = str(current_user.id)
+            else:
+                identity = self.client_ip()
+            wait = self.backend.take(f'{rule}:{scope}:{identity}', rate)
+            if wait:
+                self.rejected[(rule, scope)] += 1
+                raise RateLimited(rule, scope, wait)
+
+    def stats(self):
+        return {f'rule="{rule}",scope="{scope}"': count for (rule, scope), count in self.rejected.items()}
+
+
+# Headers that belong to the first caller's response only; a follower's own session cookie is set when it saves
+UNSHARED_HEADERS = frozenset({'set-cookie', 'vary', 'etag', 'last-modified', 'date'})
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class Coalescer:
+    def __init__(self, wait_seconds=10):
+        self.wait_seconds = wait_seconds
+        self.coalesced = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, view):
+        """Run view() once for concurrent callers with the same key; returns a Response."""
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+        if not leader:
+            if call.done.wait(self.wait_seconds) and call.result is not None:
+                with self._lock:
+                    self.coalesced += 1
+                return _replay(call.result)
+            # The first request failed or is stuck; do the work ourselves
+            return current_app.make_response(view())
+        try:
+            flashed = len(session.get('_flashes', []))
+            response = current_app.make_response(view())
+            if not response.is_streamed:
+                call.result = (session.get('_flashes', [])[flashed:], response.get_data(),
+                               response.status_code, [(name, value) for name, value in response.headers
+                                                      if name.lower() not in UNSHARED_HEADERS])
+            return response
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.done.set()
+
+
+def _replay(result):
+    flashes, body, status, headers = result
+    for category, message in flashes:
+        flash(message, category)
+    return Response(body, status, headers)
+
+
+def rate_limit(rule, methods=('POST',)):
+    """Apply the named rule from RULES to a view, for the given HTTP methods only."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method in methods:
+                current_app.extensions['rate_limiter'].hit(rule)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def coalesce(methods=('POST',)):
+    """Let concurrent identical requests, for the given HTTP methods, share one run of a view."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in methods:
+                return view(*args, **kwargs)
+            if current_user.is_authenticated:
+                identity = current_user.id
+            else:
+                identity = current_app.extensions['rate_limiter'].client_ip()
+            key = (identity, request.method, request.endpoint, tuple(sorted(kwargs.items())),
+                   tuple(sorted(request.args.items(multi=True))), tuple(sorted(request.form.items(multi=True))))
+            return current_app.extensions['coalescer'].run(key, lambda: view(*args, **kwargs))
+        return wrapper
+    return decorator
+
+
+def _make_backend(config):
+    kind = config.get('RATE_LIMIT_BACKEND', 'memory')
+    if not kind or kind == 'none':
+        return None
+    if kind.startswith(('redis://', 'rediss://')):
+        return RedisBackend(kind)
+    return MemoryBackend()
+
+
+def init_throttle(app):
+    rates = {rule: tuple((scope, Rate.parse(app.config[setting])) for scope, setting in scopes)
+             for rule, scopes in RULES.items()}
+    limiter = RateLimiter(_make_backend(app.config), rates, app.config.get('RATE_LIMIT_PROXY_HOPS', 0))
+    app.extensions['rate_limiter'] = limiter
+    app.extensions['coalescer'] = Coalescer()
+
+    @app.errorhandler(RateLimited)
+    def too_many_requests(error):
+        retry_after = str(math.ceil(error.retry_after))
+        message = 'Too many requests, please slow down.'
+        body = jsonify(error=message) if request.path.startswith('/api/') else message
+        return body, 429, {'Retry-After': retry_after}
+
+    return limiter
@@ -0,0 +1,179 @@
+"""
+Identity cache for the Flask-Login user loader.
+
+load_user() runs on every authenticated request and Socket.IO handshake.
+Caching a snapshot of the user's columns lets it re-attach the row to the
+session without a SELECT. Any flush that changes or deletes a User
+invalidates its entry once the transaction commits, so every write path
+(edit_profile, toggle_swap_availability, commit_request, delete_account,
+the matching engine, ...) is covered without explicit calls.
+
+USER_CACHE_BACKEND selects the store:
+    memory             per-process TTL/LRU (default)
+    redis://host/db    shared between workers
+    none               disable caching
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from models import db, User
+
+# Columns kept in the cache; the password stays in the database only
+CACHED_COLUMNS = ('id', 'college_id', 'name', 'email', 'room_number', 'room_id', 'is_looking_to_swap')
+
+
+class MemoryBackend:
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class RedisBackend:
+    def __init__(self, url, ttl=300, prefix='user:'):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + str(key))
+        return json.loads(raw) if raw else None
+
+    def set(self, key, value):
+        self.client.setex(self.prefix + str(key), self.ttl, json.dumps(value))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + str(key))
+
+
+class UserCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def load(self, user_id):
+        """Return a session-attached User for user_id, or None if it doesn't exist."""
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        if self.backend is None:
+            return db.session.get(User, user_id)
+
+        snapshot = self.backend.get(user_id)
+        if snapshot is None:
+            self.misses += 1
+            user = db.session.get(User, user_id)
+            if user is not None:
+                self.backend.set(user_id, {c: getattr(user, c) for c in CACHED_COLUMNS})
+            return user
+
+        self.hits += 1
+        existing = db.session.identity_map.get(db.session.identity_key(User, user_id))
+        if existing is not None:
+            return existing
+        user = User(**snapshot)
+        # Turn the snapshot into a clean persistent row; uncached columns load on access
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    def invalidate(self, user_id):
+        if self.backend is not None:
+            self.invalidations += 1
+            self.backend.delete(int(user_id))
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__ if self.backend else None,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def mark_changed(session, user_ids):
+    """Invalidate users on commit after changing them with a bulk/Core UPDATE."""
+    session.info.setdefault('changed_user_ids', set()).update(user_ids)
+
+
+def _make_backend(config):
+    kind = config.get('USER_CACHE_BACKEND', 'memory')
+    ttl = config.get('USER_CACHE_TTL', 300)
+    if not kind or kind == 'none':
+        return None
+    if kind.startswith(('redis://', 'rediss://')):
+        return RedisBackend(kind, ttl)
+    return MemoryBackend(config.get('USER_CACHE_MAX_ENTRIES', 10000), ttl)
+
+
+def _collect_changed_users(session, flush_context):
+    changed = session.info.setdefault('changed_user_ids', set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User) and obj.id is not None:
+            changed.add(obj.id)
+
+
+def _invalidate_changed_users(session):
+    changed = session.info.pop('changed_user_ids', ())
+    cache = current_app.extensions.get('user_cache') if has_app_context() else None
+    if cache is not None:
+        for user_id in changed:
+            cache.invalidate(user_id)
+
+
+def _forget_changed_users(session):
+    session.info.pop('changed_user_ids', None)
+
+
+SESSION_LISTENERS = (
+    ('after_flush', _collect_changed_users),
+    ('after_commit', _invalidate_changed_users),
+    ('after_rollback', _forget_changed_users),
+)
+
+
+def init_user_cache(app):
+    cache = UserCache(_make_backend(app.config))
+    app.extensions['user_cache'] = cache
+    # Once per process: every Session gets them, and a commit invalidates the current app's cache
+    for name, listener in SESSION_LISTENERS:
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
+    return cache
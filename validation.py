@@ -0,0 +1,51 @@
+"""
+Field rules shared by /register, the dashboard and the bulk importers
+(allocations.py, rooms.py).
+"""
+
+import re
+from collections import namedtuple
+
+COLLEGE_ID_PATTERN = re.compile(r'^[A-Z]{2}[0-9]{6}$')
+ROOM_NUMBER_PATTERN = re.compile(r'^\d{3}$')
+FLOOR_NEED_PATTERN = re.compile(r'^FLOOR ?(\d{1,2})$')
+WILDCARD_ROOM = 'ANY'
+
+COLLEGE_ID_ERROR = ('Invalid college ID. Enter in format: 2 capital letters followed by 6 digits '
+                    '(e.g., RO200000).')
+ROOM_NUMBER_ERROR = 'Invalid room number. Room number should have exactly 3 digits.'
+NEED_ERROR = 'Enter the room you need (3 digits), a floor (e.g. FLOOR 2) or ANY.'
+
+# What a preference's `needed` asks for: its normalized label, and a room number or a floor (neither for ANY)
+Need = namedtuple('Need', 'label room floor')
+
+
+def normalize_college_id(value):
+    return (value or '').strip().upper()
+
+
+def college_id_error(college_id):
+    return None if COLLEGE_ID_PATTERN.match(college_id) else COLLEGE_ID_ERROR
+
+
+def room_number_error(room_number):
+    return None if ROOM_NUMBER_PATTERN.match(room_number) else ROOM_NUMBER_ERROR
+
+
+def floor_of(room_number):
+    """Floor of a three-digit room number (its first digit), else None."""
+    room_number = (room_number or '').strip()
+    return int(room_number[0]) if ROOM_NUMBER_PATTERN.match(room_number) else None
+
+
+def parse_need(value):
+    """The Need a `needed` value stands for, or None if it is neither a room, a floor nor ANY."""
+    value = ' '.join((value or '').upper().split())
+    if value == WILDCARD_ROOM:
+        return Need(WILDCARD_ROOM, None, None)
+    floor = FLOOR_NEED_PATTERN.match(value)
+    if floor:
+        return Need(f'FLOOR {int(floor.group(1))}', None, int(floor.group(1)))
+    if ROOM_NUMBER_PATTERN.match(value):
+        return Need(value, value, None)
+    return None